@@ -0,0 +1,61 @@
+"""
+Накладные расходы аутентификации на запрос: simplejwt JWTAuthentication
+против CachedJWTAuthentication (тёплый кэш) и stateless-режима для GET.
+Печатает время authenticate() и число SQL-запросов на запрос.
+
+    python -m benchmarks.bench_auth --requests 5000
+"""
+import argparse
+import json
+
+from benchmarks.common import bearer, make_user, setup_django, summary, timed
+
+
+def measure(auth, requests):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    auth.authenticate(requests[0])  # прогрев: первый запрос кладёт токен в кэш
+    latencies = []
+    with CaptureQueriesContext(connection) as ctx:
+        for request in requests:
+            dt, result = timed(auth.authenticate, request)
+            assert result is not None
+            latencies.append(dt)
+    return {"auth": summary(latencies), "queries_per_request": round(len(ctx.captured_queries) / len(requests), 3)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=5000)
+    args = ap.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test import RequestFactory
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+
+    from docs import authentication
+
+    user = make_user()
+    header = bearer(user)
+    factory = RequestFactory()
+    gets = [factory.get("/api/documents/", HTTP_AUTHORIZATION=header) for _ in range(args.requests)]
+    posts = [factory.post("/api/ai/", HTTP_AUTHORIZATION=header) for _ in range(args.requests)]
+
+    result = {"requests": args.requests, "simplejwt": measure(JWTAuthentication(), posts)}
+    authentication.reset()
+    result["cached"] = measure(authentication.CachedJWTAuthentication(), posts)
+
+    settings.AUTH_CACHE = {**getattr(settings, "AUTH_CACHE", {}), "STATELESS_READS": True, "TTL": 0.000001}
+    authentication.reset()
+    # кэш фактически выключен, чтобы измерить сам stateless-путь: подпись есть, БД нет
+    result["stateless_get"] = measure(authentication.CachedJWTAuthentication(), gets)
+    base = result["simplejwt"]["auth"]["mean_ms"]
+    for name in ("cached", "stateless_get"):
+        result[name]["speedup"] = round(base / result[name]["auth"]["mean_ms"], 1)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Большие документы: строкой (content_html целиком) против блочного
+хранения (docs/blocks.py).
+
+Первая отрисовка — сколько байт и времени до первой порции содержимого:
+строкой — GET /documents/{id}/ целиком; блоками — GET ?content=0 и первая
+страница GET blocks/. Сохранение — PATCH /content/ с правкой одного абзаца:
+полное время запроса (вместе с версией и поиском, они одинаковы в обоих
+режимах) и отдельно запись самого документа — байты SQL и время
+UPDATE/INSERT в docs_document и docs_documentblock.
+
+    python -m benchmarks.bench_blocks --pages 200 --saves 30
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks.common import make_user, setup_django, summary
+
+WORDS = ["проект", "требование", "срок", "модуль", "отчёт", "система", "данные", "план"]
+
+
+def make_pages(pages, page_size, rnd):
+    result = []
+    for i in range(pages):
+        parts = [f"<h2>Раздел {i + 1}</h2>"]
+        total = len(parts[0])
+        while total < page_size:
+            p = "<p>" + " ".join(rnd.choice(WORDS) for _ in range(20)) + "</p>"
+            parts.append(p)
+            total += len(p)
+        parts.append('<div class="page-break"></div>')
+        result.append(parts)
+    return result
+
+
+def run_mode(client, user, pages, args, rnd):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from docs.models import Document
+
+    html = "".join("".join(p) for p in pages)
+    doc = Document.objects.create(owner=user, title="Большой документ", content_html=html)
+    report = {"chunked": doc.chunked, "blocks": doc.blocks.count()}
+
+    t0 = time.perf_counter()
+    if doc.chunked:
+        meta = client.get(f"/api/documents/{doc.pk}/?content=0")
+        first = client.get(f"/api/documents/{doc.pk}/blocks/")
+        payload = len(meta.content) + len(first.content)
+    else:
+        payload = len(client.get(f"/api/documents/{doc.pk}/").content)
+    report["first_paint"] = {"bytes": payload, "ms": round((time.perf_counter() - t0) * 1000, 2)}
+
+    latencies, write_bytes, write_time = [], 0, 0.0
+    revision = 0
+    for i in range(args.saves):
+        n = rnd.randrange(len(pages))
+        page = pages[n]
+        k = rnd.randrange(1, len(page) - 1)
+        before = sum(len(x) for p in pages[:n] for x in p) + sum(len(x) for x in page[:k])
+        at = before + len(page[k]) - len("</p>")
+        text = f" правка{i}"
+        page[k] = page[k][:-len("</p>")] + text + "</p>"
+        body = {"base_revision": revision, "ops": [{"op": "insert", "at": at, "text": text}]}
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            resp = client.patch(f"/api/documents/{doc.pk}/content/", body, format="json")
+            latencies.append(time.perf_counter() - t0)
+        assert resp.status_code == 200, resp.content
+        revision = resp.json()["revision"]
+        for q in ctx.captured_queries:
+            sql = q["sql"]
+            if sql.startswith(("UPDATE", "INSERT")) and ('"docs_document"' in sql or '"docs_documentblock"' in sql):
+                write_bytes += len(sql.encode("utf-8"))
+                write_time += float(q["time"])
+    doc = Document.objects.get(pk=doc.pk)
+    assert doc.content_html == "".join("".join(p) for p in pages)
+    report["save"] = {
+        "request": summary(latencies),
+        "document_write_bytes_per_save": write_bytes // max(1, args.saves),
+        "document_write_ms_per_save": round(write_time * 1000 / max(1, args.saves), 3),
+    }
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=200)
+    ap.add_argument("--page-size", type=int, default=8000, help="символов HTML на страницу")
+    ap.add_argument("--saves", type=int, default=30)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test import override_settings
+    from rest_framework.test import APIClient
+
+    settings.DOCS_VERSION_RETENTION = {"INTERVAL": 0}
+    settings.DEBUG = True  # время запросов в CaptureQueriesContext
+    user = make_user()
+    client = APIClient()
+    client.force_authenticate(user)
+
+    report = {"pages": args.pages, "saves": args.saves, "modes": {}}
+    for mode, threshold in (("inline", None), ("blocks", 1)):
+        rnd = random.Random(args.seed)
+        pages = make_pages(args.pages, args.page_size, rnd)
+        report["doc_size"] = sum(len(x) for p in pages for x in p)
+        with override_settings(DOCS_BLOCKS={"THRESHOLD": threshold}):
+            report["modes"][mode] = run_mode(client, user, pages, args, rnd)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Контекст для AI: старые срезы html[:1000] / html[-1000:] против разделов
+с бюджетом токенов (docs.ai_context). Размер промпта и время сборки
+(первый раз и из кэша разделов).
+
+    python -m benchmarks.bench_context --sections 300 --iterations 50
+"""
+import argparse
+import json
+import random
+
+from benchmarks.common import setup_django, summary, timed
+
+
+def make_html(sections, rnd):
+    words = ["проект", "требование", "срок", "модуль", "отчёт", "система", "данные", "план", "бюджет", "риск"]
+    parts = []
+    for i in range(sections):
+        parts.append(f'<h2 class="title" id="s{i}">Раздел {i} {rnd.choice(words)}</h2>')
+        for _ in range(rnd.randint(2, 6)):
+            parts.append('<p style="margin:0">' + " ".join(rnd.choice(words) for _ in range(40)) + "</p>")
+    return "\n".join(parts)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sections", type=int, default=300)
+    ap.add_argument("--iterations", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    setup_django()
+    from docs import ai_context
+    from docs.search import html_to_text
+
+    rnd = random.Random(args.seed)
+    html = make_html(args.sections, rnd)
+    prompts = ["распиши риски проекта", "добавь бюджет", "продолжи", "план отчёта"]
+
+    result = {"doc_chars": len(html), "modes": {}}
+    for mode, legacy in (("continue", html[-1000:]), ("outline", html[:1000])):
+        cold, warm, sizes = [], [], []
+        for i in range(args.iterations):
+            prompt = prompts[i % len(prompts)]
+            ai_context._sections_cache.clear()
+            dt, ctx = timed(ai_context.build_context, mode, html, prompt)
+            cold.append(dt)
+            dt, ctx = timed(ai_context.build_context, mode, html, prompt)
+            warm.append(dt)
+            sizes.append(len(ctx))
+        result["modes"][mode] = {
+            "legacy": {
+                "chars": len(legacy),
+                "tokens": ai_context.estimate_tokens(legacy),
+                "markup_share": round(1 - len(html_to_text(legacy)) / len(legacy), 3),
+            },
+            "sections": {
+                "chars": max(sizes),
+                "tokens": ai_context.estimate_tokens(ctx),
+                "build_cold": summary(cold),
+                "build_cached": summary(warm),
+            },
+        }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
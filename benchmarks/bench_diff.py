@@ -0,0 +1,102 @@
+"""
+Сравнение версий большого документа с длинной историей: сравнение на
+сервере (docs/diffing.py) против построчного difflib по тем же единицам.
+
+Для каждой пары соседних версий и пар через step версий — время diff()
+и difflib.SequenceMatcher(...).get_opcodes() (без уточнения по словам),
+затем GET versions/{a}/diff/{b}/ первый раз (восстановление версий +
+сравнение) и повторно (из кэша).
+
+    python -m benchmarks.bench_diff --paragraphs 3000 --versions 60
+"""
+import argparse
+import json
+import random
+from difflib import SequenceMatcher
+
+from benchmarks.common import make_user, setup_django, summary, timed
+
+WORDS = ["проект", "требование", "срок", "модуль", "отчёт", "система", "данные", "план"]
+
+
+def paragraph(rnd):
+    return "<p>" + " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(10, 40))) + "</p>"
+
+
+def make_history(args, rnd):
+    paras = [paragraph(rnd) for _ in range(args.paragraphs)]
+    history = ["".join(paras)]
+    for _ in range(args.versions - 1):
+        for _ in range(args.edits):
+            i = rnd.randrange(len(paras))
+            kind = rnd.random()
+            if kind < 0.6:
+                paras[i] = paras[i][:-len("</p>")] + " " + rnd.choice(WORDS) + "</p>"
+            elif kind < 0.8:
+                paras.insert(i, paragraph(rnd))
+            elif len(paras) > 1:
+                paras.pop(i)
+        history.append("".join(paras))
+    return history
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--paragraphs", type=int, default=3000)
+    ap.add_argument("--versions", type=int, default=60)
+    ap.add_argument("--edits", type=int, default=5, help="правок между соседними версиями")
+    ap.add_argument("--step", type=int, default=10, help="дальние пары: через столько версий")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from rest_framework.test import APIClient
+
+    from docs import diffing
+    from docs.models import Document
+    from docs.versioning import create_version
+
+    settings.DOCS_VERSION_RETENTION = {"INTERVAL": 0}
+    rnd = random.Random(args.seed)
+    history = make_history(args, rnd)
+    pairs = [(i, i + 1) for i in range(len(history) - 1)]
+    pairs += [(i, i + args.step) for i in range(0, len(history) - args.step, args.step)]
+
+    t_ours, t_difflib = [], []
+    for i, j in pairs:
+        a, b = diffing.units(history[i]), diffing.units(history[j])
+        t, _ = timed(diffing.diff, history[i], history[j])
+        t_ours.append(t)
+        t, _ = timed(lambda: SequenceMatcher(None, a, b, autojunk=False).get_opcodes())
+        t_difflib.append(t)
+
+    user = make_user()
+    client = APIClient()
+    client.force_authenticate(user)
+    doc = Document.objects.create(owner=user, title="История", content_html=history[-1])
+    ids = [create_version(doc, html, f"v{n + 1}").pk for n, html in enumerate(history)]
+    cold, warm = [], []
+    for i, j in pairs:
+        url = f"/api/documents/{doc.pk}/versions/{ids[i]}/diff/{ids[j]}/"
+        t, resp = timed(client.get, url)
+        assert resp.status_code == 200, resp.content
+        cold.append(t)
+        t, _ = timed(client.get, url)
+        warm.append(t)
+
+    report = {
+        "doc_size": len(history[-1]),
+        "units": len(diffing.units(history[-1])),
+        "versions": len(history),
+        "pairs": len(pairs),
+        "diff": summary(t_ours),
+        "difflib_units_only": summary(t_difflib),
+        "endpoint_uncached": summary(cold),
+        "endpoint_cached": summary(warm),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
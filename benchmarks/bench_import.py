@@ -0,0 +1,68 @@
+"""
+Импорт архива: по документу на запрос (как import_html) против
+docs.importing.bulk_import пачками. Результат — документов в секунду.
+
+    python -m benchmarks.bench_import --docs 2000 --batch-size 200
+"""
+import argparse
+import io
+import json
+import random
+import time
+
+from benchmarks.common import make_user, setup_django
+
+
+def make_ndjson(count, rnd):
+    words = ["проект", "требование", "срок", "модуль", "отчёт", "система", "данные", "план"]
+    lines = []
+    for i in range(count):
+        body = "".join(
+            "<p>" + " ".join(rnd.choice(words) for _ in range(30)) + "</p>" for _ in range(rnd.randint(3, 15))
+        )
+        lines.append(json.dumps({"title": f"Документ {i}", "content_html": body}, ensure_ascii=False))
+    return "\n".join(lines).encode("utf-8")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=2000)
+    ap.add_argument("--batch-size", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    setup_django()
+    from docs.importing import bulk_import, iter_ndjson
+    from docs.models import Document
+    from docs.search import index_document
+    from docs.versioning import create_version
+
+    data = make_ndjson(args.docs, random.Random(args.seed))
+
+    # старый путь: по два INSERT (+ индекс) на документ
+    owner = make_user("legacy")
+    started = time.perf_counter()
+    for item in iter_ndjson(io.BytesIO(data)):
+        doc = Document.objects.create(owner=owner, title=item.title, content_html=item.content_html)
+        create_version(doc, doc.content_html, "v1")
+        index_document(doc)
+    legacy = time.perf_counter() - started
+
+    owner = make_user("bulk")
+    started = time.perf_counter()
+    report = bulk_import(owner, iter_ndjson(io.BytesIO(data)), batch_size=args.batch_size)
+    bulk = time.perf_counter() - started
+    assert report.created == args.docs, report.errors[:3]
+
+    print(json.dumps({
+        "docs": args.docs,
+        "input_bytes": len(data),
+        "batch_size": args.batch_size,
+        "legacy": {"seconds": round(legacy, 3), "docs_per_sec": round(args.docs / legacy, 1)},
+        "bulk": {"seconds": round(bulk, 3), "docs_per_sec": round(args.docs / bulk, 1)},
+        "speedup": round(legacy / bulk, 2),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Поиск: старый путь title/content_html__icontains против FTS-индекса (docs.search).
+
+    python -m benchmarks.bench_search --docs 10000
+    python -m benchmarks.bench_search --docs 100000 --queries 20
+"""
+import argparse
+import json
+import random
+
+from benchmarks.common import make_user, setup_django, summary, timed
+
+WORDS = (
+    "проект требование срок модуль отчёт система данные план интеграция сервис "
+    "пользователь доступ безопасность релиз тестирование аналитика бюджет метрика "
+    "дорожная карта архитектура хранилище клиент продукт стратегия регламент"
+).split()
+
+
+def make_html(rnd, paragraphs):
+    return "".join(
+        f"<p class=\"p{i}\">" + " ".join(rnd.choice(WORDS) for _ in range(30)) + "</p>"
+        for i in range(paragraphs)
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=10_000)
+    ap.add_argument("--paragraphs", type=int, default=8)
+    ap.add_argument("--queries", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    setup_django()
+    from django.db.models import Q
+
+    from docs.models import Document
+    from docs.search import SqliteFTSBackend
+
+    rnd = random.Random(args.seed)
+    owner = make_user()
+    backend = SqliteFTSBackend()
+    batch = []
+    for i in range(args.docs):
+        batch.append(Document(owner=owner, title=f"Документ {i} {rnd.choice(WORDS)}", content_html=make_html(rnd, args.paragraphs)))
+        if len(batch) == 1000:
+            backend.index_documents(Document.objects.bulk_create(batch))
+            batch = []
+    if batch:
+        backend.index_documents(Document.objects.bulk_create(batch))
+
+    queries = [rnd.choice(WORDS) + " " + rnd.choice(WORDS) for _ in range(args.queries)]
+    icontains_lat, fts_lat = [], []
+    for q in queries:
+        def legacy():
+            qs = Document.objects.filter(owner=owner, is_deleted=False)
+            qs = qs.filter(Q(title__icontains=q) | Q(content_html__icontains=q))
+            return list(qs.defer("content_html")[:50])
+
+        dt, _ = timed(legacy)
+        icontains_lat.append(dt)
+        dt, _ = timed(backend.search, owner.id, q, 50)
+        fts_lat.append(dt)
+
+    print(json.dumps({
+        "docs": args.docs,
+        "queries": len(queries),
+        "icontains": summary(icontains_lat),
+        "fts5": summary(fts_lat),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Статика главной страницы: до и после сборки docs/assets.py.
+
+before — как под DEBUG в runserver: app.js и style.css без хэша, без
+сжатия, из исходников (ASGIStaticFilesHandler); повторный визит
+ревалидирует каждый файл (If-Modified-Since → 304). after — collectstatic с CompressedManifestStorage
+и отдача StaticFiles: минифицированные копии с хэшем, gzip (br при
+установленном brotli), immutable — повторный визит статику не запрашивает.
+
+Запросы идут в ASGI-приложение в том же процессе. Байты — тела ответов
+(заголовки не считаются). Time-to-interactive — модель сети: страница,
+затем её статика параллельно, каждый шаг — RTT + время сервера + байты по
+каналу; разбор и выполнение скриптов не учитываются.
+
+    python -m benchmarks.bench_static --rtt-ms 150 --bandwidth-kbps 1600
+"""
+import argparse
+import asyncio
+import json
+import re
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import asgi_request, setup_django, summary
+
+ASSET_RE = re.compile(r'(?:src|href)="(/static/[^"]+)"')
+
+
+def transfer_s(size, args):
+    return size * 8 / (args.bandwidth_kbps * 1000)
+
+
+async def visit(app, cache, args):
+    """Один заход на главную; cache — кэш браузера {url: validators, fresh} от прошлых визитов."""
+    page = await asgi_request(app, "GET", "/", headers={"accept-encoding": "gzip, br"})
+    assert page["status"] == 200, page["status"]
+    tti = args.rtt_ms / 1000 + page["total"] + transfer_s(len(page["body"]), args)
+    total_bytes, requests, slowest = len(page["body"]), 1, 0.0
+    for url in ASSET_RE.findall(page["body"].decode()):
+        headers = {"accept-encoding": "gzip, br"}
+        cached = cache.get(url)
+        if cached and cached["fresh"]:
+            continue  # immutable: из кэша браузера без запроса
+        if cached:
+            headers.update(cached["validators"])
+        resp = await asgi_request(app, "GET", url, headers=headers)
+        assert resp["status"] in (200, 304), (url, resp["status"])
+        requests += 1
+        total_bytes += len(resp["body"])
+        slowest = max(slowest, args.rtt_ms / 1000 + resp["total"] + transfer_s(len(resp["body"]), args))
+        if resp["status"] == 200:
+            got = {k.lower(): v for k, v in resp["headers"].items()}
+            validators = {}
+            if "etag" in got:
+                validators["if-none-match"] = got["etag"]
+            if "last-modified" in got:
+                validators["if-modified-since"] = got["last-modified"]
+            fresh = "immutable" in got.get("cache-control", "")
+            cache[url] = {"validators": validators, "fresh": fresh}
+    return {"bytes": total_bytes, "requests": requests, "tti_s": tti + slowest, "server_s": page["total"]}
+
+
+async def run_mode(app, args):
+    first, repeat = [], []
+    for _ in range(args.runs):
+        cache = {}
+        first.append(await visit(app, cache, args))
+        repeat.append(await visit(app, cache, args))
+
+    def report(visits):
+        return {
+            "bytes": visits[-1]["bytes"],
+            "requests": visits[-1]["requests"],
+            "tti_model": summary([v["tti_s"] for v in visits]),
+        }
+
+    return {"first_visit": report(first), "repeat_visit": report(repeat)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rtt-ms", type=float, default=150.0)
+    ap.add_argument("--bandwidth-kbps", type=float, default=1600.0, help="пропускная способность канала")
+    ap.add_argument("--runs", type=int, default=20)
+    args = ap.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+    from django.core.management import call_command
+    from django.test import override_settings
+
+    from minidocs.asgi import application
+
+    plain = {**settings.STORAGES, "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}}
+    report = {"rtt_ms": args.rtt_ms, "bandwidth_kbps": args.bandwidth_kbps, "modes": {}}
+    with override_settings(DEBUG=True, STORAGES=plain, STATIC_ASSETS={"SERVE": False}):
+        report["modes"]["before"] = asyncio.run(run_mode(ASGIStaticFilesHandler(application), args))
+    with tempfile.TemporaryDirectory() as tmp:
+        with override_settings(DEBUG=False, STATIC_ROOT=Path(tmp), STATIC_ASSETS={"SERVE": True}):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            report["modes"]["after"] = asyncio.run(run_mode(application, args))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
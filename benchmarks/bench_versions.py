@@ -0,0 +1,92 @@
+"""
+Сравнение хранения версий: полный HTML на каждую правку против
+ключевых кадров + дельт (docs.versioning).
+
+    python -m benchmarks.bench_versions --size 200000 --edits 200
+"""
+import argparse
+import json
+import random
+
+from benchmarks.common import make_user, setup_django, summary, timed
+
+
+def make_html(size, rnd):
+    words = ["проект", "требование", "срок", "модуль", "отчёт", "система", "данные", "план"]
+    parts, total = [], 0
+    while total < size:
+        p = "<p>" + " ".join(rnd.choice(words) for _ in range(20)) + "</p>\n"
+        parts.append(p)
+        total += len(p)
+    return parts
+
+
+def edit(parts, rnd):
+    i = rnd.randrange(len(parts))
+    parts[i] = parts[i].replace("</p>", f" правка{rnd.randrange(10**6)}</p>")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", type=int, default=200_000, help="размер документа, символов")
+    ap.add_argument("--edits", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    setup_django()
+    from django.db import connection
+
+    from docs.models import Document
+    from docs.versioning import create_version
+
+    rnd = random.Random(args.seed)
+    parts = make_html(args.size, rnd)
+    owner = make_user()
+
+    # старый путь: полный HTML в каждой строке (пишем в отдельную таблицу напрямую)
+    with connection.cursor() as c:
+        c.execute("CREATE TABLE bench_full (id INTEGER PRIMARY KEY, document_id INT, content_html TEXT)")
+    legacy_lat, legacy_bytes = [], 0
+    snapshots = []
+    for _ in range(args.edits):
+        edit(parts, rnd)
+        html = "".join(parts)
+        snapshots.append(html)
+        with connection.cursor() as c:
+            dt, _ = timed(c.execute, "INSERT INTO bench_full (document_id, content_html) VALUES (1, %s)", [html])
+        legacy_lat.append(dt)
+        legacy_bytes += len(html.encode("utf-8"))
+
+    doc = Document.objects.create(owner=owner, title="bench", content_html=snapshots[0])
+    store_lat, store_bytes, versions = [], 0, []
+    for i, html in enumerate(snapshots):
+        dt, v = timed(create_version, doc, html, f"v{i + 1}")
+        store_lat.append(dt)
+        store_bytes += len(v.data)
+        versions.append(v.pk)
+
+    # проверка восстановления + время чтения
+    from docs.models import DocumentVersion
+    read_lat = []
+    for pk, html in zip(versions, snapshots):
+        v = DocumentVersion.objects.get(pk=pk)
+        dt, content = timed(lambda: v.content_html)
+        assert content == html
+        read_lat.append(dt)
+
+    print(json.dumps({
+        "doc_size": len(snapshots[-1]),
+        "edits": args.edits,
+        "legacy": {"bytes": legacy_bytes, "write": summary(legacy_lat)},
+        "delta_store": {
+            "bytes": store_bytes,
+            "keyframes": DocumentVersion.objects.filter(document=doc, kind="full").count(),
+            "write": summary(store_lat),
+            "read": summary(read_lat),
+        },
+        "bytes_ratio": round(store_bytes / legacy_bytes, 4),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
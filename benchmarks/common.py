@@ -0,0 +1,119 @@
+"""
+Общая обвязка для бенчмарков: настраивает Django и поднимает
+тестовую БД (в памяти), чтобы не трогать db.sqlite3.
+
+    python -m benchmarks.bench_versions
+"""
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "minidocs.settings")
+
+
+def setup_django(db_path=None):
+    """
+    Тестовая БД: по умолчанию в памяти. db_path — файл SQLite: нужен, когда
+    запросы пишут параллельно из разных потоков (у БД в памяти общий кэш
+    с табличными блокировками вместо ожидания занятой БД).
+    """
+    import django
+
+    django.setup()
+    from django.conf import settings
+    from django.db import connection
+
+    if db_path:
+        settings.DATABASES["default"].setdefault("TEST", {})["NAME"] = str(db_path)
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+
+def make_user(username="bench"):
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    user, _ = User.objects.get_or_create(username=username)
+    return user
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - t0, result
+
+
+def summary(samples):
+    """Сводка по выборке латентностей (секунды → миллисекунды)."""
+    ms = sorted(s * 1000 for s in samples)
+    if not ms:
+        return {}
+
+    def pct(p):
+        return round(ms[min(len(ms) - 1, int(len(ms) * p))], 3)
+
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+def bearer(user):
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    return f"Bearer {RefreshToken.for_user(user).access_token}"
+
+
+async def asgi_request(app, method, path, body=b"", headers=None, query=b""):
+    """
+    Один запрос к ASGI-приложению в том же процессе, без сетевого сервера.
+    Возвращает dict: status, body, headers, writes (число body-сообщений),
+    ttfb и total (секунды).
+    """
+    import asyncio
+
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    raw_headers.append((b"content-length", str(len(body)).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query, "root_path": "", "headers": raw_headers,
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    done = asyncio.Event()
+    sent_body = False
+    result = {"status": None, "body": b"", "headers": {}, "writes": 0}
+    t0 = time.perf_counter()
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+            result["headers"] = {k.decode(): v.decode() for k, v in message.get("headers", [])}
+        elif message["type"] == "http.response.body":
+            if message.get("body") and "ttfb" not in result:
+                result["ttfb"] = time.perf_counter() - t0
+            result["body"] += message.get("body", b"")
+            result["writes"] += 1
+            if not message.get("more_body"):
+                done.set()
+
+    await app(scope, receive, send)
+    done.set()
+    result["total"] = time.perf_counter() - t0
+    result.setdefault("ttfb", result["total"])
+    return result
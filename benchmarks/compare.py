@@ -0,0 +1,60 @@
+"""
+Сравнение двух отчётов benchmarks.run: пропускная способность и
+p50/p95/p99 по сценариям, изменение в процентах.
+
+    python -m benchmarks.compare results/before.json results/after.json
+    python -m benchmarks.compare before.json after.json --json
+"""
+import argparse
+import json
+
+METRICS = [("rps", lambda s: s.get("rps"))] + [
+    (p, lambda s, p=p: (s.get("latency") or {}).get(f"{p}_ms")) for p in ("p50", "p95", "p99")
+]
+
+
+def _change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return round((after - before) / before * 100, 1)
+
+
+def compare(before, after) -> dict:
+    result = {}
+    for name, b in before["scenarios"].items():
+        a = after["scenarios"].get(name)
+        if a is None:
+            continue
+        result[name] = {
+            metric: {"before": get(b), "after": get(a), "change_pct": _change(get(b), get(a))}
+            for metric, get in METRICS
+        }
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("before")
+    ap.add_argument("after")
+    ap.add_argument("--json", action="store_true", help="вывести JSON вместо таблицы")
+    args = ap.parse_args()
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    result = compare(before, after)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    commits = [(r["meta"].get("commit") or "?")[:10] for r in (before, after)]
+    print(f"{'scenario':<14}{'metric':<8}{commits[0]:>14}{commits[1]:>14}{'change':>10}")
+    for name, metrics in result.items():
+        for metric, row in metrics.items():
+            change = "" if row["change_pct"] is None else f"{row['change_pct']:+.1f}%"
+            print(f"{name:<14}{metric:<8}{row['before']!s:>14}{row['after']!s:>14}{change:>10}")
+
+
+if __name__ == "__main__":
+    main()
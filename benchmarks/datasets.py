@@ -0,0 +1,94 @@
+"""
+Воспроизводимые наборы данных для бенчмарков: пользователи, документы
+заданного размера и документы с глубокой историей версий. Одинаковый
+seed — одинаковые данные, поэтому прогоны на разных коммитах сравнимы.
+
+    from benchmarks.datasets import seed
+    data = seed(users=4, docs=500, doc_size=20_000, history_docs=10, history=200)
+"""
+import random
+
+WORDS = (
+    "проект требование срок модуль отчёт система данные план интеграция сервис "
+    "пользователь доступ безопасность релиз тестирование аналитика бюджет метрика "
+    "дорожная карта архитектура хранилище клиент продукт стратегия регламент"
+).split()
+
+
+def make_paragraphs(rnd, size):
+    """Абзацы HTML общим размером не меньше size символов."""
+    parts, total = [], 0
+    while total < size:
+        p = "<p>" + " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(15, 40))) + "</p>\n"
+        parts.append(p)
+        total += len(p)
+    return parts
+
+
+def make_html(rnd, size):
+    parts = make_paragraphs(rnd, size)
+    return f"<h1>{rnd.choice(WORDS).capitalize()}</h1>\n" + "".join(parts)
+
+
+def edit(parts, rnd):
+    """Небольшая правка случайного абзаца, как при автосохранении."""
+    i = rnd.randrange(len(parts))
+    parts[i] = parts[i].replace("</p>", f" правка{rnd.randrange(10**6)}</p>")
+
+
+class Dataset:
+    def __init__(self):
+        self.users = []         # [(user, bearer)]
+        self.documents = {}     # user.pk -> [doc id]
+        self.history = []       # id документов с глубокой историей
+        self.words = WORDS
+
+    def as_dict(self):
+        return {
+            "users": len(self.users),
+            "documents": sum(len(ids) for ids in self.documents.values()),
+            "history_documents": len(self.history),
+        }
+
+
+def seed(users=4, docs=200, doc_size=10_000, history_docs=5, history=100, seed=1) -> Dataset:
+    """
+    Заполняет БД: users пользователей по docs документов размером около
+    doc_size символов; у первых history_docs документов каждого — ещё по
+    history правок с версиями (ключевые кадры + дельты, как в приложении).
+    """
+    from django.contrib.auth import get_user_model
+    from django.test import override_settings
+
+    from benchmarks.common import bearer
+    from docs.models import Document
+    from docs.search import get_backend
+    from docs.versioning import create_version
+
+    User = get_user_model()
+    rnd = random.Random(seed)
+    search = get_backend()
+    data = Dataset()
+    for u in range(users):
+        user, _ = User.objects.get_or_create(username=f"bench{u}")
+        data.users.append((user, bearer(user)))
+        batch = [
+            Document(owner=user, title=f"{rnd.choice(WORDS).capitalize()} {i}", content_html=make_html(rnd, doc_size))
+            for i in range(docs)
+        ]
+        created = Document.objects.bulk_create(batch, batch_size=500)
+        search.index_documents(created)
+        for doc in created:
+            create_version(doc, doc.content_html)
+        data.documents[user.pk] = [d.pk for d in created]
+
+        for doc in created[:history_docs]:
+            parts = make_paragraphs(rnd, doc_size)
+            # история копилась долго: правки подряд здесь не должны склеиваться
+            with override_settings(DOCS_VERSION_COALESCE_SECONDS=0):
+                for _ in range(history):
+                    edit(parts, rnd)
+                    create_version(doc, "".join(parts))
+            Document.objects.filter(pk=doc.pk).update(content_html="".join(parts))
+            data.history.append(doc.pk)
+    return data
@@ -0,0 +1,87 @@
+"""
+Хвост латентности стрима с хеджированием и без (docs/ai_providers.py).
+
+Два локальных провайдера-заглушки: у каждого доля запросов slow_rate
+получает первый токен на slow_delay позже, у первого ещё и error_rate
+ошибок. Один и тот же пакет запросов гоняется с HEDGE=False и HEDGE=True;
+печатаются p50/p95/p99 полного времени ответа и число запросов к провайдерам.
+
+    python -m benchmarks.load_ai_hedging --requests 400 --concurrency 20 --slow-rate 0.1
+"""
+import argparse
+import asyncio
+import json
+
+from benchmarks.common import asgi_request, bearer, make_user, setup_django, summary
+from benchmarks.stub_llm import StubLLM
+
+
+async def scenario(args, hedge, headers):
+    from django.conf import settings
+
+    from docs import ai_providers
+    from minidocs.asgi import application
+
+    stubs = [
+        await StubLLM(args.tokens, args.token_delay, args.first_token_delay, args.error_rate,
+                      seed=1, slow_rate=args.slow_rate, slow_delay=args.slow_delay).start(),
+        await StubLLM(args.tokens, args.token_delay, args.first_token_delay, 0.0,
+                      seed=2, slow_rate=args.slow_rate, slow_delay=args.slow_delay).start(),
+    ]
+    settings.AI_PROVIDERS = [{"name": f"stub{i}", "url": s.url, "weight": 1} for i, s in enumerate(stubs)]
+    settings.AI_ROUTING = {"HEDGE": hedge, "HEDGE_DELAY": args.hedge_delay, "MIN_CALLS": 20, "COOLDOWN": 1}
+    ai_providers.reset()
+
+    sem = asyncio.Semaphore(args.concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        body = json.dumps({"mode": "generate", "prompt": f"ТЗ {i}"}).encode()
+        async with sem:
+            r = await asgi_request(application, "POST", "/api/ai/stream/", body, headers)
+        if b"event: error" in r["body"]:
+            errors += 1
+        latencies.append(r["total"])
+
+    await asyncio.gather(*[one(i) for i in range(args.requests)])
+    for s in stubs:
+        await s.stop()
+    return {
+        "hedge": hedge,
+        "latency": summary(latencies),
+        "client_errors": errors,
+        "upstream_requests": sum(s.requests for s in stubs),
+        "providers": {p["name"]: {k: p[k] for k in ("state", "total_failures", "hedged", "ttfb_p95_ms")}
+                      for p in ai_providers.status()},
+    }
+
+
+async def run(args):
+    from django.conf import settings
+
+    user = await asyncio.to_thread(make_user)
+    headers = {"authorization": await asyncio.to_thread(bearer, user), "content-type": "application/json"}
+    settings.AI_CONCURRENCY = {**settings.AI_CONCURRENCY, "PER_USER": args.concurrency}
+    return [await scenario(args, hedge, headers) for hedge in (False, True)]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=20)
+    ap.add_argument("--tokens", type=int, default=5)
+    ap.add_argument("--token-delay", type=float, default=0.002)
+    ap.add_argument("--first-token-delay", type=float, default=0.05)
+    ap.add_argument("--slow-rate", type=float, default=0.1)
+    ap.add_argument("--slow-delay", type=float, default=1.0)
+    ap.add_argument("--error-rate", type=float, default=0.05)
+    ap.add_argument("--hedge-delay", type=float, default=0.2)
+    args = ap.parse_args()
+
+    setup_django()
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
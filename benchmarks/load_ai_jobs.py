@@ -0,0 +1,77 @@
+"""
+Фоновые генерации против локальной заглушки провайдера: пакет задач
+ставится разом, пул воркеров (docs.jobs.WorkerPool) их выполняет.
+Печатает время постановки (то, что ждёт HTTP-клиент), время до
+завершения и пропускную способность.
+
+    python -m benchmarks.load_ai_jobs --jobs 100 --workers 16 --tokens 50
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.common import make_user, setup_django, summary
+from benchmarks.stub_llm import StubLLM
+
+
+async def run(args):
+    from asgiref.sync import sync_to_async
+    from django.conf import settings
+
+    from docs import jobs
+    from docs.models import GenerationJob
+
+    stub = await StubLLM(args.tokens, args.token_delay, args.first_token_delay, args.error_rate).start()
+    settings.AI_PROVIDERS = [{"name": "stub", "url": stub.url}]
+    options = {**jobs.conf(), "WORKERS": args.workers, "BACKOFF": 0.1, "POLL_INTERVAL": 0.05}
+    pool = jobs.WorkerPool(options).start()
+
+    user = await sync_to_async(make_user)()
+    submit_lat = []
+    t0 = time.perf_counter()
+    for i in range(args.jobs):
+        started = time.perf_counter()
+        await sync_to_async(jobs.submit)(user, "generate", {"prompt": f"ТЗ {i}"}, write="new" if args.write else "")
+        submit_lat.append(time.perf_counter() - started)
+        pool.notify()
+
+    finished = GenerationJob.objects.filter(status__in=["succeeded", "failed", "cancelled"])
+    while await finished.acount() < args.jobs:
+        await asyncio.sleep(0.05)
+    wall = time.perf_counter() - t0
+    pool.stop()
+    await stub.stop()
+
+    rows = [r async for r in GenerationJob.objects.values("status", "attempts", "created_at", "finished_at")]
+    return {
+        "jobs": args.jobs,
+        "workers": args.workers,
+        "succeeded": sum(r["status"] == "succeeded" for r in rows),
+        "failed": sum(r["status"] == "failed" for r in rows),
+        "retries": sum(r["attempts"] - 1 for r in rows),
+        "upstream_max_concurrent": stub.max_active,
+        "submit": summary(submit_lat),
+        "completion": summary([(r["finished_at"] - r["created_at"]).total_seconds() for r in rows]),
+        "wall_s": round(wall, 3),
+        "jobs_per_sec": round(args.jobs / wall, 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", type=int, default=100)
+    ap.add_argument("--workers", type=int, default=16)
+    ap.add_argument("--tokens", type=int, default=50)
+    ap.add_argument("--token-delay", type=float, default=0.01)
+    ap.add_argument("--first-token-delay", type=float, default=0.1)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--write", action="store_true", help="записывать результат новым документом")
+    args = ap.parse_args()
+
+    setup_django()
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
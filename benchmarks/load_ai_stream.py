@@ -0,0 +1,83 @@
+"""
+Нагрузочный тест AI-эндпоинтов на ASGI-стеке против локальной заглушки провайдера.
+
+Запросы идут прямо в minidocs.asgi.application в одном процессе; все
+генерации обслуживаются одним event loop и общим пулом соединений.
+Для сравнения печатается оценка времени того же пакета запросов
+синхронным прокси: воркер занят всю генерацию, параллельно не больше W.
+
+    python -m benchmarks.load_ai_stream --concurrency 300 --tokens 100 --token-delay 0.01
+"""
+import argparse
+import asyncio
+import json
+import math
+
+from benchmarks.common import asgi_request, bearer, make_user, setup_django, summary
+from benchmarks.stub_llm import StubLLM
+
+
+async def run(args):
+    from django.conf import settings
+
+    from minidocs.asgi import application
+
+    stub = await StubLLM(args.tokens, args.token_delay, args.first_token_delay).start()
+    settings.AI_PROVIDERS = [{"name": "stub", "url": stub.url}]
+    # все запросы идут от одного пользователя — снимаем пользовательский лимит
+    settings.AI_CONCURRENCY = {**settings.AI_CONCURRENCY, "PER_USER": args.concurrency}
+
+    user = await asyncio.to_thread(make_user)
+    headers = {"authorization": await asyncio.to_thread(bearer, user), "content-type": "application/json"}
+    path = "/api/ai/stream/" if args.mode == "stream" else "/api/ai/"
+    # одинаковые промпты склеиваются в одну генерацию; --distinct — у каждого своя
+    bodies = [
+        json.dumps({"mode": "generate", "prompt": f"Составь ТЗ {i if args.distinct else ''}"}).encode()
+        for i in range(args.concurrency)
+    ]
+
+    t0 = asyncio.get_running_loop().time()
+    results = await asyncio.gather(*[
+        asgi_request(application, "POST", path, body, headers) for body in bodies
+    ])
+    wall = asyncio.get_running_loop().time() - t0
+    await stub.stop()
+
+    ok = [r for r in results if r["status"] == 200]
+    per_request = args.first_token_delay + args.tokens * args.token_delay
+    return {
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "ok": len(ok),
+        "upstream_requests": stub.requests,
+        "upstream_max_concurrent": stub.max_active,
+        "writes_per_response": {
+            "mean": round(sum(r["writes"] for r in ok) / max(1, len(ok)), 1),
+            "max": max((r["writes"] for r in ok), default=0),
+        },
+        "wall_s": round(wall, 3),
+        "ideal_single_request_s": round(per_request, 3),
+        "ttfb": summary([r["ttfb"] for r in ok]),
+        "total": summary([r["total"] for r in ok]),
+        "sync_wsgi_wall_s": {
+            str(w): round(math.ceil(args.concurrency / w) * per_request, 3) for w in (4, 16, 64)
+        },
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=["stream", "proxy"], default="stream")
+    ap.add_argument("--concurrency", type=int, default=200)
+    ap.add_argument("--tokens", type=int, default=50)
+    ap.add_argument("--token-delay", type=float, default=0.02)
+    ap.add_argument("--first-token-delay", type=float, default=0.2)
+    ap.add_argument("--distinct", action="store_true", help="разные промпты, без склейки генераций")
+    args = ap.parse_args()
+
+    setup_django()
+    print(json.dumps(asyncio.run(run(args)), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Автосохранения под нагрузкой: editors редакторов, каждый в своём
+документе, без пауз шлют PATCH /content/ поверх последней ревизии.
+Режимы: direct — каждая правка сразу UPDATE + версия; buffered — буфер
+отложенной записи (docs/autosave.py) с журналом. Печатает устойчивую
+пропускную способность (сохранений в секунду), латентность, статусы
+(500 — «database is locked») и для buffered — время финального сброса.
+
+    python -m benchmarks.load_autosave --editors 32 --duration 10
+    python -m benchmarks.load_autosave --modes buffered --fsync
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from benchmarks.common import asgi_request, bearer, make_user, setup_django, summary
+
+
+async def run_mode(app, docs, token, args):
+    revisions = {pk: 0 for pk in docs}
+    latencies, statuses = [], Counter()
+    deadline = time.perf_counter() + args.duration
+
+    async def editor(pk):
+        i = 0
+        while time.perf_counter() < deadline:
+            body = {"base_revision": revisions[pk], "ops": [{"op": "insert", "at": 0, "text": f"<p>{i}</p>"}]}
+            result = await asgi_request(
+                app, "PATCH", f"/api/documents/{pk}/content/", json.dumps(body).encode(),
+                {"authorization": token, "content-type": "application/json"},
+            )
+            statuses[str(result["status"])] += 1
+            if result["status"] == 200:
+                revisions[pk] = json.loads(result["body"])["revision"]
+                latencies.append(result["total"])
+            i += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[editor(pk) for pk in docs])
+    wall = time.perf_counter() - started
+    return {
+        "saves": len(latencies),
+        "saves_per_sec": round(len(latencies) / wall, 1),
+        "statuses": dict(statuses),
+        "latency": summary(latencies),
+    }
+
+
+async def run(args, journal):
+    from asgiref.sync import sync_to_async
+    from django.conf import settings
+
+    from docs import autosave
+    from docs.models import Document, DocumentVersion
+    from minidocs.asgi import application
+
+    settings.DOCS_VERSION_RETENTION = {"INTERVAL": 0}
+    user = await sync_to_async(make_user)()
+    token = await sync_to_async(bearer)(user)
+    html = "<p>" + "текст документа " * (args.doc_size // 16) + "</p>"
+    report = {"editors": args.editors, "duration_s": args.duration, "modes": {}}
+    for mode in args.modes.split(","):
+        docs = [
+            d.pk for d in await sync_to_async(Document.objects.bulk_create)(
+                [Document(owner=user, title=f"{mode} {i}", content_html=html) for i in range(args.editors)]
+            )
+        ]
+        settings.AUTOSAVE = {
+            "ENABLED": mode == "buffered", "JOURNAL": journal, "FSYNC": args.fsync,
+            "IDLE": args.idle, "MAX_DELAY": args.max_delay,
+        }
+        result = await run_mode(application, docs, token, args)
+        if mode == "buffered":
+            started = time.perf_counter()
+            await sync_to_async(autosave.reset)()
+            result["final_flush_s"] = round(time.perf_counter() - started, 3)
+        versions = DocumentVersion.objects.filter(document_id__in=docs)
+        result["versions_written"] = await versions.acount()
+        report["modes"][mode] = result
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--editors", type=int, default=32)
+    ap.add_argument("--duration", type=float, default=10.0, help="секунд на режим")
+    ap.add_argument("--doc-size", type=int, default=10_000, help="символов HTML в документе")
+    ap.add_argument("--modes", default="direct,buffered")
+    ap.add_argument("--idle", type=float, default=1.0)
+    ap.add_argument("--max-delay", type=float, default=5.0)
+    ap.add_argument("--fsync", action="store_true", help="fsync журнала на каждое сохранение")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(Path(tmp) / "bench.sqlite3")
+        report = asyncio.run(run(args, Path(tmp) / "autosave.journal"))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
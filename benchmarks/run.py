@@ -0,0 +1,119 @@
+"""
+Прогон набора сценариев (benchmarks/scenarios.py) на воспроизводимых
+данных (benchmarks/datasets.py) с JSON-отчётом для сравнения коммитов.
+
+    python -m benchmarks.run --output results/$(git rev-parse --short HEAD).json
+    python -m benchmarks.run --scenarios list,search,update --requests 500 --concurrency 32
+    python -m benchmarks.compare results/before.json results/after.json
+
+Всё идёт в одном процессе: запросы прямо в ASGI-приложение, БД — временный
+файл SQLite (как в проде: ASGI выполняет синхронные вью каждого запроса
+в своём потоке), AI — в локальную заглушку провайдера (benchmarks/stub_llm.py).
+"""
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.common import ROOT, setup_django
+from benchmarks.stub_llm import StubLLM
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True, timeout=10, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def meta(args, data):
+    import sqlite3
+
+    import django
+
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "args": vars(args),
+        "dataset": data.as_dict(),
+    }
+
+
+async def run(args):
+    from asgiref.sync import sync_to_async
+    from django.conf import settings
+
+    from benchmarks import scenarios
+    from benchmarks.datasets import seed
+    from minidocs.asgi import application
+
+    data = await sync_to_async(seed)(
+        users=args.users, docs=args.docs, doc_size=args.doc_size,
+        history_docs=args.history_docs, history=args.history, seed=args.seed,
+    )
+    ctx = scenarios.Context(data)
+    await sync_to_async(scenarios.prepare)(ctx)
+
+    names = list(scenarios.SCENARIOS) if args.scenarios == "all" else args.scenarios.split(",")
+    stub = None
+    if scenarios.AI_SCENARIOS & set(names):
+        stub = await StubLLM(args.tokens, args.token_delay, args.first_token_delay).start()
+        settings.AI_PROVIDERS = [{"name": "stub", "url": stub.url}]
+        settings.AI_CACHE = None
+        settings.AI_CONCURRENCY = {**settings.AI_CONCURRENCY, "PER_USER": args.concurrency}
+
+    report = {"meta": meta(args, data), "scenarios": {}}
+    for name in names:
+        requests = args.requests if name != "export_all" else max(1, args.requests // 10)
+        report["scenarios"][name] = await scenarios.drive(
+            application, ctx, name, requests, args.concurrency, args.warmup
+        )
+        if stub is not None and name in scenarios.AI_SCENARIOS:
+            report["scenarios"][name]["upstream_max_concurrent"] = stub.max_active
+    if stub is not None:
+        await stub.stop()
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenarios", default="all", help="через запятую или all")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--warmup", type=int, default=10)
+    ap.add_argument("--users", type=int, default=4)
+    ap.add_argument("--docs", type=int, default=200, help="документов на пользователя")
+    ap.add_argument("--doc-size", type=int, default=10_000, help="символов HTML в документе")
+    ap.add_argument("--history-docs", type=int, default=3, help="документов с историей на пользователя")
+    ap.add_argument("--history", type=int, default=100, help="версий у такого документа")
+    ap.add_argument("--tokens", type=int, default=50)
+    ap.add_argument("--token-delay", type=float, default=0.01)
+    ap.add_argument("--first-token-delay", type=float, default=0.1)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--output", help="куда записать JSON (по умолчанию — только stdout)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(Path(tmp) / "bench.sqlite3")
+        report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        path = Path(args.output)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Сценарии нагрузки на ASGI-приложение: каждый описывает, какой запрос
+сделать i-м, драйвер гоняет их с заданной параллельностью и собирает
+пропускную способность и p50/p95/p99.
+
+Документы: list, search, detail, update (PATCH /content/), versions,
+version_read (восстановление старой версии из дельт), export (HTML, gzip),
+export_all (ZIP). AI: ai_proxy и ai_stream против локальной заглушки.
+"""
+import asyncio
+import json
+from collections import Counter
+
+from benchmarks.common import asgi_request, summary
+
+
+class Context:
+    """Общее для сценариев: набор данных, ревизии документов, заглушка провайдера."""
+
+    def __init__(self, data, stub=None):
+        self.data = data
+        self.stub = stub
+        self.docs = [(user, token, pk) for user, token in data.users for pk in data.documents[user.pk]]
+        self.revisions = {}
+        self.history_versions = {}
+
+    def user(self, i):
+        return self.data.users[i % len(self.data.users)]
+
+    def doc(self, i):
+        return self.docs[i % len(self.docs)]
+
+
+def _headers(token, **extra):
+    return {"authorization": token, "content-type": "application/json", **extra}
+
+
+def doc_list(ctx, i):
+    _, token = ctx.user(i)
+    return "GET", "/api/documents/", b"", _headers(token), b""
+
+
+def doc_search(ctx, i):
+    _, token = ctx.user(i)
+    word = ctx.data.words[i % len(ctx.data.words)]
+    return "GET", "/api/documents/", b"", _headers(token), f"q={word}".encode()
+
+
+def doc_detail(ctx, i):
+    _, token, pk = ctx.doc(i)
+    return "GET", f"/api/documents/{pk}/", b"", _headers(token), b""
+
+
+def doc_update(ctx, i):
+    _, token, pk = ctx.doc(i)
+    body = {
+        "base_revision": ctx.revisions.get(pk, 0),
+        "ops": [{"op": "insert", "at": 0, "text": f"<p>правка {i}</p>"}],
+    }
+    return "PATCH", f"/api/documents/{pk}/content/", json.dumps(body).encode(), _headers(token), b""
+
+
+def _after_update(ctx, i, result):
+    if result["status"] == 200:
+        _, _, pk = ctx.doc(i)
+        ctx.revisions[pk] = json.loads(result["body"])["revision"]
+
+
+def _history_doc(ctx, i):
+    pk = ctx.data.history[i % len(ctx.data.history)]
+    token = next(t for u, t in ctx.data.users if pk in ctx.data.documents[u.pk])
+    return token, pk
+
+
+def doc_versions(ctx, i):
+    token, pk = _history_doc(ctx, i)
+    return "GET", f"/api/documents/{pk}/versions/", b"", _headers(token), b""
+
+
+def version_read(ctx, i):
+    token, pk = _history_doc(ctx, i)
+    versions = ctx.history_versions[pk]
+    # середина истории: самый длинный путь от ключевого кадра не короче, чем у свежих
+    version = versions[(len(versions) // 2 + i) % len(versions)]
+    return "GET", f"/api/documents/{pk}/versions/{version}/", b"", _headers(token), b""
+
+
+def doc_export(ctx, i):
+    _, token, pk = ctx.doc(i)
+    return "GET", f"/api/documents/{pk}/export/", b"", _headers(token, **{"accept-encoding": "gzip"}), b""
+
+
+def export_all(ctx, i):
+    _, token = ctx.user(i)
+    return "GET", "/api/documents/export/", b"", _headers(token), b""
+
+
+def ai_proxy(ctx, i):
+    _, token = ctx.user(i)
+    body = {"mode": "generate", "prompt": f"Составь ТЗ {i}"}
+    return "POST", "/api/ai/", json.dumps(body).encode(), _headers(token), b""
+
+
+def ai_stream(ctx, i):
+    _, token = ctx.user(i)
+    body = {"mode": "generate", "prompt": f"Составь ТЗ {i}"}
+    return "POST", "/api/ai/stream/", json.dumps(body).encode(), _headers(token), b""
+
+
+SCENARIOS = {
+    "list": doc_list,
+    "search": doc_search,
+    "detail": doc_detail,
+    "update": doc_update,
+    "versions": doc_versions,
+    "version_read": version_read,
+    "export": doc_export,
+    "export_all": export_all,
+    "ai_proxy": ai_proxy,
+    "ai_stream": ai_stream,
+}
+AFTER = {"update": _after_update}
+AI_SCENARIOS = {"ai_proxy", "ai_stream"}
+
+
+def prepare(ctx):
+    """Кэш id версий документов с историей (для version_read)."""
+    from docs.models import DocumentVersion
+
+    for pk in ctx.data.history:
+        ids = list(DocumentVersion.objects.filter(document_id=pk).order_by("id").values_list("id", flat=True))
+        # последнюю версию сценарий update может заменить склейкой автосохранений
+        ctx.history_versions[pk] = ids[:-1] or ids
+
+
+async def drive(app, ctx, name, requests, concurrency, warmup=0):
+    """Выполняет requests запросов сценария name не больше concurrency одновременно."""
+    make = SCENARIOS[name]
+    after = AFTER.get(name)
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def one(i, record):
+        method, path, body, headers, query = make(ctx, i)
+        async with sem:
+            result = await asgi_request(app, method, path, body, headers, query)
+        if after:
+            after(ctx, i, result)
+        if record:
+            results.append(result)
+
+    await asyncio.gather(*[one(i, False) for i in range(warmup)])
+    started = loop.time()
+    await asyncio.gather(*[one(warmup + i, True) for i in range(requests)])
+    wall = loop.time() - started
+
+    ok = [r for r in results if 200 <= r["status"] < 300 and b"event: error" not in r["body"]]
+    report = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "statuses": dict(Counter(str(r["status"]) for r in results)),
+        "wall_s": round(wall, 3),
+        "rps": round(len(ok) / wall, 1) if wall else None,
+        "latency": summary([r["total"] for r in ok]),
+        "response_bytes": summary_bytes(ok),
+    }
+    if name == "ai_stream":
+        report["ttfb"] = summary([r["ttfb"] for r in ok])
+    return report
+
+
+def summary_bytes(results):
+    sizes = [len(r["body"]) for r in results]
+    return {"mean": round(sum(sizes) / len(sizes)) if sizes else 0, "max": max(sizes, default=0)}
@@ -0,0 +1,149 @@
+"""
+Заглушка OpenAI-совместимого провайдера для нагрузочных тестов.
+
+POST на любой путь: {"stream": false} → JSON chat.completion,
+иначе — SSE с дельтами по одному токену. Задержки настраиваются;
+slow_rate доля запросов получает первый токен на slow_delay позже
+(хвост латентности), error_rate — отвечает 500.
+
+    python -m benchmarks.stub_llm --port 9100 --tokens 200 --token-delay 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+class StubLLM:
+    def __init__(self, tokens=100, token_delay=0.01, first_token_delay=0.1, error_rate=0.0, seed=1,
+                 slow_rate=0.0, slow_delay=1.0):
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.rnd = random.Random(seed)
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _read_request(self, reader):
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                headers[k.strip().lower()] = v.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return lines[0], headers, body
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    _, _, body = await self._read_request(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                self.requests += 1
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                try:
+                    payload = json.loads(body or b"{}")
+                    await self._respond(writer, payload)
+                finally:
+                    self.active -= 1
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def _words(self):
+        return [f"слово{i} " for i in range(self.tokens)]
+
+    async def _respond(self, writer, payload):
+        delay = self.first_token_delay
+        if self.slow_rate and self.rnd.random() < self.slow_rate:
+            delay += self.slow_delay
+        await asyncio.sleep(delay)
+        if self.error_rate and self.rnd.random() < self.error_rate:
+            body = b'{"error": "stub failure"}'
+            writer.write(
+                b"HTTP/1.1 500 Internal Server Error\r\ncontent-type: application/json\r\n"
+                b"content-length: %d\r\n\r\n%s" % (len(body), body)
+            )
+            await writer.drain()
+            return
+        if payload.get("stream") is False:
+            await asyncio.sleep(self.token_delay * self.tokens)
+            body = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": int(time.time()),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(self._words())}}],
+            }, ensure_ascii=False).encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\ncontent-type: application/json\r\n"
+                b"content-length: %d\r\n\r\n%s" % (len(body), body)
+            )
+            await writer.drain()
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\n"
+            b"transfer-encoding: chunked\r\n\r\n"
+        )
+        for i, word in enumerate(self._words()):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            event = "data: " + json.dumps({"choices": [{"delta": {"content": word}}]}, ensure_ascii=False) + "\n\n"
+            self._chunk(writer, event.encode())
+            await writer.drain()
+        self._chunk(writer, b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _chunk(writer, data):
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+
+async def _serve(args):
+    stub = await StubLLM(
+        args.tokens, args.token_delay, args.first_token_delay, args.error_rate,
+        slow_rate=args.slow_rate, slow_delay=args.slow_delay,
+    ).start(args.host, args.port)
+    print(f"stub LLM on {stub.url}", flush=True)
+    async with stub.server:
+        await stub.server.serve_forever()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9100)
+    ap.add_argument("--tokens", type=int, default=100)
+    ap.add_argument("--token-delay", type=float, default=0.01)
+    ap.add_argument("--first-token-delay", type=float, default=0.1)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--slow-rate", type=float, default=0.0)
+    ap.add_argument("--slow-delay", type=float, default=1.0)
+    asyncio.run(_serve(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Кэш ответов AI для повторных одинаковых запросов (включается настройкой AI_CACHE).
+
+Ключ — sha256 от нормализованного payload (model, messages, temperature, top_p),
+поэтому один и тот же outline/rewrite по неизменному документу не идёт к провайдеру
+повторно. Бэкенды: память (LRU), файлы, Django cache.
+
+    AI_CACHE = {
+        "BACKEND": "docs.ai_cache.LocMemBackend",
+        "TTL": 3600,
+        "MODES": ["outline", "rewrite"],
+        "OPTIONS": {"max_entries": 500, "max_bytes": 50 * 1024 * 1024},
+    }
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_MODES = ("outline", "rewrite")
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "bypass": 0, "evictions": 0}
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+
+def cache_key(namespace: str, payload: dict) -> str:
+    normalized = {
+        "model": payload.get("model"),
+        "messages": payload.get("messages"),
+        "temperature": payload.get("temperature"),
+        "top_p": payload.get("top_p"),
+    }
+    raw = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return f"{namespace}:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _encode(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class BaseBackend:
+    # True — операции могут блокировать (диск, сеть) и выполняются в потоке
+    blocking = True
+
+    def __init__(self, ttl=3600, **options):
+        self.ttl = ttl
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LocMemBackend(BaseBackend):
+    """LRU в памяти процесса с ограничением по числу записей и байтам."""
+
+    blocking = False
+
+    def __init__(self, ttl=3600, max_entries=500, max_bytes=50 * 1024 * 1024, **options):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (expires, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._data.move_to_end(key)
+            return item[2]
+
+    def set(self, key, value):
+        size = len(_encode(value))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                _count("evictions")
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+
+class FileBackend(BaseBackend):
+    """Файл на запись; TTL по mtime, при превышении max_bytes удаляются самые старые."""
+
+    def __init__(self, ttl=3600, path=None, max_bytes=200 * 1024 * 1024, **options):
+        super().__init__(ttl)
+        self.path = Path(path or Path(settings.BASE_DIR) / ".ai_cache")
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def _file(self, key):
+        return self.path / (key.replace(":", "_") + ".json")
+
+    def get(self, key):
+        f = self._file(key)
+        try:
+            if f.stat().st_mtime + self.ttl < time.time():
+                f.unlink(missing_ok=True)
+                return None
+            return json.loads(f.read_bytes())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set(self, key, value):
+        f = self._file(key)
+        tmp = f.with_suffix(".tmp")
+        tmp.write_bytes(_encode(value))
+        os.replace(tmp, f)
+        self._evict()
+
+    def clear(self):
+        for f in self.path.glob("*.json"):
+            f.unlink(missing_ok=True)
+
+    def _evict(self):
+        files = []
+        total = 0
+        for f in self.path.glob("*.json"):
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, f))
+            total += st.st_size
+        files.sort()
+        for _, size, f in files:
+            if total <= self.max_bytes:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+            _count("evictions")
+
+
+class DjangoCacheBackend(BaseBackend):
+    """
+    Поверх django.core.cache (CACHES[alias]); вытеснение — на стороне кэша.
+    Кэш общий (отзыв токенов, блокировки), поэтому clear() не чистит его, а
+    сдвигает поколение в ключах "ai:<поколение>:…": старые записи больше не
+    читаются и уходят по TTL.
+    """
+
+    GENERATION_KEY = "ai:generation"
+
+    def __init__(self, ttl=3600, alias="default", **options):
+        super().__init__(ttl)
+        self.alias = alias
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+
+        return caches[self.alias]
+
+    def _key(self, key):
+        generation = self.cache.get_or_set(self.GENERATION_KEY, 1, None)
+        return f"ai:{generation}:{key}"
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, value):
+        self.cache.set(self._key(key), value, self.ttl)
+
+    def clear(self):
+        try:
+            self.cache.incr(self.GENERATION_KEY)
+        except ValueError:  # счётчика ещё нет (или вытеснен)
+            self.cache.add(self.GENERATION_KEY, 2, None)
+
+
+_backend = None
+_backend_conf = None
+
+
+def get_backend():
+    """Бэкенд из настройки AI_CACHE или None, если кэш выключен."""
+    global _backend, _backend_conf
+    conf = getattr(settings, "AI_CACHE", None)
+    if not conf:
+        return None
+    if _backend is None or _backend_conf is not conf:
+        cls = import_string(conf.get("BACKEND", "docs.ai_cache.LocMemBackend"))
+        _backend = cls(ttl=conf.get("TTL", 3600), **conf.get("OPTIONS", {}))
+        _backend_conf = conf
+    return _backend
+
+
+def enabled_for(mode: str, request, data: dict) -> bool:
+    """Кэш включён, режим кэшируемый и клиент не попросил обход."""
+    conf = getattr(settings, "AI_CACHE", None)
+    if not conf or mode not in conf.get("MODES", DEFAULT_MODES):
+        return False
+    no_cache = "no-cache" in request.headers.get("Cache-Control", "")
+    if data.get("cache") is False or no_cache:
+        _count("bypass")
+        return False
+    return True
+
+
+async def aget(key):
+    backend = get_backend()
+    if backend is None:
+        return None
+    if backend.blocking:
+        value = await sync_to_async(backend.get, thread_sensitive=False)(key)
+    else:
+        value = backend.get(key)
+    _count("hits" if value is not None else "misses")
+    return value
+
+
+async def aset(key, value):
+    backend = get_backend()
+    if backend is None:
+        return
+    if backend.blocking:
+        await sync_to_async(backend.set, thread_sensitive=False)(key, value)
+    else:
+        backend.set(key, value)
+    _count("stores")
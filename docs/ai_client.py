@@ -0,0 +1,77 @@
+"""
+Общий httpx.AsyncClient для обращений к AI-провайдеру.
+
+Клиент один на event loop: keep-alive пул соединений переиспользуется
+между запросами, HTTP/2 включается, если установлен пакет h2.
+Закрывается на lifespan.shutdown (см. minidocs/asgi.py).
+"""
+import asyncio
+import weakref
+
+import httpx
+from django.conf import settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+_clients = weakref.WeakKeyDictionary()
+_transport = None  # подмена транспорта (тесты, заглушки провайдера)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _timeout(read_key, read_default) -> httpx.Timeout:
+    t = _setting("AI_TIMEOUTS", {})
+    return httpx.Timeout(
+        connect=t.get("connect", 5.0),
+        read=t.get(read_key, read_default),
+        write=t.get("write", 10.0),
+        pool=t.get("pool", 10.0),
+    )
+
+
+def request_timeout() -> httpx.Timeout:
+    return _timeout("read", 120.0)
+
+
+def stream_timeout() -> httpx.Timeout:
+    # для стрима read — это пауза между чанками, а не длительность всей генерации
+    return _timeout("stream_read", 60.0)
+
+
+def get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        limits = _setting("AI_POOL_LIMITS", {})
+        client = httpx.AsyncClient(
+            http2=HTTP2 and _transport is None,
+            timeout=request_timeout(),
+            limits=httpx.Limits(
+                max_connections=limits.get("max_connections", 200),
+                max_keepalive_connections=limits.get("max_keepalive_connections", 50),
+                keepalive_expiry=limits.get("keepalive_expiry", 30.0),
+            ),
+            transport=_transport,
+        )
+        _clients[loop] = client
+    return client
+
+
+async def aclose():
+    """Закрывает клиент текущего event loop (lifespan.shutdown)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def set_transport(transport):
+    """Подменяет транспорт для всех новых клиентов (httpx.MockTransport и т.п.)."""
+    global _transport
+    _transport = transport
+    _clients.clear()
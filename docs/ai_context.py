@@ -0,0 +1,202 @@
+"""
+Сборка контекста документа для промпта.
+
+Вместо слепых срезов html[:1000] / html[-1000:] документ один раз режется
+на разделы по заголовкам (h1–h3), разметка снимается, а в промпт попадают
+разделы, наиболее близкие к инструкции/выделению, в пределах бюджета токенов.
+Разделы кэшируются по версии документа (id + updated_at) или по хэшу HTML.
+"""
+import hashlib
+import math
+import re
+from collections import Counter
+from html.parser import HTMLParser
+
+from django.conf import settings
+
+from .lru import LRUCache
+from .search import _BLOCK_TAGS, _SKIP_TAGS, stems
+
+_HEADINGS = {"h1", "h2", "h3"}
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+_sections_cache = LRUCache(maxsize=256)
+
+
+class Section:
+    __slots__ = ("index", "title", "text", "tokens", "terms")
+
+    def __init__(self, index, title, text):
+        self.index = index
+        self.title = title
+        self.text = text
+        self.tokens = estimate_tokens(title) + estimate_tokens(text)
+        self.terms = Counter(stems(title + " " + text))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Быстрая оценка числа токенов без токенизатора: латиница ~4 символа
+    на токен, кириллица и прочее ~2.5, знаки препинания — по токену.
+    """
+    total = 0
+    for m in _TOKEN_RE.finditer(text or ""):
+        word = m.group()
+        per = 4.0 if word.isascii() else 2.5
+        total += max(1, math.ceil(len(word) / per))
+    return total
+
+
+class _SectionParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sections = []  # [title, [parts]]
+        self._title = None
+        self._skip = 0
+        self._start("")
+
+    def _start(self, title):
+        self.sections.append([title, []])
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _HEADINGS:
+            self._title = []
+        elif tag in _BLOCK_TAGS:
+            self.sections[-1][1].append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _HEADINGS and self._title is not None:
+            self._start(" ".join("".join(self._title).split()))
+            self._title = None
+        elif tag in _BLOCK_TAGS:
+            self.sections[-1][1].append("\n")
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        if self._title is not None:
+            self._title.append(data)
+        else:
+            self.sections[-1][1].append(data)
+
+
+def parse_sections(content_html: str) -> list:
+    parser = _SectionParser()
+    parser.feed(content_html or "")
+    parser.close()
+    sections = []
+    for title, parts in parser.sections:
+        text = re.sub(r"[ \t\r\f\v]+", " ", "".join(parts))
+        text = re.sub(r"\s*\n\s*", "\n", text).strip()
+        if title or text:
+            sections.append(Section(len(sections), title, text))
+    return sections
+
+
+def get_sections(content_html: str, version_key=None) -> list:
+    """Разделы документа из кэша; version_key — (id документа, updated_at), иначе хэш HTML."""
+    key = version_key or hashlib.sha1((content_html or "").encode("utf-8")).hexdigest()
+    sections = _sections_cache.get(key)
+    if sections is None:
+        sections = parse_sections(content_html)
+        _sections_cache.set(key, sections)
+    return sections
+
+
+def _truncate(text, budget, from_end=False):
+    """Обрезает текст до бюджета токенов по границе слова."""
+    if estimate_tokens(text) <= budget:
+        return text
+    # грубая оценка длины в символах, затем подрезаем до слова
+    chars = max(0, int(budget * 2.5))
+    if from_end:
+        cut = text[-chars:]
+        space = cut.find(" ")
+        return "…" + (cut[space + 1:] if 0 <= space < 20 else cut)
+    cut = text[:chars]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > len(cut) - 20 else cut) + "…"
+
+
+def _render(section, text):
+    return f"## {section.title}\n{text}".strip() if section.title else text
+
+
+def _relevance(sections, query):
+    q = Counter(stems(query))
+    if not q:
+        return {}
+    df = Counter()
+    for s in sections:
+        df.update(set(s.terms))
+    n = len(sections)
+    scores = {}
+    for s in sections:
+        score = 0.0
+        for term in q:
+            tf = s.terms.get(term, 0)
+            if tf:
+                score += (1 + math.log(tf)) * math.log(1 + n / df[term])
+        if score:
+            scores[s.index] = score
+    return scores
+
+
+def select_context(sections, query="", budget=None, mode="generate"):
+    """
+    Текст контекста в пределах бюджета токенов: разделы, самые близкие к query,
+    в порядке документа. Для continue сначала берётся конец документа,
+    для outline — оглавление.
+    """
+    if budget is None:
+        budget = getattr(settings, "AI_CONTEXT_TOKENS", 1500)
+    if not sections:
+        return ""
+
+    chosen = {}  # index -> текст раздела
+    left = budget
+
+    if mode == "continue":
+        # продолжение: хвост документа важнее всего
+        tail_budget = int(budget * 0.6)
+        for s in reversed(sections):
+            if tail_budget <= 0:
+                break
+            text = _truncate(s.text, tail_budget, from_end=True)
+            chosen[s.index] = text
+            tail_budget -= estimate_tokens(text) + estimate_tokens(s.title)
+        left = budget - sum(estimate_tokens(t) for t in chosen.values())
+    elif mode == "outline":
+        toc = "\n".join(f"- {s.title}" for s in sections if s.title)
+        toc = _truncate(toc, int(budget * 0.3)) if toc else ""
+        left -= estimate_tokens(toc)
+
+    scores = _relevance(sections, query)
+    ranked = sorted(sections, key=lambda s: (-scores.get(s.index, 0.0), s.index))
+    for s in ranked:
+        if left <= 0:
+            break
+        if s.index in chosen:
+            continue
+        if not scores.get(s.index) and mode != "outline" and chosen:
+            # нерелевантные разделы добавляем, только если больше нечего взять
+            continue
+        text = _truncate(s.text, max(0, left - estimate_tokens(s.title)))
+        if not text:
+            continue
+        chosen[s.index] = text
+        left -= estimate_tokens(text) + estimate_tokens(s.title)
+
+    body = "\n\n".join(_render(sections[i], chosen[i]) for i in sorted(chosen))
+    if mode == "outline" and toc:
+        return f"Оглавление:\n{toc}\n\n{body}".strip()
+    return body
+
+
+def build_context(mode, content_html, prompt="", selection="", version_key=None, budget=None):
+    sections = get_sections(content_html, version_key)
+    return select_context(sections, f"{prompt} {selection}", budget=budget, mode=mode)
@@ -0,0 +1,153 @@
+"""
+Склейка одинаковых запросов к AI и ограничение параллелизма.
+
+- Одинаковые payload'ы, пришедшие одновременно (двойной клик, ретраи фронта),
+  делят один вызов провайдера: нестримовые ждут общий результат,
+  стримовые подписываются на общую генерацию (docs/ai_stream.py).
+- Параллельные вызовы ограничены глобально и на пользователя (AI_CONCURRENCY);
+  лишние (сверх любого из лимитов) ждут в общей очереди не дольше
+  QUEUE_TIMEOUT, при переполнении очереди или по таймауту — 429 с Retry-After.
+
+Все примитивы asyncio живут в своём event loop, поэтому состояние хранится
+отдельно на каждый loop.
+"""
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+
+DEFAULTS = {"GLOBAL": 64, "PER_USER": 4, "MAX_QUEUE": 128, "QUEUE_TIMEOUT": 30, "RETRY_AFTER": 5}
+
+
+class Overloaded(Exception):
+    def __init__(self, reason, queue_depth, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    def __init__(self, global_limit, per_user, max_queue, queue_timeout, retry_after):
+        self.per_user = per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._global = asyncio.Semaphore(global_limit)
+        self._users = {}  # user_id -> занято слотов (активные + ждущие)
+        self._user_slots = {}  # user_id -> asyncio.Semaphore(per_user)
+        self.active = 0
+        self.waiting = 0
+
+    @property
+    def queue_depth(self):
+        return self.waiting
+
+    def _reject(self, reason):
+        raise Overloaded(reason, self.waiting, self.retry_after)
+
+    async def acquire(self, user_id):
+        user = self._user_slots.get(user_id)
+        busy = self._global.locked() or (user is not None and user.locked())
+        if busy and self.waiting >= self.max_queue:
+            self._reject("queue is full")
+
+        if user is None:
+            user = self._user_slots[user_id] = asyncio.Semaphore(self.per_user)
+        self._users[user_id] = self._users.get(user_id, 0) + 1
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._acquire(user), self.queue_timeout)
+        except BaseException as e:
+            self._release_user(user_id)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("queue timeout")
+            raise
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    async def _acquire(self, user):
+        # сначала слот пользователя: его лишние запросы не держат глобальный
+        await user.acquire()
+        try:
+            await self._global.acquire()
+        except BaseException:
+            user.release()
+            raise
+
+    def release(self, user_id):
+        self.active -= 1
+        self._global.release()
+        self._user_slots[user_id].release()
+        self._release_user(user_id)
+
+    def _release_user(self, user_id):
+        left = self._users[user_id] - 1
+        if left:
+            self._users[user_id] = left
+        else:
+            del self._users[user_id]
+            del self._user_slots[user_id]
+
+    @asynccontextmanager
+    async def slot(self, user_id):
+        await self.acquire(user_id)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+    def stats(self):
+        return {"active": self.active, "waiting": self.waiting, "users": len(self._users)}
+
+
+class _LoopState:
+    def __init__(self):
+        conf = {**DEFAULTS, **getattr(settings, "AI_CONCURRENCY", {})}
+        self.limiter = ConcurrencyLimiter(
+            conf["GLOBAL"], conf["PER_USER"], conf["MAX_QUEUE"], conf["QUEUE_TIMEOUT"], conf["RETRY_AFTER"]
+        )
+        self.calls = {}  # key -> asyncio.Task
+
+
+_states = weakref.WeakKeyDictionary()
+
+
+def _state() -> _LoopState:
+    loop = asyncio.get_running_loop()
+    state = _states.get(loop)
+    if state is None:
+        state = _states[loop] = _LoopState()
+    return state
+
+
+def limiter() -> ConcurrencyLimiter:
+    return _state().limiter
+
+
+def reset():
+    """Сбрасывает состояние (тесты, смена настроек)."""
+    _states.clear()
+
+
+async def coalesced_call(key, user_id, factory):
+    """
+    Выполняет factory() (корутина вызова провайдера) один раз на ключ.
+    Остальные одновременные запросы с тем же ключом ждут тот же результат
+    и слот лимитера не занимают.
+    """
+    state = _state()
+    task = state.calls.get(key)
+    if task is None:
+        async def run():
+            try:
+                async with state.limiter.slot(user_id):
+                    return await factory()
+            finally:
+                state.calls.pop(key, None)
+
+        # отдельная задача: отключение первого клиента не отменяет вызов для остальных
+        task = state.calls[key] = asyncio.ensure_future(run())
+    return await asyncio.shield(task)
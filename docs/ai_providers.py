@@ -0,0 +1,355 @@
+"""
+Реестр AI-провайдеров: выбор по весам, хеджирование, failover и circuit breaker.
+
+    AI_PROVIDERS = [
+        {"name": "n8n", "url": "...", "weight": 3, "kinds": ["stream"], "format": "messages"},
+        {"name": "hf", "url": "...", "weight": 1, "kinds": ["call", "stream"],
+         "model": "...", "headers": {"Authorization": "Bearer ..."}},
+    ]
+
+kinds — для каких вызовов годится провайдер: "call" (нестримовый
+/api/ai/) и "stream" (SSE). Вес 0 — запасной: пробуется после всех основных.
+format — тело запроса: "chat" (по умолчанию, OpenAI chat completions:
+payload целиком, model провайдера, stream по виду вызова) или "messages"
+(вебхук n8n: только messages).
+
+Запрос уходит провайдеру, выбранному случайно по весам. Если первый байт
+не пришёл за p95 его времени до первого байта (HEDGE_PERCENTILE, в
+пределах HEDGE_MIN_DELAY..HEDGE_MAX_DELAY; пока замеров мало —
+HEDGE_DELAY), параллельно запускается следующий; выигрывает ответивший
+первым, проигравший отменяется. Ошибка до первого байта — сразу failover
+на следующего.
+
+Circuit breaker на каждого провайдера считает последние WINDOW вызовов:
+доля ошибок >= ERROR_RATE или медленных (до первого байта дольше
+SLOW_CALL) >= SLOW_RATE при минимум MIN_CALLS вызовах размыкает его на
+COOLDOWN секунд, затем пропускается одна пробная попытка (half-open):
+успех замыкает, ошибка снова размыкает.
+
+    AI_ROUTING = {
+        "HEDGE": True,
+        "HEDGE_DELAY": 2.0,
+        "HEDGE_PERCENTILE": 95,
+        "HEDGE_MIN_DELAY": 0.2,
+        "HEDGE_MAX_DELAY": 10.0,
+        "MAX_ATTEMPTS": 3,   # сколько провайдеров пробуем на один запрос
+        "WINDOW": 50,
+        "MIN_CALLS": 10,
+        "ERROR_RATE": 0.5,
+        "SLOW_CALL": 10.0,
+        "SLOW_RATE": 0.8,
+        "COOLDOWN": 30,
+    }
+
+Статистика общая для процесса (веб-воркер и пул фоновых задач живут
+в разных потоках), поэтому защищена threading.Lock.
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+DEFAULTS = {
+    "HEDGE": True,
+    "HEDGE_DELAY": 2.0,
+    "HEDGE_PERCENTILE": 95,
+    "HEDGE_MIN_DELAY": 0.2,
+    "HEDGE_MAX_DELAY": 10.0,
+    "MAX_ATTEMPTS": 3,
+    "WINDOW": 50,
+    "MIN_CALLS": 10,
+    "ERROR_RATE": 0.5,
+    "SLOW_CALL": 10.0,
+    "SLOW_RATE": 0.8,
+    "COOLDOWN": 30,
+}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+def conf() -> dict:
+    return {**DEFAULTS, **getattr(settings, "AI_ROUTING", {})}
+
+
+class ProviderError(Exception):
+    """Провайдер ответил ошибкой до первого байта; result — что вернуть, если других нет."""
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+class NoProviders(Exception):
+    """Нет провайдера для вызова: не настроены или все разомкнуты."""
+
+
+class Provider:
+    __slots__ = ("name", "url", "weight", "kinds", "model", "headers", "format")
+
+    def __init__(self, name, url, weight=1, kinds=("call", "stream"), model=None, headers=None, format="chat"):
+        if format not in ("chat", "messages"):
+            raise ValueError(f"AI_PROVIDERS[{name}]: неизвестный format {format!r}")
+        self.name = name
+        self.url = url
+        self.weight = weight
+        self.kinds = tuple(kinds)
+        self.model = model
+        self.headers = dict(headers or {})
+        self.format = format
+
+    def prepare(self, payload, stream=False):
+        """Тело запроса к этому провайдеру из общего payload."""
+        if self.format == "messages":
+            return {"messages": payload["messages"]}
+        payload = {**payload, "stream": stream}
+        if self.model:
+            payload["model"] = self.model
+        return payload
+
+
+class Health:
+    """Скользящее окно исходов вызовов провайдера и состояние breaker'а."""
+
+    def __init__(self, options):
+        self.lock = threading.Lock()
+        self.calls = deque(maxlen=options["WINDOW"])  # (ok, секунды до первого байта)
+        self.state = CLOSED
+        self.opened_at = None
+        self.probing = False
+        self.total = 0
+        self.failures = 0
+        self.hedged = 0
+        self.last_error = ""
+
+    def allow(self, options) -> bool:
+        """Можно ли начать вызов; в half-open пропускает одну пробу за раз."""
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < options["COOLDOWN"]:
+                    return False
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self.probing:
+                    return False
+                self.probing = True
+            return True
+
+    def record(self, ok, latency, options, error=""):
+        with self.lock:
+            self.total += 1
+            if not ok:
+                self.failures += 1
+                self.last_error = error[:200]
+            if self.state == HALF_OPEN:
+                self.probing = False
+                if ok:
+                    self.state = CLOSED
+                    self.calls.clear()
+                else:
+                    self._open()
+                return
+            self.calls.append((ok, latency))
+            if self.state == CLOSED and len(self.calls) >= options["MIN_CALLS"]:
+                errors = sum(1 for c_ok, _ in self.calls if not c_ok)
+                slow = sum(1 for _, lat in self.calls if lat is not None and lat > options["SLOW_CALL"])
+                n = len(self.calls)
+                if errors / n >= options["ERROR_RATE"] or slow / n >= options["SLOW_RATE"]:
+                    self._open()
+
+    def abandon(self, latency, options):
+        """
+        Проигравший хедж отменён: исход неизвестен, но время до первого
+        байта не меньше latency — учитываем его как нижнюю оценку.
+        Пробный вызов half-open просто освобождает место для следующей пробы.
+        """
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.probing = False
+                return
+        self.record(True, latency, options)
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def hedge_delay(self, options) -> float:
+        with self.lock:
+            latencies = sorted(lat for ok, lat in self.calls if ok and lat is not None)
+        if len(latencies) < options["MIN_CALLS"]:
+            delay = options["HEDGE_DELAY"]
+        else:
+            rank = math.ceil(len(latencies) * options["HEDGE_PERCENTILE"] / 100) - 1
+            delay = latencies[max(0, min(rank, len(latencies) - 1))]
+        return min(max(delay, options["HEDGE_MIN_DELAY"]), options["HEDGE_MAX_DELAY"])
+
+    def snapshot(self, options):
+        with self.lock:
+            calls = list(self.calls)
+            state = self.state
+            if state == OPEN and time.monotonic() - self.opened_at >= options["COOLDOWN"]:
+                state = HALF_OPEN
+            data = {
+                "state": state,
+                "window_calls": len(calls),
+                "window_error_rate": round(sum(1 for ok, _ in calls if not ok) / len(calls), 3) if calls else 0.0,
+                "total_calls": self.total,
+                "total_failures": self.failures,
+                "hedged": self.hedged,
+                "last_error": self.last_error,
+            }
+        latencies = sorted(lat for ok, lat in calls if ok and lat is not None)
+        for p in (50, 95):
+            rank = math.ceil(len(latencies) * p / 100) - 1
+            data[f"ttfb_p{p}_ms"] = round(latencies[max(0, rank)] * 1000, 1) if latencies else None
+        data["hedge_delay_ms"] = round(self.hedge_delay(options) * 1000, 1)
+        return data
+
+
+_health = {}
+_health_lock = threading.Lock()
+_random = random.Random()
+
+
+def reset():
+    """Сбрасывает статистику и состояние breaker'ов (тесты, смена настроек)."""
+    with _health_lock:
+        _health.clear()
+
+
+def health(name, options=None) -> Health:
+    with _health_lock:
+        h = _health.get(name)
+        if h is None:
+            h = _health[name] = Health(options or conf())
+        return h
+
+
+def providers(kind=None) -> list:
+    result = [Provider(**p) for p in getattr(settings, "AI_PROVIDERS", [])]
+    if kind is not None:
+        result = [p for p in result if kind in p.kinds]
+    return result
+
+
+def candidates(kind, options=None) -> list:
+    """
+    Провайдеры в порядке попыток: взвешенная случайная перестановка
+    (ключ u^(1/w)), запасные с весом 0 — в конце.
+    """
+    options = options or conf()
+    keyed = []
+    for p in providers(kind):
+        key = _random.random() ** (1.0 / p.weight) if p.weight > 0 else -1.0
+        keyed.append((key, p))
+    keyed.sort(key=lambda item: item[0], reverse=True)
+    return [p for _, p in keyed]
+
+
+async def _release(release, result):
+    if release is not None:
+        try:
+            await release(result)
+        except Exception:
+            pass
+
+
+async def hedged(kind, attempt, options=None, release=None):
+    """
+    Выполняет attempt(provider) по кандидатам с хеджированием и failover.
+    attempt возвращает результат, как только получен первый байт, или
+    бросает ProviderError. Возвращает (provider, result); NoProviders —
+    если начать было не у кого, иначе ProviderError последней попытки.
+    release(result) — закрыть лишний успешный результат (открытый стрим
+    попытки, которая тоже успела ответить, но проиграла).
+    """
+    options = options or conf()
+    queue = candidates(kind, options)
+    if not queue:
+        raise NoProviders(f"нет провайдеров для {kind!r}")
+    loop = asyncio.get_running_loop()
+    running = {}  # task -> (provider, health, started)
+    budget = options["MAX_ATTEMPTS"]
+    last_error = None
+
+    def launch():
+        nonlocal budget
+        while queue and budget > 0:
+            provider = queue.pop(0)
+            h = health(provider.name, options)
+            if not h.allow(options):
+                continue
+            budget -= 1
+            task = asyncio.ensure_future(attempt(provider))
+            running[task] = (provider, h, loop.time())
+            return h
+        return None
+
+    try:
+        if launch() is None:
+            raise NoProviders("все провайдеры разомкнуты")
+        while running:
+            # ждём первого ответа; пока ждём — не дольше хедж-задержки самого свежего
+            newest = max(running.values(), key=lambda v: v[2])
+            timeout = None
+            if options["HEDGE"] and queue and budget > 0:
+                timeout = max(0.0, newest[2] + newest[1].hedge_delay(options) - loop.time())
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                h = launch()
+                if h is not None:
+                    newest[1].hedged += 1
+                continue
+            winner = None
+            for task in done:
+                provider, h, started = running.pop(task)
+                elapsed = loop.time() - started
+                try:
+                    result = task.result()
+                except ProviderError as e:
+                    h.record(False, elapsed, options, str(e))
+                    last_error = e
+                    continue
+                except Exception as e:
+                    h.record(False, elapsed, options, str(e) or type(e).__name__)
+                    last_error = ProviderError(str(e) or type(e).__name__)
+                    continue
+                h.record(True, elapsed, options)
+                if winner is None:
+                    winner = provider, result
+                else:
+                    await _release(release, result)  # успели несколько — лишние закрываем
+            if winner is not None:
+                return winner
+            # все завершившиеся — с ошибкой: failover
+            if not running:
+                launch()
+        raise last_error or NoProviders("все провайдеры разомкнуты")
+    finally:
+        cancelled = []
+        for task, (provider, h, started) in running.items():
+            if task.done() and not task.cancelled() and task.exception() is None:
+                # успела ответить, но проиграла: успех учитываем, результат закрываем
+                h.record(True, loop.time() - started, options)
+                await _release(release, task.result())
+                continue
+            task.cancel()
+            h.abandon(loop.time() - started, options)
+            cancelled.append(task)
+        if cancelled:
+            # отмена могла опоздать: попытка уже успела вернуть результат
+            for result in await asyncio.gather(*cancelled, return_exceptions=True):
+                if not isinstance(result, BaseException):
+                    await _release(release, result)
+
+
+def status() -> list:
+    """Состояние провайдеров для /api/ai/providers/."""
+    options = conf()
+    return [
+        {"name": p.name, "weight": p.weight, "kinds": list(p.kinds), **health(p.name, options).snapshot(options)}
+        for p in providers()
+    ]
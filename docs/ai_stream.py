@@ -0,0 +1,262 @@
+"""
+Движок SSE-стримов генерации.
+
+- Дельты провайдера (часто по одному токену) склеиваются в кадры по окну
+  времени/размера: меньше write-вызовов и накладных расходов у прокси.
+- У каждой генерации есть id, кадры нумеруются (id: <генерация>:<номер>) и
+  хранятся в кольцевом буфере. Клиент, переподключившийся с Last-Event-ID,
+  дочитывает с места обрыва, без нового запроса к провайдеру.
+- Генерация не зависит от соединения клиента: после ухода всех подписчиков
+  она ждёт переподключения RESUME_GRACE секунд и только потом отменяется.
+- Пока новых кадров нет, подписчикам идут комментарии-heartbeat, чтобы
+  промежуточные прокси не буферизовали ответ и не рвали его по таймауту.
+- Одинаковые одновременные запросы подписываются на одну генерацию;
+  дочитывать её могут все присоединившиеся пользователи.
+
+Состояние, как и в ai_limits, хранится отдельно на каждый event loop.
+
+    AI_STREAM = {
+        "FRAME_WINDOW": 0.05,    # c, сколько копим дельты в кадр
+        "FRAME_MAX_CHARS": 1024, # кадр отправляется раньше, если стал длиннее
+        "BUFFER_FRAMES": 2048,   # размер кольцевого буфера кадров
+        "HEARTBEAT": 15,         # c без кадров до комментария ": ping"
+        "RESUME_GRACE": 30,      # c ждём переподключения, прежде чем отменить генерацию
+        "RESUME_TTL": 300,       # c храним завершённую генерацию для дочитывания
+    }
+"""
+import asyncio
+import uuid
+import weakref
+from collections import deque
+
+from django.conf import settings
+
+from . import ai_limits
+
+DEFAULTS = {
+    "FRAME_WINDOW": 0.05,
+    "FRAME_MAX_CHARS": 1024,
+    "BUFFER_FRAMES": 2048,
+    "HEARTBEAT": 15,
+    "RESUME_GRACE": 30,
+    "RESUME_TTL": 300,
+}
+
+_END = object()
+
+
+def conf() -> dict:
+    return {**DEFAULTS, **getattr(settings, "AI_STREAM", {})}
+
+
+def sse_frame(event: str, data: str, event_id: str = None) -> bytes:
+    # многострочные данные — несколькими data:, клиент склеит их через \n
+    head = f"id: {event_id}\n" if event_id else ""
+    lines = "".join(f"data: {line}\n" for line in data.split("\n"))
+    return f"{head}event: {event}\n{lines}\n".encode("utf-8")
+
+
+class ResumeError(Exception):
+    """Генерация не найдена, чужая или нужные кадры уже вытеснены из буфера."""
+
+
+class Generation:
+    def __init__(self, key, user_id, source, options, on_finish=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.user_id = user_id  # чей слот лимитера занят
+        self.users = {user_id}  # кому можно дочитывать (все, кто присоединился)
+        self.frames = deque(maxlen=options["BUFFER_FRAMES"])  # (seq, event, data)
+        self.seq = 0
+        self.done = False
+        self.subscribers = 0
+        self.options = options
+        self._changed = asyncio.Event()
+        self._on_finish = on_finish
+        self._grace = None
+        self.task = asyncio.ensure_future(self._pump(source))
+        self.task.add_done_callback(self._finished)
+
+    # ---------- генерация ----------
+
+    def _append(self, event, data):
+        self.seq += 1
+        self.frames.append((self.seq, event, data))
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _read(self, source, queue):
+        try:
+            async for item in source:
+                await queue.put(item)
+        finally:
+            await source.aclose()
+            await queue.put(_END)
+
+    async def _pump(self, source):
+        """Склеивает соседние дельты одного типа в кадры по окну времени/размера."""
+        window = self.options["FRAME_WINDOW"]
+        max_chars = self.options["FRAME_MAX_CHARS"]
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        reader = asyncio.ensure_future(self._read(source, queue))
+        event, parts, size, deadline = None, [], 0, None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    item = None
+                if item is None or item is _END or item[0] != event:
+                    if parts:
+                        self._append(event, "".join(parts))
+                    event, parts, size, deadline = None, [], 0, None
+                if item is _END:
+                    break
+                if item is None:
+                    continue
+                if event is None:
+                    event, deadline = item[0], loop.time() + window
+                parts.append(item[1])
+                size += len(item[1])
+                if size >= max_chars:
+                    self._append(event, "".join(parts))
+                    event, parts, size, deadline = None, [], 0, None
+        finally:
+            reader.cancel()
+
+    def _finished(self, task):
+        self.done = True
+        if self._on_finish:
+            self._on_finish(self)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    # ---------- подписчики ----------
+
+    def first_seq(self):
+        return self.frames[0][0] if self.frames else self.seq + 1
+
+    def event_id(self, seq):
+        return f"{self.id}:{seq}"
+
+    async def subscribe(self, after=0):
+        """
+        SSE-байты кадров с номерами > after, затем живые кадры и финальный done.
+        Без новых кадров дольше HEARTBEAT — комментарий ": ping".
+        """
+        self.subscribers += 1
+        if self._grace is not None:
+            self._grace.cancel()
+            self._grace = None
+        heartbeat = self.options["HEARTBEAT"]
+        try:
+            yield f"retry: 2000\n: generation {self.id}\n\n".encode()
+            while True:
+                changed = self._changed
+                for seq, event, data in list(self.frames):
+                    if seq > after:
+                        yield sse_frame(event, data, self.event_id(seq))
+                        after = seq
+                if self.done:
+                    yield sse_frame("done", "[DONE]", self.event_id(self.seq + 1))
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # ждём переподключения; не дождались — отменяем запрос к провайдеру
+                self._grace = asyncio.get_running_loop().call_later(
+                    self.options["RESUME_GRACE"], self._abandon
+                )
+
+    def _abandon(self):
+        self._grace = None
+        if self.subscribers == 0 and not self.done:
+            self.task.cancel()
+
+
+class _LoopState:
+    def __init__(self):
+        self.by_id = {}   # id -> Generation (живые и недавно завершённые)
+        self.by_key = {}  # ключ payload -> живая Generation (склейка одинаковых запросов)
+
+
+_states = weakref.WeakKeyDictionary()
+
+
+def _state() -> _LoopState:
+    loop = asyncio.get_running_loop()
+    state = _states.get(loop)
+    if state is None:
+        state = _states[loop] = _LoopState()
+    return state
+
+
+def reset():
+    """Сбрасывает состояние (тесты, смена настроек)."""
+    _states.clear()
+
+
+def get(generation_id):
+    return _state().by_id.get(generation_id)
+
+
+async def start(key, user_id, factory, limited=True):
+    """
+    Генерация для payload с ключом key: подписка на уже идущую такую же
+    (если её начало ещё в буфере) или новая. factory() — async-генератор
+    пар (event, data). Новая генерация занимает слот лимитера до конца
+    (limited=False — без слота: повтор из кэша провайдера не нагружает);
+    Overloaded выбрасывается до начала стрима, чтобы успеть ответить 429.
+    """
+    state = _state()
+    options = conf()
+    gen = state.by_key.get(key)
+    if gen is None or gen.first_seq() > 1:
+        limiter = ai_limits.limiter() if limited else None
+        if limiter is not None:
+            await limiter.acquire(user_id)
+            # пока ждали слот, такую же генерацию мог запустить соседний запрос
+            gen = state.by_key.get(key)
+            if gen is not None and gen.first_seq() == 1:
+                limiter.release(user_id)
+                gen.users.add(user_id)
+                return gen
+
+        loop = asyncio.get_running_loop()
+
+        def finish(g):
+            if state.by_key.get(key) is g:
+                del state.by_key[key]
+            if limiter is not None:
+                limiter.release(user_id)
+            loop.call_later(options["RESUME_TTL"], state.by_id.pop, g.id, None)
+
+        gen = Generation(key, user_id, factory(), options, on_finish=finish)
+        state.by_id[gen.id] = gen
+        state.by_key[key] = gen
+    gen.users.add(user_id)
+    return gen
+
+
+def resume(user_id, last_event_id):
+    """
+    Генерация и номер последнего полученного кадра по Last-Event-ID
+    вида "<генерация>:<номер>"; ResumeError — если дочитать нельзя.
+    """
+    gen_id, _, seq = (last_event_id or "").strip().partition(":")
+    try:
+        after = int(seq)
+    except ValueError:
+        raise ResumeError("некорректный Last-Event-ID") from None
+    gen = _state().by_id.get(gen_id)
+    if gen is None or user_id not in gen.users:
+        raise ResumeError("генерация не найдена или истекла")
+    if after + 1 < gen.first_seq():
+        raise ResumeError("кадры уже вытеснены из буфера")
+    return gen, after
@@ -4,3 +4,17 @@ from django.apps import AppConfig
 class DocsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'docs'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+
+        from . import authentication, metrics
+
+        # SQL каждого соединения попадает в метрики запроса (docs/metrics.py)
+        connection_created.connect(metrics.instrument_connection, dispatch_uid="docs-metrics")
+        # смена пароля/деактивация сбрасывает кэш аутентификации (docs/authentication.py)
+        User = get_user_model()
+        post_save.connect(authentication._on_user_saved, sender=User, dispatch_uid="docs-auth-cache")
+        post_delete.connect(authentication._on_user_saved, sender=User, dispatch_uid="docs-auth-cache-delete")
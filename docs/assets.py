@@ -0,0 +1,433 @@
+"""
+Статика: сборка для продакшена и быстрая отдача.
+
+Сборка — collectstatic с CompressedManifestStorage (STORAGES["staticfiles"]):
+файлы получают имена с хэшем содержимого (app.3f2c….js, staticfiles.json),
+{% static %} в шаблонах ссылается на них. Копии с хэшем из MINIFY
+минифицируются (пробелы и комментарии; строки, шаблоны и регулярные
+выражения JS не трогаются), рядом пишутся .gz и, если установлен пакет
+brotli, .br — только когда сжатие заметно уменьшает файл.
+
+Отдача — StaticFiles (ASGI) и StaticFilesWSGI: запросы к STATIC_URL
+обслуживаются из STATIC_ROOT до Django (без middleware и URL-роутинга).
+Выбирается сжатый вариант по Accept-Encoding, тело уходит через
+http.response.pathsend / zerocopysend (ASGI) или wsgi.file_wrapper (sendfile
+у gunicorn), иначе — чтением кусками. Имена с хэшем кэшируются клиентом
+навсегда (immutable), остальные — с ревалидацией по ETag.
+
+    STATIC_ASSETS = {"SERVE": None, "MINIFY": ["frontend/"]}
+
+SERVE None — отдавать, когда DEBUG выключен (в разработке статику отдаёт
+runserver из исходников). Файла нет — запрос уходит в Django как обычно.
+"""
+import asyncio
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.utils.http import http_date
+
+from .lru import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULTS = {
+    "SERVE": None,
+    "MINIFY": ["frontend/"],  # префиксы путей; сторонние (admin, DRF) — как есть
+    "COMPRESS_EXTENSIONS": [".js", ".css", ".html", ".svg", ".json", ".txt", ".map", ".xml"],
+    "COMPRESS_MIN_SIZE": 256,
+    "COMPRESS_MIN_RATIO": 0.95,  # вариант больше этой доли исходного не пишем
+    "GZIP_LEVEL": 9,
+    "BROTLI_QUALITY": 11,
+}
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+CHUNK_SIZE = 64 * 1024
+
+_HASHED_RE = re.compile(r"\.[0-9a-f]{12}\.[^./]+$")
+
+
+def conf() -> dict:
+    return {**DEFAULTS, **getattr(settings, "STATIC_ASSETS", {})}
+
+
+# --- минификация ---
+
+_JS_WORD_RE = re.compile(r"[\w$\u0080-\uffff]")
+# после этих слов «/» — начало регулярного выражения, а не деление
+_JS_REGEX_KEYWORDS = {
+    "return", "typeof", "instanceof", "in", "of", "new", "delete", "void", "throw", "case", "do", "else",
+    "yield", "await",
+}
+
+
+def _js_string(src, i):
+    """Конец строкового литерала, начатого в src[i]."""
+    quote, i = src[i], i + 1
+    while i < len(src) and src[i] != quote:
+        i += 2 if src[i] == "\\" else 1
+    return i + 1
+
+
+def _js_template(src, i):
+    """Конец шаблона `…${…}…`, начатого в src[i]; выражения внутри — с учётом вложенности."""
+    i += 1
+    while i < len(src) and src[i] != "`":
+        if src[i] == "\\":
+            i += 2
+        elif src.startswith("${", i):
+            i, depth = i + 2, 1
+            while i < len(src) and depth:
+                c = src[i]
+                if c in "'\"":
+                    i = _js_string(src, i)
+                    continue
+                if c == "`":
+                    i = _js_template(src, i)
+                    continue
+                depth += {"{": 1, "}": -1}.get(c, 0)
+                i += 1
+        else:
+            i += 1
+    return i + 1
+
+
+def _js_regex(src, i):
+    """Конец литерала /…/flags, начатого в src[i]."""
+    i, in_class = i + 1, False
+    while i < len(src) and src[i] != "\n":
+        c = src[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "[":
+            in_class = True
+        elif c == "]":
+            in_class = False
+        elif c == "/" and not in_class:
+            break
+        i += 1
+    i += 1
+    while i < len(src) and _JS_WORD_RE.match(src[i]):
+        i += 1
+    return i
+
+
+def minify_js(src: str) -> str:
+    """
+    Консервативная минификация JS: убирает комментарии, отступы и пробелы
+    между знаками. Переводы строк остаются там, где от них может зависеть
+    автоподстановка «;», — семантика не меняется.
+    """
+    out, i, n = [], 0, len(src)
+    space = ""  # пропущенный пробельный промежуток: "", " " или "\n"
+    last, word = "", ""  # последний выведенный символ и слово
+
+    def emit(token):
+        nonlocal space, last
+        first = token[0]
+        if space == "\n" and last and last not in "{([,;" and first not in ")]},;":
+            out.append("\n")
+        elif space and last and (
+            (_JS_WORD_RE.match(last) and _JS_WORD_RE.match(first)) or (last in "+-" and first == last)
+        ):
+            out.append(" ")
+        out.append(token)
+        space, last = "", token[-1]
+
+    while i < n:
+        c = src[i]
+        if c in " \t\r\n\f\v\u00a0\ufeff":
+            if c == "\n" or space != "\n":
+                space = "\n" if c == "\n" else " "
+            i += 1
+        elif src.startswith("//", i):
+            end = src.find("\n", i)
+            i = n if end < 0 else end
+        elif src.startswith("/*", i):
+            end = src.find("*/", i + 2)
+            end = n if end < 0 else end + 2
+            if "\n" in src[i:end]:
+                space = "\n"
+            elif not space:
+                space = " "
+            i = end
+        elif c in "'\"":
+            end = _js_string(src, i)
+            emit(src[i:end])
+            word, i = "", end
+        elif c == "`":
+            end = _js_template(src, i)
+            emit(src[i:end])
+            word, i = "", end
+        elif c == "/" and (not last or last in "(,=:[!&|?{};~+-*%<>^\n" or (word in _JS_REGEX_KEYWORDS and last == word[-1])):
+            end = _js_regex(src, i)
+            emit(src[i:end])
+            word, i = "", end
+        elif _JS_WORD_RE.match(c):
+            end = i + 1
+            while end < n and _JS_WORD_RE.match(src[end]):
+                end += 1
+            word = src[i:end]
+            emit(word)
+            i = end
+        else:
+            emit(c)
+            word, i = "", i + 1
+    return "".join(out).strip() + "\n"
+
+
+_CSS_TOKEN_RE = re.compile(
+    r"""/\*.*?(?:\*/|$)|"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|\s+|[{};,>:!()]|[^\s"'/{};,>:!()]+|/""",
+    re.DOTALL,
+)
+
+
+def minify_css(src: str) -> str:
+    """Комментарии и лишние пробелы; пробел перед «:» (потомок + псевдокласс) сохраняется."""
+    out = []
+    for token in _CSS_TOKEN_RE.findall(src):
+        if token.startswith("/*"):
+            continue
+        if token.isspace():
+            if out and out[-1] not in " {};,>:(":
+                out.append(" ")
+            continue
+        if out and out[-1] == " " and token in "{};,>!)":
+            out.pop()
+        if token == "}" and out and out[-1] == ";":
+            out.pop()
+        out.append(token)
+    return "".join(out).strip() + "\n"
+
+
+MINIFIERS = {".js": minify_js, ".css": minify_css}
+
+
+# --- сборка ---
+
+def compress_file(path, options=None) -> list:
+    """Пишет path.gz (и path.br) рядом с файлом; возвращает список записанных."""
+    options = options or conf()
+    with open(path, "rb") as f:
+        data = f.read()
+    written = []
+    if len(data) < options["COMPRESS_MIN_SIZE"]:
+        return written
+    variants = [(".gz", lambda d: gzip.compress(d, options["GZIP_LEVEL"], mtime=0))]
+    if brotli is not None:
+        variants.append((".br", lambda d: brotli.compress(d, quality=options["BROTLI_QUALITY"])))
+    for suffix, compress in variants:
+        packed = compress(data)
+        target = path + suffix
+        if len(packed) <= len(data) * options["COMPRESS_MIN_RATIO"]:
+            with open(target, "wb") as f:
+                f.write(packed)
+            written.append(target)
+        elif os.path.exists(target):
+            os.remove(target)  # устаревший вариант от прошлой сборки
+    return written
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    """Имена с хэшем + минификация копий с хэшем + .gz/.br рядом."""
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # collectstatic не запускали (нет манифеста или файла в STATIC_ROOT):
+            # имя без хэша вместо 500 на каждой странице с {% static %}
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        # копии с хэшем переписываются за несколько проходов (url() в CSS) — ждём последнего
+        results = list(super().post_process(paths, dry_run, **options))
+        if not dry_run:
+            self.optimize(paths)
+        yield from results
+
+    def optimize(self, paths):
+        options = conf()
+        for name in paths:
+            ext = posixpath.splitext(name)[1].lower()
+            hashed = self.hashed_files.get(self.hash_key(self.clean_name(name)))
+            if hashed and ext in MINIFIERS and any(name.startswith(p) for p in options["MINIFY"]):
+                with self.open(hashed) as f:
+                    source = f.read().decode("utf-8")
+                minified = MINIFIERS[ext](source)
+                with open(self.path(hashed), "w", encoding="utf-8") as f:
+                    f.write(minified)
+            if ext in options["COMPRESS_EXTENSIONS"]:
+                for target in {name, hashed} - {None}:
+                    compress_file(self.path(target), options)
+
+
+# --- отдача ---
+
+class Asset:
+    __slots__ = ("path", "size", "headers")
+
+    def __init__(self, path, size, headers):
+        self.path, self.size, self.headers = path, size, headers
+
+
+def _accepts(accept_encoding: str) -> set:
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.strip())
+    return accepted
+
+
+def _variant(root, name, coding, suffix):
+    path = os.path.join(root, name + suffix)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    content_type, _ = mimetypes.guess_type(name)
+    if content_type and (content_type.startswith("text/") or content_type in ("application/javascript", "image/svg+xml")):
+        content_type += "; charset=utf-8"
+    headers = [
+        (b"content-type", (content_type or "application/octet-stream").encode()),
+        (b"content-length", str(st.st_size).encode()),
+        (b"cache-control", (IMMUTABLE if _HASHED_RE.search(name) else REVALIDATE).encode()),
+        (b"last-modified", http_date(st.st_mtime).encode()),
+        (b"etag", f'"{st.st_mtime_ns:x}-{st.st_size:x}{"-" + coding if coding else ""}"'.encode()),
+    ]
+    if coding:
+        headers.append((b"content-encoding", coding.encode()))
+    if coding or any(os.path.exists(os.path.join(root, name + s)) for _, s in ENCODINGS):
+        headers.append((b"vary", b"Accept-Encoding"))
+    return Asset(path, st.st_size, headers)
+
+
+# найденные файлы с хэшем в имени: содержимое под таким именем не меняется, stat не нужен
+_immutable = LRUCache(maxsize=4096)
+
+
+def find(path: str, accept_encoding: str = ""):
+    """
+    URL-путь → Asset лучшего варианта для Accept-Encoding или None.
+    Путь — внутри STATIC_URL; выход за STATIC_ROOT и сами .gz/.br отклоняются.
+    """
+    prefix = settings.STATIC_URL
+    if not path.startswith(prefix) or not settings.STATIC_ROOT:
+        return None
+    name = posixpath.normpath(unquote(path[len(prefix):])).lstrip("/")
+    if name in ("", ".") or name.startswith("..") or "\x00" in name or name.endswith((".gz", ".br")):
+        return None
+    root, immutable = str(settings.STATIC_ROOT), bool(_HASHED_RE.search(name))
+    accepted = _accepts(accept_encoding)
+    for coding, suffix in [(c, s) for c, s in ENCODINGS if c in accepted] + [("", "")]:
+        key = (root, name, coding)
+        asset = _immutable.get(key) if immutable else None
+        if asset is None:
+            asset = _variant(root, name, coding, suffix)
+            if asset is not None and immutable:
+                _immutable.set(key, asset)
+        if asset is not None:
+            return asset
+    return None
+
+
+def _not_modified(asset, if_none_match: str) -> bool:
+    etag = dict(asset.headers)[b"etag"].decode()
+    return if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))
+
+
+def _serving(method) -> bool:
+    serve = conf()["SERVE"]
+    if serve is None:
+        serve = not settings.DEBUG
+    return serve and method in ("GET", "HEAD")
+
+
+class StaticFiles:
+    """ASGI-обёртка: STATIC_URL — из STATIC_ROOT, остальное — в app."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        asset = None
+        if scope["type"] == "http" and _serving(scope["method"]):
+            headers = {k: v for k, v in scope.get("headers", ()) if k in (b"accept-encoding", b"if-none-match")}
+            asset = find(scope["path"], headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if asset is None:
+            return await self.app(scope, receive, send)
+        if_none_match = headers.get(b"if-none-match", b"").decode("latin-1")
+        if if_none_match and _not_modified(asset, if_none_match):
+            keep = (b"cache-control", b"etag", b"vary", b"last-modified")
+            await send({"type": "http.response.start", "status": 304,
+                        "headers": [h for h in asset.headers if h[0] in keep]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": 200, "headers": asset.headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        extensions = scope.get("extensions") or {}
+        if "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": asset.path})
+            return
+        with open(asset.path, "rb") as f:
+            if "http.response.zerocopysend" in extensions:
+                await send({"type": "http.response.zerocopysend", "file": f})
+                return
+            if asset.size <= CHUNK_SIZE:
+                # типичный файл после сжатия: одно чтение без пула потоков
+                await send({"type": "http.response.body", "body": f.read()})
+                return
+            while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+
+class StaticFilesWSGI:
+    """WSGI-обёртка: тело через wsgi.file_wrapper (sendfile у gunicorn)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        method = environ.get("REQUEST_METHOD", "GET")
+        asset = None
+        if _serving(method):
+            path = environ.get("PATH_INFO", "").encode("latin-1").decode("utf-8", "replace")
+            asset = find(environ.get("SCRIPT_NAME", "") + path, environ.get("HTTP_ACCEPT_ENCODING", ""))
+        if asset is None:
+            return self.app(environ, start_response)
+        headers = [(k.decode(), v.decode()) for k, v in asset.headers]
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH", "")
+        if if_none_match and _not_modified(asset, if_none_match):
+            keep = ("cache-control", "etag", "vary", "last-modified")
+            start_response("304 Not Modified", [h for h in headers if h[0] in keep])
+            return []
+        start_response("200 OK", headers)
+        if method == "HEAD":
+            return []
+        f = open(asset.path, "rb")
+        wrapper = environ.get("wsgi.file_wrapper")
+        if wrapper is not None:
+            return wrapper(f, CHUNK_SIZE)
+        return _read_chunks(f)
+
+
+def _read_chunks(f):
+    with f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
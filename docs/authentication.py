@@ -0,0 +1,170 @@
+"""
+JWT-аутентификация с кэшем проверенных токенов.
+
+simplejwt на каждый запрос проверяет подпись и читает пользователя из БД —
+это лишний SELECT на каждое автосохранение и AI-вызов. Здесь проверенный
+токен и пользователь кладутся в ограниченный LRU-кэш на TTL секунд (но не
+дольше срока жизни токена); повторный запрос с тем же токеном обходится
+без криптографии и без БД.
+
+Инвалидация:
+- сохранение/удаление пользователя (смена пароля, деактивация) — сигналом;
+  записи, закэшированные до изменения, больше не используются;
+- отзыв токена (revoke_token, POST /api/auth/logout/) — jti попадает в
+  локальный список и в Django-кэш, который проверяется при промахе.
+Кэш — на процесс: в другом процессе изменение видно не позже чем через TTL
+(или сразу, если пользователь сохраняется через ORM в этом же процессе).
+Массовый .update() сигналов не шлёт — тоже не дольше TTL.
+
+STATELESS_READS: для безопасных методов (GET/HEAD/OPTIONS) пользователь не
+читается из БД вовсе — берётся user_id из подписанного токена. Только для
+вью, чьим разрешениям хватает user.pk (STATELESS_PERMISSIONS): IsAdminUser
+и прочим нужны поля пользователя, там — полный путь. Если пользователь
+менялся в этом процессе после выдачи токена, тоже идём полным путём.
+Деактивация в другом процессе не видна до истечения токена, поэтому режим
+выключен по умолчанию и годится при коротком ACCESS_TOKEN_LIFETIME.
+
+    AUTH_CACHE = {"TTL": 60, "MAX_ENTRIES": 10000, "STATELESS_READS": False}
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .lru import LRUCache
+from .permissions import IsOwner
+
+DEFAULTS = {"TTL": 60, "MAX_ENTRIES": 10000, "STATELESS_READS": False}
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+REVOKED_KEY = "docs:jwt-revoked:{}"
+# разрешения, которым хватает user.pk: у User(pk=…) is_authenticated — True, прочие поля пустые
+STATELESS_PERMISSIONS = (AllowAny, IsAuthenticated, IsOwner)
+
+
+def conf() -> dict:
+    return {**DEFAULTS, **getattr(settings, "AUTH_CACHE", {})}
+
+
+class _Entry:
+    __slots__ = ("user", "token", "expires", "cached_at")
+
+    def __init__(self, user, token, expires):
+        self.user = user
+        self.token = token
+        self.expires = expires
+        self.cached_at = time.time()
+
+
+_caches = {}
+
+
+def _cache(name):
+    """LRU-кэши создаются при первом обращении, с размером и TTL из настроек."""
+    c = _caches.get(name)
+    if c is None:
+        options = conf()
+        if name == "tokens":
+            c = LRUCache(options["MAX_ENTRIES"], options["TTL"])
+        else:
+            # метки держим, пока живы выданные до них access-токены
+            lifetime = api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+            c = LRUCache(options["MAX_ENTRIES"], max(options["TTL"], lifetime))
+        c = _caches.setdefault(name, c)
+    return c
+
+
+def reset():
+    """Сбрасывает кэши (тесты, смена настроек)."""
+    _caches.clear()
+
+
+def user_changed(user_id):
+    """Записи и stateless-доступ по токенам, выданным раньше, больше не доверяются."""
+    _cache("changed").set(user_id, time.time())
+
+
+def revoke_token(token):
+    """Отзывает access-токен до истечения его срока."""
+    jti = token.get(api_settings.JTI_CLAIM)
+    if not jti:
+        return
+    ttl = max(1, int(token["exp"] - time.time()))
+    _cache("revoked").set(jti, True)
+    cache.set(REVOKED_KEY.format(jti), True, ttl)
+
+
+def _is_revoked(jti):
+    return bool(jti) and (_cache("revoked").get(jti) or cache.get(REVOKED_KEY.format(jti)))
+
+
+def _on_user_saved(sender, instance, created=False, **kwargs):
+    if not created:
+        user_changed(instance.pk)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication с кэшем токен → пользователь и режимом stateless для чтения."""
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        options = conf()
+        tokens = _cache("tokens")
+        entry = tokens.get(raw_token)
+        if entry is not None and self._entry_valid(entry):
+            return entry.user, entry.token
+
+        token = self.get_validated_token(raw_token)
+        if _is_revoked(token.get(api_settings.JTI_CLAIM)):
+            raise InvalidToken(_("Token is revoked"))
+        if options["STATELESS_READS"] and request.method in SAFE_METHODS and self._stateless_view(request):
+            user = self._stateless_user(token)
+            if user is not None:
+                return user, token
+
+        user = self.get_user(token)
+        tokens.set(raw_token, _Entry(user, token, token["exp"]))
+        return user, token
+
+    @staticmethod
+    def _entry_valid(entry):
+        if entry.expires <= time.time():
+            return False
+        changed = _cache("changed").get(entry.user.pk)
+        if changed is not None and changed >= entry.cached_at:
+            return False
+        return not _cache("revoked").get(entry.token.get(api_settings.JTI_CLAIM))
+
+    @staticmethod
+    def _stateless_view(request):
+        """Разрешениям вью хватает user.pk; обычные async-вью (не DRF) смотрят только pk."""
+        view = (getattr(request, "parser_context", None) or {}).get("view")
+        if view is None:
+            return True
+        return all(type(permission) in STATELESS_PERMISSIONS for permission in view.get_permissions())
+
+    def _stateless_user(self, token):
+        """Пользователь из claim'ов без БД; None — если ему после выдачи токена что-то меняли."""
+        try:
+            user_id = token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from None
+        User = get_user_model()
+        user_id = User._meta.get_field(api_settings.USER_ID_FIELD).to_python(user_id)  # в claim'е — строка
+        changed = _cache("changed").get(user_id)
+        if changed is not None and changed >= token.get("iat", 0):
+            return None
+        user = User(**{api_settings.USER_ID_FIELD: user_id})
+        user._state.adding = False
+        return user
@@ -0,0 +1,308 @@
+"""
+Буфер автосохранений с отложенной записью (write-behind).
+
+Без буфера каждое автосохранение (PATCH /content/) — синхронный UPDATE и
+INSERT версии; на SQLite писатели выстраиваются в очередь на блокировке
+файла и при плотной правке ловят «database is locked». С буфером правка
+применяется к состоянию документа в памяти процесса и дописывается строкой
+в локальный журнал, а в БД уходит только последнее состояние: когда
+документ затих на IDLE секунд или не позже MAX_DELAY после первой
+несброшенной правки, пачками по BATCH_SIZE документов в транзакции, с одной
+версией на сброс вместо версии на каждое сохранение.
+
+Детали документа, экспорт, ETag и AI-контекст читаются через overlay() —
+с учётом буфера; список, поиск и история догоняют после сброса. Полное
+обновление, удаление и запись результата AI-генерации сначала сбрасывают
+документ (flush_document), затем пишут в БД как обычно.
+
+Журнал — JSON-строки с полным состоянием документа; побеждает старшая
+ревизия. После каждого сброса он переписывается снимком несброшенного
+(os.replace) и не растёт. После падения процесса журнал читается при
+первом обращении к буферу: состояние сразу видно чтению, а в БД его
+дописывает фоновый поток (условный UPDATE по ревизии — уже записанное не
+повторяется). FSYNC: True — журнал переживает и отключение питания, ценой
+fsync на каждое сохранение; без JOURNAL буфер только в памяти.
+
+Буфер — на процесс: включать при одном процессе веб-сервера (как и
+требует SQLite), иначе другие процессы читают устаревшее.
+
+    AUTOSAVE = {"ENABLED": True, "JOURNAL": BASE_DIR / "autosave.journal", "IDLE": 1.0, ...}
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import blocks
+from .models import Document
+from .search import get_backend as get_search_backend
+from .versioning import create_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": False,
+    "JOURNAL": None,
+    "FSYNC": False,
+    "IDLE": 1.0,
+    "MAX_DELAY": 5.0,
+    "BATCH_SIZE": 50,
+    "TICK": 0.25,
+}
+FIELDS = ("title", "content_html", "revision", "updated_at")
+
+
+def conf() -> dict:
+    return {**DEFAULTS, **getattr(settings, "AUTOSAVE", {})}
+
+
+def enabled() -> bool:
+    return bool(conf()["ENABLED"])
+
+
+class Pending:
+    """Несброшенное состояние документа."""
+
+    __slots__ = ("id", "owner_id", "title", "content_html", "revision", "updated_at", "dirty_since", "touched")
+
+    def __init__(self, id, owner_id, title, content_html, revision, updated_at, dirty_since=None):
+        self.id = id
+        self.owner_id = owner_id
+        self.title = title
+        self.content_html = content_html
+        self.revision = revision
+        self.updated_at = updated_at
+        self.touched = time.monotonic()
+        self.dirty_since = dirty_since if dirty_since is not None else self.touched
+
+    def as_record(self) -> dict:
+        return {
+            "id": self.id, "owner_id": self.owner_id, "title": self.title, "content_html": self.content_html,
+            "revision": self.revision, "updated_at": self.updated_at.isoformat(),
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        record = dict(record, updated_at=datetime.fromisoformat(record["updated_at"]))
+        return cls(**record)
+
+    def document(self) -> Document:
+        doc = Document(pk=self.id, owner_id=self.owner_id, **{name: getattr(self, name) for name in FIELDS})
+        doc._state.adding = False
+        return doc
+
+
+class Buffer:
+    def __init__(self, options=None):
+        self.options = options or conf()
+        self._lock = threading.Lock()         # _pending и журнал
+        self._flush_lock = threading.Lock()   # один сброс за раз
+        self._pending = {}
+        self._journal = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    # ---------- жизненный цикл ----------
+
+    def open(self):
+        """Восстанавливает несброшенное из журнала и запускает фоновый сброс."""
+        path = self.options["JOURNAL"]
+        if path:
+            for entry in self._read_journal(path):
+                self._pending[entry.id] = entry
+            if self._pending:
+                logger.warning("autosave: %s documents recovered from journal", len(self._pending))
+            with self._lock:
+                self._rewrite_journal()
+        self._thread = threading.Thread(target=self._run, name="autosave-flush", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        """Останавливает поток, сбрасывает всё и закрывает журнал."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        try:
+            self.flush(force=True)
+        finally:
+            with self._lock:
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+
+    def _run(self):
+        while not self._stopping.wait(self.options["TICK"]):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("autosave flush failed")
+            finally:
+                close_old_connections()
+
+    # ---------- журнал ----------
+
+    @staticmethod
+    def _read_journal(path):
+        latest = {}
+        try:
+            f = open(path, encoding="utf-8")
+        except FileNotFoundError:
+            return []
+        with f:
+            for line in f:
+                try:
+                    entry = Pending.from_record(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    break  # оборванная последняя строка: процесс упал посреди записи
+                previous = latest.get(entry.id)
+                if previous is None or entry.revision >= previous.revision:
+                    latest[entry.id] = entry
+        return list(latest.values())
+
+    def _append(self, entry):
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(entry.as_record(), ensure_ascii=False) + "\n")
+        self._journal.flush()
+        if self.options["FSYNC"]:
+            os.fsync(self._journal.fileno())
+
+    def _rewrite_journal(self):
+        """Журнал ← снимок несброшенного; вызывать под self._lock."""
+        path = str(self.options["JOURNAL"])
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self._pending.values():
+                f.write(json.dumps(entry.as_record(), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if self._journal is not None:
+            self._journal.close()
+        os.replace(tmp, path)
+        self._journal = open(path, "a", encoding="utf-8")
+
+    # ---------- чтение и запись ----------
+
+    def get(self, pk):
+        with self._lock:
+            return self._pending.get(pk)
+
+    def put(self, doc, base_revision, title, content_html):
+        """
+        Принимает правку поверх ревизии base_revision.
+        Возвращает новое состояние или None, если ревизия устарела.
+        """
+        with self._lock:
+            current = self._pending.get(doc.pk)
+            revision = current.revision if current is not None else doc.revision
+            if revision != base_revision:
+                return None
+            entry = Pending(
+                doc.pk, doc.owner_id, title, content_html, base_revision + 1, timezone.now(),
+                dirty_since=current.dirty_since if current is not None else None,
+            )
+            self._append(entry)
+            self._pending[doc.pk] = entry
+        return entry
+
+    def flush(self, force=False, ids=None) -> int:
+        """Сбрасывает в БД затихшие документы (force — все, ids — только эти); возвращает их число."""
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._lock:
+                due = [
+                    e for e in self._pending.values()
+                    if (ids is None or e.id in ids) and (
+                        force or ids is not None
+                        or now - e.touched >= self.options["IDLE"]
+                        or now - e.dirty_since >= self.options["MAX_DELAY"]
+                    )
+                ]
+            if not due:
+                return 0
+            size = self.options["BATCH_SIZE"]
+            for i in range(0, len(due), size):
+                batch = due[i:i + size]
+                self._write(batch)
+                with self._lock:
+                    for entry in batch:
+                        # правка, пришедшая во время записи, остаётся в буфере
+                        if self._pending.get(entry.id) is entry:
+                            del self._pending[entry.id]
+            if self.options["JOURNAL"]:
+                with self._lock:
+                    self._rewrite_journal()
+            return len(due)
+
+    @staticmethod
+    def _write(batch):
+        docs = []
+        with transaction.atomic():
+            for entry in batch:
+                # запись в обход буфера с той же или более новой ревизией не затираем
+                updated = blocks.update(
+                    Document.objects.filter(pk=entry.id, revision__lt=entry.revision),
+                    entry.id,
+                    {name: getattr(entry, name) for name in FIELDS},
+                )
+                if updated:
+                    doc = entry.document()
+                    create_version(doc, doc.content_html, coalesce=True)
+                    docs.append(doc)
+        if docs:
+            get_search_backend().index_documents(docs)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer() -> Buffer:
+    """Буфер процесса; при первом обращении — восстановление из журнала и запуск сброса."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = Buffer(conf()).open()
+                atexit.register(_buffer.close)
+    return _buffer
+
+
+def reset():
+    """Закрывает буфер процесса (со сбросом); следующий get_buffer() откроет новый."""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            atexit.unregister(_buffer.close)
+            _buffer.close()
+            _buffer = None
+
+
+def overlay(doc):
+    """Подставляет в документ несброшенное состояние из буфера."""
+    if not enabled():
+        return doc
+    entry = get_buffer().get(doc.pk)
+    if entry is not None:
+        for name in FIELDS:
+            setattr(doc, name, getattr(entry, name))
+    return doc
+
+
+def flush_document(pk):
+    """Перед записью в обход буфера: его состояние документа — в БД."""
+    if not enabled():
+        return
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return
+    get_buffer().flush(ids={pk})
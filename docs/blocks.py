@@ -0,0 +1,194 @@
+"""
+Блочное хранение больших документов.
+
+Документ от THRESHOLD символов хранится не строкой content_html, а
+упорядоченными блоками DocumentBlock (позиция, SHA-1, HTML); колонка
+content_html у него пуста, Document.chunked = True. Граница блока — перед
+заголовком h1/h2 и после разрыва страницы верхнего уровня (раздел/страница), а
+если раздел длинный — перед любым элементом верхнего уровня после
+BLOCK_SIZE символов. Склейка блоков байт в байт равна исходному HTML.
+
+Сохранение сравнивает хэши старых и новых блоков (difflib по спискам
+хэшей): переписываются только изменившиеся блоки, у сдвинутых меняется
+позиция, неизменные не трогаются. Полное содержимое собирается из блоков
+при первом обращении к doc.content_html (models.BlockContent), так что
+остальной код работает с документом как раньше. GET /documents/{id}/blocks/
+отдаёт диапазон блоков — первая отрисовка без загрузки всего документа.
+
+    DOCS_BLOCKS = {"THRESHOLD": 256 * 1024, "BLOCK_SIZE": 16 * 1024, "PAGE_SIZE": 20}
+
+THRESHOLD None — блочное хранение выключено (существующие блочные
+документы переходят в строку при следующем сохранении).
+"""
+import hashlib
+import re
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db.models import F
+
+from .models import Document, DocumentBlock
+
+DEFAULTS = {
+    "THRESHOLD": 256 * 1024,
+    "BLOCK_SIZE": 16 * 1024,
+    "PAGE_SIZE": 20,
+    "MAX_PAGE_SIZE": 200,
+}
+SECTION_TAGS = {"h1", "h2"}
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr",
+}
+# комментарий и script/style целиком (внутри может быть «<»), иначе — тег
+_TAG_RE = re.compile(
+    r"<!--.*?(?:-->|$)|<(script|style)\b.*?(?:</\1\s*>|$)|<(/?)([a-zA-Z][\w:-]*)\b[^>]*?(/?)>",
+    re.DOTALL | re.IGNORECASE,
+)
+_PAGE_BREAK_RE = re.compile(r"""<div\b[^>]*\bclass=["'][^"']*\bpage-break\b""", re.IGNORECASE)
+
+
+def conf() -> dict:
+    return {**DEFAULTS, **getattr(settings, "DOCS_BLOCKS", {})}
+
+
+def should_chunk(content_html: str, options=None) -> bool:
+    threshold = (options or conf())["THRESHOLD"]
+    return threshold is not None and len(content_html or "") >= threshold
+
+
+def digest(block: str) -> str:
+    return hashlib.sha1(block.encode("utf-8")).hexdigest()
+
+
+def split(content_html: str, block_size=None) -> list:
+    """HTML → блоки по разделам/страницам; "".join(split(html)) == html."""
+    if not content_html:
+        return []
+    block_size = block_size or conf()["BLOCK_SIZE"]
+    cuts, depth, start, page_break = [0], 0, 0, False
+    for m in _TAG_RE.finditer(content_html):
+        closing, name = m.group(2), m.group(3)
+        if name is None:
+            continue  # комментарий или script/style — глубину не меняют
+        name = name.lower()
+        if closing:
+            if name not in VOID_TAGS:
+                depth = max(0, depth - 1)
+            continue
+        at = m.start()
+        if depth == 0:
+            # раздел начинается заголовком, страница — после разрыва страницы
+            if at > start and (page_break or name in SECTION_TAGS or at - start >= block_size):
+                cuts.append(at)
+                start = at
+            page_break = bool(_PAGE_BREAK_RE.match(m.group(0)))
+        if name not in VOID_TAGS and not m.group(4):
+            depth += 1
+    cuts.append(len(content_html))
+    return [content_html[a:b] for a, b in zip(cuts, cuts[1:])]
+
+
+def assemble(document_id) -> str:
+    return "".join(
+        DocumentBlock.objects.filter(document_id=document_id).order_by("position").values_list("html", flat=True)
+    )
+
+
+def sync(document_id, content_html: str) -> int:
+    """
+    Приводит блоки документа к content_html ("" — удалить все); вызывать в
+    транзакции. Возвращает число записанных (новых и изменённых) блоков.
+    """
+    blocks = DocumentBlock.objects.filter(document_id=document_id)
+    new = split(content_html)
+    if not new:
+        blocks.delete()
+        return 0
+    hashes = [digest(b) for b in new]
+    old = list(blocks.order_by("position").values_list("pk", "hash"))
+    matcher = SequenceMatcher(None, [h for _, h in old], hashes, autojunk=False)
+    created, stale, written = [], [], 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            if i1 != j1:
+                # неизменные блоки только сдвигаются: один UPDATE на участок
+                DocumentBlock.objects.filter(pk__in=[pk for pk, _ in old[i1:i2]]).update(
+                    position=F("position") + (j1 - i1)
+                )
+            continue
+        reused = min(i2 - i1, j2 - j1)
+        for k in range(reused):
+            DocumentBlock.objects.filter(pk=old[i1 + k][0]).update(
+                position=j1 + k, hash=hashes[j1 + k], html=new[j1 + k]
+            )
+        stale.extend(pk for pk, _ in old[i1 + reused:i2])
+        created.extend(
+            DocumentBlock(document_id=document_id, position=j, hash=hashes[j], html=new[j])
+            for j in range(j1 + reused, j2)
+        )
+        written += j2 - j1
+    if stale:
+        DocumentBlock.objects.filter(pk__in=stale).delete()
+    if created:
+        DocumentBlock.objects.bulk_create(created)
+    return written
+
+
+def update(queryset, document_id, fields: dict, was_chunked=True) -> int:
+    """
+    queryset.update(**fields) для документа document_id, где content_html
+    пишется по режиму хранения: большой — в блоки (только изменившиеся),
+    колонка пустая. was_chunked=False — блоков заведомо нет, их не трогаем.
+    Вызывать в транзакции; возвращает число обновлённых строк.
+    """
+    content_html = fields["content_html"]
+    chunked = should_chunk(content_html)
+    updated = queryset.update(**{**fields, "content_html": "" if chunked else content_html, "chunked": chunked})
+    if updated and (chunked or was_chunked):
+        sync(document_id, content_html if chunked else "")
+    return updated
+
+
+def convert(docs) -> int:
+    """Переводит в блоки большие документы, записанные строкой в обход save() (bulk_create)."""
+    options, converted = conf(), 0
+    for doc in docs:
+        if not doc.chunked and should_chunk(doc.content_html, options):
+            sync(doc.pk, doc.content_html)
+            Document.objects.filter(pk=doc.pk).update(content_html="", chunked=True)
+            doc.chunked = True
+            converted += 1
+    return converted
+
+
+def page(doc, start=0, limit=None) -> dict:
+    """Диапазон блоков документа [start, start + limit)."""
+    options = conf()
+    limit = max(1, min(limit or options["PAGE_SIZE"], options["MAX_PAGE_SIZE"]))
+    start = max(0, start)
+    if doc.chunked and "content_html" not in doc.__dict__:
+        # из БД только нужные блоки
+        blocks = DocumentBlock.objects.filter(document_id=doc.pk)
+        total = blocks.count()
+        items = [
+            {"position": position, "hash": hash, "html": html}
+            for position, hash, html in blocks.filter(position__gte=start, position__lt=start + limit)
+            .order_by("position").values_list("position", "hash", "html")
+        ]
+    else:
+        # строковый документ или несброшенное автосохранение: делим на лету
+        parts = split(doc.content_html)
+        total = len(parts)
+        items = [
+            {"position": position, "hash": digest(html), "html": html}
+            for position, html in enumerate(parts[start:start + limit], start)
+        ]
+    end = start + len(items)
+    return {
+        "id": doc.pk,
+        "revision": doc.revision,
+        "count": total,
+        "start": start,
+        "blocks": items,
+        "next": end if end < total else None,
+    }
@@ -0,0 +1,76 @@
+"""
+Условные запросы: ETag и Last-Modified для документов, версий и экспорта.
+
+Валидатор документа — (id, revision, updated_at): ревизия растёт при любой
+правке через API, updated_at ловит правки в обход (админка, .save()).
+Проверка идёт отдельным запросом только по метаданным — content_html не
+читается и ответ не сериализуется, пока не ясно, что это не 304.
+ETag экспорта учитывает кодировку сжатия: gzip и без сжатия — разные байты.
+
+Версии неизменяемы: ETag — id версии, ответ кэшируется клиентом надолго.
+
+If-Match на изменениях — защита от потерянных обновлений: 412, если
+документ изменили после того, как клиент его прочитал.
+
+Last-Modified — с точностью до секунды; при наличии If-None-Match
+If-Modified-Since не учитывается (RFC 9110), так что правки в пределах
+секунды не теряются у клиентов, которые присылают ETag.
+"""
+import calendar
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import exceptions
+
+# колонки, которых достаточно для проверки (owner_id — для IsOwner); content_html сюда не входит
+DOCUMENT_FIELDS = ("id", "owner_id", "revision", "updated_at")
+CONDITIONAL_HEADERS = ("If-None-Match", "If-Modified-Since", "If-Match", "If-Unmodified-Since")
+REVALIDATE = "private, no-cache"
+IMMUTABLE = "private, max-age=31536000, immutable"
+
+
+class PreconditionFailed(exceptions.APIException):
+    status_code = 412
+    default_detail = "Документ изменён после чтения: ETag не совпадает."
+    default_code = "precondition_failed"
+
+
+def document_etag(doc, variant=""):
+    stamp = int(doc.updated_at.timestamp() * 1_000_000)
+    tag = f"d{doc.pk}-r{doc.revision}-{stamp:x}"
+    if variant:
+        tag += f"-{variant}"
+    return f'"{tag}"'
+
+
+def version_etag(version_id):
+    return f'"v{version_id}"'
+
+
+def _timestamp(dt):
+    return calendar.timegm(dt.utctimetuple()) if dt is not None else None
+
+
+def evaluate(request, etag, last_modified=None, cache_control=REVALIDATE):
+    """
+    Проверяет If-None-Match / If-Modified-Since / If-Match / If-Unmodified-Since.
+    None — запрос выполнять; 304 — готовый ответ; несовпадение — PreconditionFailed.
+    """
+    response = get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+    if response is None:
+        return None
+    if response.status_code == 412:
+        raise PreconditionFailed()
+    return set_validators(response, etag, last_modified, cache_control)
+
+
+def set_validators(response, etag, last_modified=None, cache_control=REVALIDATE):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(_timestamp(last_modified))
+    response["Cache-Control"] = cache_control
+    return response
+
+
+def is_conditional(request):
+    return any(name in request.headers for name in CONDITIONAL_HEADERS)
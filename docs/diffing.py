@@ -0,0 +1,195 @@
+"""
+Сравнение двух версий документа на сервере.
+
+Двухуровневый diff с учётом структуры HTML:
+1. документ режется на блочные единицы — абзацы, заголовки, пункты
+   списков, строки таблиц и т.п. (границы — открывающие и закрывающие
+   блочные теги), единицы сравниваются целиком;
+2. внутри изменённых участков — по токенам: слова, пробелы, знаки, теги.
+
+На обоих уровнях — общий префикс/суффикс отрезается сразу, остальное —
+алгоритм Майерса O((N+M)·D): для типичной пары версий, где D мало,
+время линейно по размеру документа. D ограничено (MAX_EDITS/REFINE_EDITS):
+сверх него участок отдаётся одной заменой, так что худший случай тоже
+линеен. format="text" — то же по тексту без разметки.
+
+Ответ — только изменённые участки (hunks) с индексами единиц в обеих
+версиях; внутри участка — операции [знак, текст], знак "=", "-" или "+"
+(в text-режиме единицы участка разделены переводом строки). Версии
+неизменяемы, поэтому результат кэшируется по паре id (LRU,
+DOCS_VERSION_DIFF_CACHE_SIZE).
+"""
+import html
+import re
+
+from django.conf import settings
+
+from .lru import LRUCache
+
+FORMATS = ("html", "text")
+MAX_EDITS = 2000     # правок на уровне единиц
+REFINE_EDITS = 500   # правок на уровне слов внутри участка
+REFINE_MAX = 20000   # токенов в участке — больше не уточняем по словам
+
+_diffs = LRUCache(maxsize=getattr(settings, "DOCS_VERSION_DIFF_CACHE_SIZE", 256))
+
+_BLOCK_TAG_RE = re.compile(
+    r"<(/?)(?:p|div|h[1-6]|ul|ol|li|table|thead|tbody|tfoot|tr|th|td|pre|blockquote|hr|section|article|figure)\b[^>]*>",
+    re.IGNORECASE,
+)
+_WORD_RE = re.compile(r"<[^>]*>|&#?\w+;|\w+|\s+|[^\w\s<&]+|[<&]")
+_TAG_RE = re.compile(r"<[^>]*>")
+
+
+def units(content_html: str) -> list:
+    """HTML → блочные единицы; "".join(units(html)) == html."""
+    cuts = {0, len(content_html)}
+    for m in _BLOCK_TAG_RE.finditer(content_html):
+        cuts.add(m.end() if m.group(1) else m.start())
+    cuts = sorted(cuts)
+    return [content_html[a:b] for a, b in zip(cuts, cuts[1:])]
+
+
+def _text_units(content_html):
+    result = []
+    for unit in units(content_html):
+        text = html.unescape(_TAG_RE.sub("", unit))
+        if text.strip():
+            result.append(text)
+    return result
+
+
+def _myers(a, b, max_edits):
+    """
+    Кратчайший сценарий правки a → b: список (tag, i1, i2, j1, j2) с tag
+    "equal" / "change" или None, если правок больше max_edits.
+    """
+    n, m = len(a), len(b)
+    limit = min(n + m, max_edits)
+    off = limit + 1
+    v = [0] * (2 * limit + 3)
+    trace = []
+    for d in range(limit + 1):
+        trace.append(v[off - d - 1:off + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[off + k - 1] < v[off + k + 1]):
+                x = v[off + k + 1]
+            else:
+                x = v[off + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[off + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m)
+    return None
+
+
+def _backtrack(trace, n, m):
+    ops = []  # с конца
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        saved = trace[d]  # v перед шагом d, k от -d-1 до d+1
+        k = x - y
+        if k == -d or (k != d and saved[k + d] < saved[k + d + 2]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = saved[prev_k + d + 1]
+        prev_y = prev_x - prev_k
+        snake = min(x - prev_x, y - prev_y)
+        if snake > 0:
+            ops.append(("equal", x - snake, x, y - snake, y))
+            x, y = x - snake, y - snake
+        if d:
+            # одна вставка или одно удаление; соседние склеиваем в участок
+            if ops and ops[-1][0] == "change" and ops[-1][1] == x and ops[-1][3] == y:
+                ops[-1] = ("change", prev_x, ops[-1][2], prev_y, ops[-1][4])
+            else:
+                ops.append(("change", prev_x, x, prev_y, y))
+        x, y = prev_x, prev_y
+    ops.reverse()
+    return ops
+
+
+def opcodes(a, b, max_edits=MAX_EDITS) -> list:
+    """Участки совпадений и изменений между последовательностями a и b."""
+    n, m = len(a), len(b)
+    pre = 0
+    while pre < n and pre < m and a[pre] == b[pre]:
+        pre += 1
+    suf = 0
+    while suf < n - pre and suf < m - pre and a[n - 1 - suf] == b[m - 1 - suf]:
+        suf += 1
+    result = [("equal", 0, pre, 0, pre)] if pre else []
+    a_mid, b_mid = a[pre:n - suf], b[pre:m - suf]
+    if a_mid or b_mid:
+        middle = _myers(a_mid, b_mid, max_edits) if a_mid and b_mid else None
+        if middle is None:
+            middle = [("change", 0, len(a_mid), 0, len(b_mid))]
+        result.extend((tag, i1 + pre, i2 + pre, j1 + pre, j2 + pre) for tag, i1, i2, j1, j2 in middle)
+    if suf:
+        result.append(("equal", n - suf, n, m - suf, m))
+    return result
+
+
+def _refine(old, new):
+    """Операции внутри изменённого участка: по словам, а если участок огромный — целиком."""
+    a, b = _WORD_RE.findall(old), _WORD_RE.findall(new)
+    if not a or not b or len(a) + len(b) > REFINE_MAX:
+        return [op for op in (["-", old], ["+", new]) if op[1]]
+    ops = []
+
+    def push(tag, text):
+        if ops and ops[-1][0] == tag:
+            ops[-1][1] += text
+        else:
+            ops.append([tag, text])
+
+    for tag, i1, i2, j1, j2 in opcodes(a, b, REFINE_EDITS):
+        if tag == "equal":
+            push("=", "".join(a[i1:i2]))
+        else:
+            if i1 < i2:
+                push("-", "".join(a[i1:i2]))
+            if j1 < j2:
+                push("+", "".join(b[j1:j2]))
+    return ops
+
+
+def diff(old_html: str, new_html: str, fmt="html") -> dict:
+    if fmt == "text":
+        a, b, sep = _text_units(old_html), _text_units(new_html), "\n"
+    else:
+        a, b, sep = units(old_html), units(new_html), ""
+    hunks, inserted, deleted = [], 0, 0
+    for tag, i1, i2, j1, j2 in opcodes(a, b):
+        if tag == "equal":
+            continue
+        ops = _refine(sep.join(a[i1:i2]), sep.join(b[j1:j2]))
+        inserted += sum(len(text) for op, text in ops if op == "+")
+        deleted += sum(len(text) for op, text in ops if op == "-")
+        hunks.append({"a": [i1, i2], "b": [j1, j2], "ops": ops})
+    return {
+        "format": fmt,
+        "units": [len(a), len(b)],
+        "inserted": inserted,
+        "deleted": deleted,
+        "hunks": hunks,
+    }
+
+
+def version_diff(old, new, fmt="html") -> dict:
+    """diff() двух DocumentVersion с кэшем: версии неизменяемы."""
+    key = (old.pk, new.pk, fmt)
+    result = _diffs.get(key)
+    if result is None:
+        result = {"a": old.pk, "b": new.pk, **diff(old.content_html, new.content_html, fmt)}
+        _diffs.set(key, result)
+    return result
+
+
+def cached(old_id, new_id, fmt="html"):
+    """Готовый результат из кэша или None — без загрузки содержимого версий."""
+    return _diffs.get((int(old_id), int(new_id), fmt))
@@ -0,0 +1,206 @@
+"""
+Потоковый экспорт документов.
+
+HTML одного документа отдаётся кусками (шапка, тело, подвал) и при
+поддержке клиентом сжимается на лету (br, если установлен пакет brotli,
+иначе gzip). Массовый экспорт — ZIP, который пишется прямо в ответ:
+документы читаются из БД порциями, архив целиком в памяти не собирается.
+
+Под ASGI синхронный итератор StreamingHttpResponse Django сначала читает
+целиком (sync_to_async(list)), поэтому там ответ получает асинхронный
+итератор: генератор продвигается пачками по BATCH_BYTES через sync_to_async.
+"""
+import html
+import zipfile
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils.text import slugify
+
+from .models import Document, DocumentVersion
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CHUNK_SIZE = 64 * 1024
+DOCS_PER_QUERY = 20  # сколько документов с телом держим в памяти за раз
+BATCH_BYTES = 256 * 1024  # байт ответа на один переход в sync-поток (ASGI)
+
+
+def _chunks(text, size=CHUNK_SIZE):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+def html_chunks(title, content_html):
+    yield (
+        '<!DOCTYPE html><html><head><meta charset="utf-8">'
+        f"<title>{html.escape(title or '')}</title></head><body>"
+    ).encode("utf-8")
+    for part in _chunks(content_html or ""):
+        yield part.encode("utf-8")
+    yield b"</body></html>"
+
+
+# ---------- сжатие ----------
+
+def _accepted(header):
+    """Кодировки из Accept-Encoding с q > 0."""
+    result = set()
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            result.add(name.strip().lower())
+    return result
+
+
+def negotiate_encoding(accept_encoding):
+    accepted = _accepted(accept_encoding)
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress_chunks(chunks, encoding):
+    if encoding is None:
+        yield from chunks
+        return
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 — gzip-обёртка
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        out = compress(chunk)
+        if out:
+            yield out
+    yield finish()
+
+
+async def _async_batches(chunks, batch_bytes=BATCH_BYTES):
+    iterator = iter(chunks)
+
+    def take():
+        batch, size = [], 0
+        for chunk in iterator:
+            batch.append(chunk)
+            size += len(chunk)
+            if size >= batch_bytes:
+                break
+        return batch
+
+    try:
+        # thread_sensitive: курсор iterator() живёт в потоке, где открыт
+        while batch := await sync_to_async(take)():
+            for chunk in batch:
+                yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def _streaming_content(request, chunks):
+    """Под ASGI — асинхронный итератор пачками, под WSGI — генератор как есть."""
+    if isinstance(getattr(request, "_request", request), ASGIRequest):
+        return _async_batches(chunks)
+    return chunks
+
+
+def streaming_html_response(request, doc):
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"))
+    resp = StreamingHttpResponse(
+        _streaming_content(request, compress_chunks(html_chunks(doc.title, doc.content_html), encoding)),
+        content_type="text/html; charset=utf-8",
+    )
+    if encoding:
+        resp["Content-Encoding"] = encoding
+    resp["Vary"] = "Accept-Encoding"
+    return resp
+
+
+# ---------- ZIP ----------
+
+class _ZipSink:
+    """
+    Файлоподобный приёмник для ZipFile: копит записанное до следующего
+    take(). tell() нет — zipfile сам перейдёт в режим без seek.
+    """
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _entry_name(doc):
+    slug = slugify(doc.title or "", allow_unicode=True)[:60] or "document"
+    return f"{doc.pk}-{slug}"
+
+
+def zip_chunks(owner, with_versions=False):
+    """Куски ZIP-архива со всеми неудалёнными документами пользователя."""
+    sink = _ZipSink()
+    docs = (
+        Document.objects.filter(owner=owner, is_deleted=False)
+        .only("id", "title", "content_html", "chunked")
+        .order_by("id")
+        .iterator(chunk_size=DOCS_PER_QUERY)
+    )
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for doc in docs:
+            name = _entry_name(doc)
+            yield from _zip_entry(zf, sink, f"{name}.html", html_chunks(doc.title, doc.content_html))
+            if not with_versions:
+                continue
+            versions = DocumentVersion.objects.filter(document_id=doc.pk).order_by("id")
+            for v in versions.iterator(chunk_size=DOCS_PER_QUERY):
+                entry = f"{name}/versions/{v.pk}-{slugify(v.label) or 'v'}.html"
+                yield from _zip_entry(zf, sink, entry, html_chunks(doc.title, v.content_html))
+    yield sink.take()
+
+
+def _zip_entry(zf, sink, name, chunks):
+    # force_zip64: размер заранее неизвестен, а перемотать заголовок нельзя
+    with zf.open(name, "w", force_zip64=True) as entry:
+        for chunk in chunks:
+            entry.write(chunk)
+            data = sink.take()
+            if data:
+                yield data
+    data = sink.take()
+    if data:
+        yield data
+
+
+def streaming_zip_response(request, owner, with_versions=False, filename="documents.zip"):
+    resp = StreamingHttpResponse(
+        _streaming_content(request, zip_chunks(owner, with_versions)), content_type="application/zip"
+    )
+    resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return resp
@@ -0,0 +1,287 @@
+"""
+Массовый импорт документов из ZIP (файлы .html/.htm) или NDJSON
+(строки {"title": ..., "content_html": ...}).
+
+Записи читаются по одной, HTML чистится (скрипты, обработчики on*,
+javascript:-ссылки) и нормализуется, документы и их первые версии
+пишутся bulk_create транзакционными пачками. Ошибки копятся по записям
+и не прерывают импорт.
+"""
+import html
+import json
+import shutil
+import tempfile
+import zipfile
+import zlib
+from html.parser import HTMLParser
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from . import blocks
+from .models import Document, DocumentVersion
+from .search import get_backend as get_search_backend
+from .versioning import plan_version
+
+DEFAULT_TITLE = "Импортированный документ"
+HTML_SUFFIXES = {".html", ".htm"}
+
+_DROP_CONTENT = {"script", "style", "iframe", "object", "embed", "template", "noscript", "title", "head"}
+_UNWRAP = {"html", "body", "meta", "link", "base"}
+_VOID = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+# что может стоять в <head>; любой другой тег (или текст) неявно закрывает head (HTML5)
+_HEAD_CONTENT = {"title", "meta", "link", "base", "style", "script", "noscript", "template"}
+_URL_ATTRS = {"href", "src", "action", "formaction", "xlink:href"}
+
+
+def _max_bytes():
+    return getattr(settings, "DOCS_IMPORT_MAX_BYTES", 5 * 1024 * 1024)
+
+
+class ImportItemError(ValueError):
+    pass
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.title = []
+        self._drop = []  # стек тегов, содержимое которых выкидываем
+        self._open = []  # открытые теги в out: их закрытие заканчивает и выкидывание внутри
+
+    def _attrs(self, attrs):
+        parts = []
+        for name, value in attrs:
+            if name.startswith("on"):
+                continue
+            if value is None:
+                parts.append(f" {name}")
+                continue
+            if name in _URL_ATTRS:
+                scheme = "".join(value.split()).lower()
+                if scheme.startswith(("javascript:", "vbscript:")) or (
+                    scheme.startswith("data:") and not scheme.startswith("data:image/")
+                ):
+                    continue
+            parts.append(f' {name}="{html.escape(value)}"')
+        return "".join(parts)
+
+    def _end_head(self, tag=None):
+        # </head> необязателен: body начинается с первого тега не из head
+        if self._drop and self._drop[0] == "head" and (tag is None or tag not in _HEAD_CONTENT):
+            self._drop.clear()
+
+    def handle_starttag(self, tag, attrs):
+        self._end_head(tag)
+        if self._drop or tag in _DROP_CONTENT:
+            if tag not in _VOID:
+                self._drop.append(tag)
+            return
+        if tag in _UNWRAP:
+            return
+        self.out.append(f"<{tag}{self._attrs(attrs)}>")
+        if tag not in _VOID:
+            self._open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._end_head(tag)
+        if self._drop or tag in _DROP_CONTENT or tag in _UNWRAP:
+            return
+        self.out.append(f"<{tag}{self._attrs(attrs)}>")
+
+    def handle_endtag(self, tag):
+        if self._drop:
+            if tag in self._drop:
+                while self._drop.pop() != tag:
+                    pass
+                return
+            if tag not in self._open and tag not in ("body", "html"):
+                return
+            self._drop.clear()  # незакрытый noscript/title кончается вместе с родителем
+        if tag in _UNWRAP or tag in _VOID:
+            return
+        if tag in self._open:
+            while self._open.pop() != tag:
+                pass
+        self.out.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if data.strip() and self._drop == ["head"]:
+            self._end_head()
+        if self._drop:
+            if self._drop[-1] == "title":
+                self.title.append(data)
+            return
+        self.out.append(html.escape(data, quote=False))
+
+
+def sanitize_html(raw: str):
+    """Возвращает (чистый HTML содержимого body, <title> документа или "")."""
+    parser = _Sanitizer()
+    parser.feed(raw or "")
+    parser.close()
+    title = " ".join("".join(parser.title).split())
+    return "".join(parser.out).strip(), title
+
+
+class ImportItem:
+    __slots__ = ("index", "name", "title", "content_html", "error")
+
+    def __init__(self, index, name, title="", content_html="", error=None):
+        self.index = index
+        self.name = name
+        self.title = title
+        self.content_html = content_html
+        self.error = error
+
+
+def _prepare(index, name, title, raw_html):
+    if not isinstance(raw_html, str):
+        raise ImportItemError("content_html должен быть строкой")
+    if len(raw_html) > _max_bytes():
+        raise ImportItemError("слишком большой документ")
+    content, html_title = sanitize_html(raw_html)
+    title = (title or html_title or DEFAULT_TITLE).strip()[:255]
+    return ImportItem(index, name, title, content)
+
+
+def _decode(data: bytes) -> str:
+    for encoding in ("utf-8-sig", "cp1251"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise ImportItemError("не удалось определить кодировку")
+
+
+def iter_zip(fileobj):
+    """Записи из ZIP: каждый .html/.htm — документ (история versions/ пропускается)."""
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise ImportItemError(f"некорректный ZIP: {e}") from None
+    with archive:
+        index = 0
+        for info in archive.infolist():
+            path = PurePosixPath(info.filename)
+            if info.is_dir() or path.suffix.lower() not in HTML_SUFFIXES or "versions" in path.parts[:-1]:
+                continue
+            try:
+                if info.file_size > _max_bytes():
+                    raise ImportItemError("слишком большой документ")
+                item = _prepare(index, info.filename, "", _decode(archive.read(info)))
+            except (ImportItemError, zipfile.BadZipFile, zlib.error, NotImplementedError) as e:
+                item = ImportItem(index, info.filename, error=str(e))
+            yield item
+            index += 1
+
+
+def iter_ndjson(lines):
+    """Записи из NDJSON: по объекту {"title", "content_html"} на строку."""
+    index = 0
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.strip()
+        if not line:
+            continue
+        name = f"line {index + 1}"
+        try:
+            obj = json.loads(line)
+            if not isinstance(obj, dict):
+                raise ImportItemError("ожидается JSON-объект")
+            item = _prepare(index, name, obj.get("title") or "", obj.get("content_html", ""))
+        except ValueError as e:  # JSONDecodeError и ImportItemError
+            item = ImportItem(index, name, error=str(e))
+        yield item
+        index += 1
+
+
+def detect_format(head: bytes, content_type="", filename=""):
+    if head.startswith(b"PK\x03\x04") or "zip" in content_type or filename.lower().endswith(".zip"):
+        return "zip"
+    return "ndjson"
+
+
+def spool(stream, max_memory=10 * 1024 * 1024):
+    """Копирует поток в (при необходимости дисковый) временный файл: ZIP нужен seek."""
+    tmp = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    if stream is not None:
+        shutil.copyfileobj(stream, tmp, 256 * 1024)
+    tmp.seek(0)
+    return tmp
+
+
+def iter_items(fileobj, fmt):
+    if fmt == "zip":
+        return iter_zip(fileobj)
+    return iter_ndjson(fileobj)
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.ids = []
+        self.errors = []
+
+    def fail(self, item, error):
+        self.errors.append({"item": item.index, "name": item.name, "error": str(error)})
+
+    def as_dict(self):
+        return {"created": self.created, "failed": len(self.errors), "ids": self.ids, "errors": self.errors}
+
+
+def _versions(docs):
+    result = []
+    for doc in docs:
+        kind, data = plan_version(doc.content_html, None, 0)
+        result.append(DocumentVersion(
+            document=doc, label="v1", kind=kind, data=data, size=len(doc.content_html)
+        ))
+    return result
+
+
+def _save_batch(owner, items, report, search):
+    docs = [Document(owner=owner, title=i.title, content_html=i.content_html, version_seq=1) for i in items]
+    try:
+        with transaction.atomic():
+            Document.objects.bulk_create(docs)
+            blocks.convert(docs)
+            DocumentVersion.objects.bulk_create(_versions(docs))
+            search.index_documents(docs)
+    except DatabaseError:
+        # пачка не прошла — пишем по одному, чтобы найти виноватую запись
+        docs = []
+        for item in items:
+            doc = Document(owner=owner, title=item.title, content_html=item.content_html, version_seq=1)
+            try:
+                with transaction.atomic():
+                    doc.save()
+                    DocumentVersion.objects.bulk_create(_versions([doc]))
+                    search.index_documents([doc])
+            except DatabaseError as e:
+                report.fail(item, e)
+            else:
+                docs.append(doc)
+    report.created += len(docs)
+    report.ids.extend(d.pk for d in docs)
+
+
+def bulk_import(owner, items, batch_size=200) -> ImportReport:
+    """Импортирует записи пачками по batch_size; возвращает отчёт."""
+    report = ImportReport()
+    search = get_search_backend()
+    batch = []
+    for item in items:
+        if item.error:
+            report.fail(item, item.error)
+            continue
+        batch.append(item)
+        if len(batch) >= batch_size:
+            _save_batch(owner, batch, report, search)
+            batch = []
+    if batch:
+        _save_batch(owner, batch, report, search)
+    return report
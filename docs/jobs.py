@@ -0,0 +1,334 @@
+"""
+Фоновые AI-генерации.
+
+POST /api/ai/jobs/ ставит задачу в БД и сразу возвращает её id; вызов
+провайдера выполняет пул воркеров, а не HTTP-воркер. Задачи забираются
+условным UPDATE, поэтому воркеров может быть несколько (в веб-процессах
+и/или в отдельном `manage.py run_ai_jobs`). Прогресс пишется в result_text,
+его читают опросом или SSE (/api/ai/jobs/<id>/stream/).
+
+Сбой провайдера — повтор с экспоненциальной задержкой до max_attempts.
+Пока задача выполняется, воркер каждые HEARTBEAT секунд продлевает аренду
+и проверяет отмену — даже если провайдер долго молчит. Задача, у которой
+воркер перестал подавать признаки жизни дольше LEASE, забирается заново. Готовый текст можно записать в документ новой версией.
+
+    AI_JOBS = {
+        "WORKERS": 4,         # одновременных генераций на процесс
+        "EMBEDDED": True,     # запускать пул в веб-процессе при первой задаче
+        "MAX_ATTEMPTS": 3,
+        "BACKOFF": 2.0,       # c, задержка перед повтором: BACKOFF * 2**(попытка-1)
+        "BACKOFF_MAX": 60,
+        "POLL_INTERVAL": 1.0, # c, как часто воркер смотрит в БД без уведомлений
+        "FLUSH_INTERVAL": 0.5,# c, как часто сохраняется прогресс
+        "HEARTBEAT": 15,      # c, продление аренды и проверка отмены (меньше LEASE)
+        "LEASE": 120,         # c без heartbeat — задача считается брошенной
+    }
+"""
+import asyncio
+import logging
+import random
+import threading
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import autosave, rendering
+from .models import Document, GenerationJob
+from .search import index_document
+from .versioning import create_version
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "WORKERS": 4,
+    "EMBEDDED": True,
+    "MAX_ATTEMPTS": 3,
+    "BACKOFF": 2.0,
+    "BACKOFF_MAX": 60,
+    "POLL_INTERVAL": 1.0,
+    "FLUSH_INTERVAL": 0.5,
+    "HEARTBEAT": 15,
+    "LEASE": 120,
+}
+
+
+def conf() -> dict:
+    return {**DEFAULTS, **getattr(settings, "AI_JOBS", {})}
+
+
+class JobFailed(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# ---------- очередь ----------
+
+def submit(owner, mode, params, document=None, write="", max_attempts=None) -> GenerationJob:
+    job = GenerationJob.objects.create(
+        owner=owner,
+        mode=mode,
+        params=params,
+        document=document,
+        write=write,
+        max_attempts=max_attempts or conf()["MAX_ATTEMPTS"],
+    )
+    transaction.on_commit(notify)
+    return job
+
+
+def cancel(job) -> GenerationJob:
+    """Отмена: задача в очереди отменяется сразу, выполняющуюся остановит воркер."""
+    now = timezone.now()
+    GenerationJob.objects.filter(pk=job.pk, status=GenerationJob.QUEUED).update(
+        status=GenerationJob.CANCELLED, finished_at=now
+    )
+    GenerationJob.objects.filter(pk=job.pk, status=GenerationJob.RUNNING).update(cancel_requested=True)
+    job.refresh_from_db()
+    return job
+
+
+def backoff(attempt, options=None) -> float:
+    options = options or conf()
+    delay = min(options["BACKOFF"] * 2 ** (attempt - 1), options["BACKOFF_MAX"])
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_next(options=None):
+    """Забирает следующую готовую задачу (или брошенную воркером); None — задач нет."""
+    options = options or conf()
+    now = timezone.now()
+    ready = Q(status=GenerationJob.QUEUED, next_attempt_at__lte=now) | Q(
+        status=GenerationJob.RUNNING, heartbeat_at__lt=now - timedelta(seconds=options["LEASE"])
+    )
+    for _ in range(5):
+        candidate = (
+            GenerationJob.objects.filter(ready)
+            .order_by("next_attempt_at")
+            .values("pk", "status", "heartbeat_at")
+            .first()
+        )
+        if candidate is None:
+            return None
+        # условный UPDATE: задачу получит ровно один воркер
+        claimed = GenerationJob.objects.filter(
+            pk=candidate["pk"], status=candidate["status"], heartbeat_at=candidate["heartbeat_at"]
+        ).update(
+            status=GenerationJob.RUNNING,
+            attempts=F("attempts") + 1,
+            started_at=now,
+            heartbeat_at=now,
+            error="",
+            result_text="",
+        )
+        if claimed:
+            return GenerationJob.objects.select_related("document").get(pk=candidate["pk"])
+    return None
+
+
+# ---------- выполнение ----------
+
+async def _generate(job, options):
+    """
+    Стримит ответ провайдера, периодически сохраняя прогресс и проверяя отмену.
+    Аренду продлевает отдельная задача по таймеру: молчание провайдера дольше
+    LEASE не отдаёт задачу другому воркеру.
+    """
+    parts = []
+    reader = asyncio.ensure_future(_read(job, options, parts))
+    beat = asyncio.ensure_future(_heartbeat(job, options, parts))
+    try:
+        done, _ = await asyncio.wait({reader, beat}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (reader, beat):
+            task.cancel()
+        await asyncio.gather(reader, beat, return_exceptions=True)
+    # результат или исключение первой завершившейся: текст, сбой провайдера, JobCancelled
+    return (reader if reader in done else beat).result()
+
+
+async def _read(job, options, parts):
+    from .views import build_stream_payload, upstream_events
+
+    p = job.params
+    payload = build_stream_payload(
+        job.mode, p.get("prompt", ""), p.get("html", ""), p.get("selection", ""), p.get("context", "")
+    )
+    loop = asyncio.get_running_loop()
+    flushed_at = loop.time()
+    events = upstream_events(payload, job.mode)
+    try:
+        async for event, data in events:
+            if event == "error":
+                raise JobFailed(data)
+            if event == "content":
+                parts.append(data)
+            if loop.time() - flushed_at >= options["FLUSH_INTERVAL"]:
+                flushed_at = loop.time()
+                await _flush(job, "".join(parts))
+    finally:
+        await events.aclose()
+    return "".join(parts)
+
+
+async def _heartbeat(job, options, parts):
+    while True:
+        await asyncio.sleep(options["HEARTBEAT"])
+        await _flush(job, "".join(parts))
+
+
+async def _flush(job, text):
+    qs = GenerationJob.objects.filter(pk=job.pk)
+    await qs.aupdate(result_text=text, heartbeat_at=timezone.now())
+    if await qs.filter(cancel_requested=True).aexists():
+        raise JobCancelled()
+
+
+def _write_result(job, text):
+    """Записывает результат в документ новой версией; возвращает версию или None."""
+    if not job.write:
+        return None
+    content = rendering.render_markdown(text)
+    if job.write != "new":
+        autosave.flush_document(job.document_id)
+    with transaction.atomic():
+        if job.write == "new":
+            title = (job.params.get("title") or job.params.get("prompt") or "Сгенерированный документ")[:255]
+            doc = Document.objects.create(owner_id=job.owner_id, title=title, content_html=content)
+            job.document = doc
+        else:
+            doc = Document.objects.select_for_update().filter(
+                pk=job.document_id, owner_id=job.owner_id, is_deleted=False
+            ).first()
+            if doc is None:
+                raise JobFailed("документ не найден")
+            doc.content_html = content if job.write == "replace" else doc.content_html + "\n" + content
+            doc.revision = F("revision") + 1
+            doc.save(update_fields=["content_html", "revision", "updated_at"])
+            doc.refresh_from_db(fields=["revision"])
+        version = create_version(doc, doc.content_html)
+    index_document(doc)
+    return version
+
+
+def _finish(job, **fields):
+    fields.setdefault("finished_at", timezone.now())
+    GenerationJob.objects.filter(pk=job.pk).update(**fields)
+
+
+async def run_job(job, options=None):
+    options = options or conf()
+    try:
+        text = await _generate(job, options)
+        version = await sync_to_async(_write_result)(job, text)
+    except JobCancelled:
+        await sync_to_async(_finish)(job, status=GenerationJob.CANCELLED)
+    except asyncio.CancelledError:
+        # остановка пула: вернём задачу в очередь без траты попытки
+        await sync_to_async(_finish)(
+            job, status=GenerationJob.QUEUED, attempts=F("attempts") - 1, finished_at=None, heartbeat_at=None
+        )
+        raise
+    except Exception as e:
+        message = str(e) or type(e).__name__
+        if not isinstance(e, JobFailed):
+            logger.exception("generation job %s failed", job.pk)
+        if job.attempts < job.max_attempts:
+            retry_at = timezone.now() + timedelta(seconds=backoff(job.attempts, options))
+            await sync_to_async(_finish)(
+                job, status=GenerationJob.QUEUED, error=message, next_attempt_at=retry_at,
+                finished_at=None, heartbeat_at=None,
+            )
+        else:
+            await sync_to_async(_finish)(job, status=GenerationJob.FAILED, error=message)
+    else:
+        await sync_to_async(_finish)(
+            job, status=GenerationJob.SUCCEEDED, result_text=text, document=job.document,
+            version=version, heartbeat_at=timezone.now(),
+        )
+
+
+async def process_next(options=None) -> bool:
+    """Забирает и выполняет одну задачу; False — задач нет."""
+    job = await sync_to_async(claim_next)(options)
+    if job is None:
+        return False
+    await run_job(job, options)
+    return True
+
+
+# ---------- пул воркеров ----------
+
+class WorkerPool:
+    """Пул асинхронных воркеров в отдельном потоке со своим event loop."""
+
+    def __init__(self, options=None):
+        self.options = options or conf()
+        self.loop = None
+        self.thread = None
+        self._wake = None
+        self._stopping = False
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run_forever, name="ai-jobs", daemon=True)
+            self.thread.start()
+        return self
+
+    def run_forever(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        workers = [asyncio.ensure_future(self._worker()) for _ in range(self.options["WORKERS"])]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            from . import ai_client
+
+            await ai_client.aclose()
+
+    async def _worker(self):
+        while not self._stopping:
+            try:
+                if await process_next(self.options):
+                    continue
+            except Exception:
+                logger.exception("generation worker error")
+            await sync_to_async(close_old_connections)()
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.options["POLL_INTERVAL"])
+            except asyncio.TimeoutError:
+                pass
+
+    def notify(self):
+        if self.loop is not None and self._wake is not None:
+            self.loop.call_soon_threadsafe(self._wake.set)
+
+    def stop(self):
+        self._stopping = True
+        self.notify()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def notify():
+    """Будит встроенный пул (и запускает его при первой задаче, если EMBEDDED)."""
+    global _pool
+    options = conf()
+    if not options["EMBEDDED"]:
+        return
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(options).start()
+    _pool.notify()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from docs.retention import compact, conf
+
+
+class Command(BaseCommand):
+    help = "Прореживает историю версий по политике хранения (DOCS_VERSION_RETENTION)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--document", type=int, action="append", help="только этот документ (можно повторять)")
+        parser.add_argument("--batch-size", type=int, default=None, help="документов за порцию")
+        parser.add_argument("--dry-run", action="store_true", help="только посчитать")
+
+    def handle(self, *args, **options):
+        policy = conf()
+        if options["batch_size"]:
+            policy["BATCH_SIZE"] = options["batch_size"]
+        stats = compact(options=policy, dry_run=options["dry_run"], document_ids=options["document"])
+        verb = "Будет удалено" if options["dry_run"] else "Удалено"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} версий: {stats['deleted']} (документов просмотрено: {stats['documents']})"
+        ))
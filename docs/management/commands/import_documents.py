@@ -0,0 +1,41 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from docs.importing import ImportItemError, bulk_import, detect_format, iter_items
+
+
+class Command(BaseCommand):
+    help = "Импортирует документы из ZIP (.html) или NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--user", required=True, help="владелец документов (username)")
+        parser.add_argument("--format", choices=["auto", "zip", "ndjson"], default="auto")
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        try:
+            owner = get_user_model().objects.get(username=options["user"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Пользователь {options['user']} не найден")
+
+        started = time.perf_counter()
+        with open(options["path"], "rb") as f:
+            fmt = options["format"]
+            if fmt == "auto":
+                fmt = detect_format(f.read(4), filename=options["path"])
+                f.seek(0)
+            try:
+                report = bulk_import(owner, iter_items(f, fmt), batch_size=options["batch_size"])
+            except ImportItemError as e:
+                raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        for err in report.errors:
+            self.stderr.write(f"{err['name']}: {err['error']}")
+        rate = report.created / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Импортировано {report.created}, ошибок {len(report.errors)} ({rate:.0f} док/с)"
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from docs.jobs import WorkerPool, conf
+
+
+class Command(BaseCommand):
+    help = "Выполняет фоновые AI-генерации (очередь GenerationJob)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="одновременных генераций")
+
+    def handle(self, *args, **options):
+        pool_options = conf()
+        if options["workers"]:
+            pool_options["WORKERS"] = options["workers"]
+        self.stdout.write(f"Воркеров: {pool_options['WORKERS']}, Ctrl+C — остановка")
+        try:
+            WorkerPool(pool_options).run_forever()
+        except KeyboardInterrupt:
+            pass
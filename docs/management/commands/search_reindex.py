@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from docs.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Перестраивает поисковый индекс документов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        backend.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Индекс перестроен ({type(backend).__name__})"))
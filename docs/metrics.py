@@ -0,0 +1,395 @@
+"""
+Встроенные метрики в формате Prometheus (GET /metrics, только staff).
+
+- MetricsMiddleware: латентность каждой вью, число и время SQL-запросов
+  на запрос. SQL считается через execute_wrapper, который ставится на каждое
+  новое соединение; запрос к нему привязан contextvar'ом, поэтому учитываются
+  и запросы async-вью, ушедшие в sync_to_async. Для стримовых ответов
+  латентность — до отдачи заголовков, а не до конца стрима.
+- AiCall: время до первого байта, полное время, байты и токены (дельта
+  стрима ≈ токен) вызовов провайдера по режимам generate/rewrite/continue/outline.
+- Медленные запросы: при METRICS["SLOW_REQUEST"] доля PROFILE_RATE запросов
+  (не больше одного одновременно) выполняется под cProfile; если запрос
+  оказался дольше порога, профиль пишется в PROFILE_DIR (*.prof, pstats).
+  Для async-вью профиль покрывает только поток event loop.
+
+    METRICS = {
+        "ENABLED": True,
+        "SLOW_REQUEST": None,    # c; None — профилирование выключено
+        "PROFILE_RATE": 1.0,
+        "PROFILE_DIR": BASE_DIR / "profiles",
+        "PROFILE_KEEP": 50,      # сколько последних профилей хранить
+    }
+"""
+import cProfile
+import contextvars
+import logging
+import random
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": True,
+    "SLOW_REQUEST": None,
+    "PROFILE_RATE": 1.0,
+    "PROFILE_DIR": "profiles",
+    "PROFILE_KEEP": 50,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+AI_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+RATE_BUCKETS = (5, 10, 20, 50, 100, 200, 500)
+AI_MODES = {"generate", "rewrite", "continue", "outline"}
+
+
+def conf() -> dict:
+    return {**DEFAULTS, **getattr(settings, "METRICS", {})}
+
+
+# ---------- примитивы ----------
+
+_lock = threading.Lock()
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [счётчики по корзинам..., +Inf], сумма
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        with _lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            entry[1] += value
+
+    def count(self, *labels):
+        entry = self.values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+
+def collector(fn):
+    """Регистрирует функцию, отдающую метрики на момент опроса: [(name, type, help, [(labels, value)])]."""
+    _collectors.append(fn)
+    return fn
+
+
+def reset():
+    """Обнуляет накопленные значения (тесты)."""
+    with _lock:
+        for metric in _registry:
+            metric.values.clear()
+
+
+def render() -> str:
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+    for fn in _collectors:
+        try:
+            families = fn()
+        except Exception:
+            logger.exception("metrics collector %s failed", fn.__name__)
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- HTTP и БД ----------
+
+http_requests = Counter("http_requests_total", "HTTP-запросы по вью и статусу", ("view", "method", "status"))
+http_latency = Histogram("http_request_duration_seconds", "Время обработки запроса", ("view", "method"))
+http_db_queries = Histogram(
+    "http_request_db_queries", "SQL-запросов на HTTP-запрос", ("view", "method"), QUERY_BUCKETS
+)
+http_db_time = Histogram("http_request_db_seconds", "Время SQL на HTTP-запрос", ("view", "method"))
+slow_profiles = Counter("http_slow_request_profiles_total", "Сохранённые профили медленных запросов", ("view",))
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+_current = contextvars.ContextVar("docs_request_stats", default=None)
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """Приёмник connection_created: считает SQL каждого нового соединения."""
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unmatched>"
+    return match.view_name or match.func.__name__
+
+
+_profile_lock = threading.Lock()
+
+
+class _Profile:
+    """cProfile запроса; не больше одного одновременно, чтобы не множить накладные расходы."""
+
+    def __init__(self, options):
+        self.profiler = None
+        if options["SLOW_REQUEST"] is None or random.random() >= options["PROFILE_RATE"]:
+            return
+        if _profile_lock.acquire(blocking=False):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def finish(self, request, elapsed, options):
+        if self.profiler is None:
+            return
+        try:
+            self.profiler.disable()
+            if elapsed >= options["SLOW_REQUEST"]:
+                _dump(self.profiler, request, elapsed, options)
+        finally:
+            _profile_lock.release()
+
+
+def _dump(profiler, request, elapsed, options):
+    view = _view_name(request)
+    directory = Path(options["PROFILE_DIR"])
+    directory.mkdir(parents=True, exist_ok=True)
+    slug = "".join(c if c.isalnum() or c in "-_" else "_" for c in view)[:60]
+    path = directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{int(elapsed * 1000)}ms.prof"
+    profiler.dump_stats(path)
+    slow_profiles.inc(view)
+    logger.warning("slow request %s %s: %.0f ms, profile %s", request.method, request.path, elapsed * 1000, path)
+    # старые профили удаляем, оставляя PROFILE_KEEP последних
+    profiles = sorted(directory.glob("*.prof"), key=lambda p: p.stat().st_mtime)
+    for old in profiles[:-options["PROFILE_KEEP"]]:
+        old.unlink(missing_ok=True)
+
+
+class MetricsMiddleware:
+    """Латентность вью и SQL на запрос; медленные запросы — в профиль."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        options = conf()
+        if not options["ENABLED"]:
+            return self.get_response(request)
+        stats, token, profile, started = self._start(options)
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+            self._finish(request, response, stats, profile, started, options)
+        return response
+
+    async def _acall(self, request):
+        options = conf()
+        if not options["ENABLED"]:
+            return await self.get_response(request)
+        stats, token, profile, started = self._start(options)
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+            self._finish(request, response, stats, profile, started, options)
+        return response
+
+    @staticmethod
+    def _start(options):
+        stats = RequestStats()
+        token = _current.set(stats)
+        return stats, token, _Profile(options), time.perf_counter()
+
+    @staticmethod
+    def _finish(request, response, stats, profile, started, options):
+        elapsed = time.perf_counter() - started
+        profile.finish(request, elapsed, options)
+        view = _view_name(request)
+        status = str(response.status_code) if response is not None else "500"
+        http_requests.inc(view, request.method, status)
+        http_latency.observe(elapsed, view, request.method)
+        http_db_queries.observe(stats.queries, view, request.method)
+        http_db_time.observe(stats.db_time, view, request.method)
+
+
+# ---------- вызовы AI-провайдера ----------
+
+ai_requests = Counter("ai_requests_total", "Вызовы AI-провайдеров", ("kind", "mode", "provider", "outcome"))
+ai_ttfb = Histogram("ai_ttfb_seconds", "Время до первого байта ответа провайдера", ("kind", "mode"), AI_BUCKETS)
+ai_duration = Histogram("ai_duration_seconds", "Полное время вызова провайдера", ("kind", "mode"), AI_BUCKETS)
+ai_bytes = Counter("ai_response_bytes_total", "Байт ответа провайдера", ("kind", "mode"))
+ai_tokens = Counter("ai_tokens_total", "Токенов ответа (дельта стрима ≈ токен)", ("kind", "mode"))
+ai_token_rate = Histogram(
+    "ai_tokens_per_second", "Скорость генерации после первого токена", ("kind", "mode"), RATE_BUCKETS
+)
+
+
+class AiCall:
+    """Замер одного вызова: first_byte() → chunk()... → finish()."""
+
+    def __init__(self, kind, mode):
+        self.kind = kind
+        self.mode = mode if mode in AI_MODES else "other"
+        self.started = time.perf_counter()
+        self.ttfb = None
+        self.bytes = 0
+        self.tokens = 0
+
+    def first_byte(self):
+        if self.ttfb is None:
+            self.ttfb = time.perf_counter() - self.started
+
+    def chunk(self, data, tokens=1):
+        self.first_byte()
+        self.bytes += len(data.encode("utf-8")) if isinstance(data, str) else len(data)
+        self.tokens += tokens
+
+    def finish(self, provider, outcome):
+        if not conf()["ENABLED"]:
+            return
+        total = time.perf_counter() - self.started
+        labels = (self.kind, self.mode)
+        ai_requests.inc(*labels, provider or "-", outcome)
+        if self.ttfb is not None:
+            ai_ttfb.observe(self.ttfb, *labels)
+        ai_duration.observe(total, *labels)
+        ai_bytes.inc(*labels, amount=self.bytes)
+        ai_tokens.inc(*labels, amount=self.tokens)
+        generating = total - (self.ttfb or 0)
+        if self.tokens > 1 and generating > 0:
+            ai_token_rate.observe(self.tokens / generating, *labels)
+
+
+# ---------- снимки на момент опроса ----------
+
+@collector
+def _providers():
+    from . import ai_providers
+
+    states = {ai_providers.CLOSED: 0, ai_providers.HALF_OPEN: 1, ai_providers.OPEN: 2}
+    return [(
+        "ai_provider_breaker_state",
+        "gauge",
+        "Состояние circuit breaker: 0 closed, 1 half-open, 2 open",
+        [({"provider": p["name"]}, states[p["state"]]) for p in ai_providers.status()],
+    )]
+
+
+@collector
+def _jobs():
+    from django.db.models import Count
+
+    from .models import GenerationJob
+
+    rows = GenerationJob.objects.filter(status__in=[GenerationJob.QUEUED, GenerationJob.RUNNING])
+    counts = dict(rows.values_list("status").annotate(n=Count("pk")).order_by())
+    return [(
+        "ai_jobs",
+        "gauge",
+        "Фоновые генерации в очереди и в работе",
+        [({"status": s}, counts.get(s, 0)) for s in (GenerationJob.QUEUED, GenerationJob.RUNNING)],
+    )]
@@ -0,0 +1,68 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+from docs import versioning
+
+
+def to_delta_storage(apps, schema_editor):
+    Document = apps.get_model("docs", "Document")
+    DocumentVersion = apps.get_model("docs", "DocumentVersion")
+    for doc_id in Document.objects.values_list("id", flat=True).iterator():
+        key, key_content, n_deltas = None, None, 0
+        for v in DocumentVersion.objects.filter(document_id=doc_id).order_by("id").iterator():
+            html = v.content_html or ""
+            kind, data = versioning.plan_version(html, key_content, n_deltas)
+            v.kind, v.data, v.size = kind, data, len(html)
+            if kind == versioning.KIND_FULL:
+                v.base = None
+                key, key_content, n_deltas = v, html, 0
+            else:
+                v.base = key
+                n_deltas += 1
+            v.save(update_fields=["kind", "base", "data", "size"])
+
+
+def to_full_snapshots(apps, schema_editor):
+    DocumentVersion = apps.get_model("docs", "DocumentVersion")
+    keyframes = {}
+    for v in DocumentVersion.objects.order_by("id").iterator():
+        if v.kind == versioning.KIND_FULL:
+            html = keyframes[v.id] = versioning.decompress(v.data)
+        else:
+            html = versioning.apply_delta(keyframes[v.base_id], versioning.unpack_delta(v.data))
+        DocumentVersion.objects.filter(pk=v.pk).update(content_html=html)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentversion',
+            name='kind',
+            field=models.CharField(choices=[('full', 'Полный снимок'), ('delta', 'Дельта')], default='full', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='documentversion',
+            name='base',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='deltas', to='docs.documentversion'),
+        ),
+        migrations.AddField(
+            model_name='documentversion',
+            name='data',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='documentversion',
+            name='size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(to_delta_storage, to_full_snapshots),
+        migrations.RemoveField(
+            model_name='documentversion',
+            name='content_html',
+        ),
+    ]
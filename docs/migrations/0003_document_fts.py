@@ -0,0 +1,37 @@
+from django.db import migrations
+
+from docs.search import FTS_TABLE, html_to_text, stems
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    Document = apps.get_model("docs", "Document")
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "title, body, plain UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    with schema_editor.connection.cursor() as c:
+        for doc in Document.objects.only("id", "title", "content_html").iterator():
+            plain = html_to_text(doc.content_html)
+            c.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, body, plain) VALUES (%s, %s, %s, %s)",
+                [doc.id, " ".join(stems(doc.title)), " ".join(stems(plain)), plain],
+            )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docs', '0002_version_delta_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
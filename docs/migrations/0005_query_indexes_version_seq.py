@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_version_seq(apps, schema_editor):
+    # раньше метка новой версии была v{count+1}, так что счётчик = число версий
+    Document = apps.get_model("docs", "Document")
+    DocumentVersion = apps.get_model("docs", "DocumentVersion")
+    counts = (
+        DocumentVersion.objects.filter(document=OuterRef("pk"))
+        .order_by()
+        .values("document")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    Document.objects.update(version_seq=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docs', '0004_document_revision'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='version_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_version_seq, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['owner', '-updated_at'], name='doc_owner_live_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentversion',
+            index=models.Index(fields=['document', '-created_at'], name='docver_doc_created_idx'),
+        ),
+    ]
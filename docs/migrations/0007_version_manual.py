@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:46
+
+from django.db import migrations, models
+
+
+def mark_labeled_snapshots(apps, schema_editor):
+    # автоматические версии получали метку v<номер>; остальные метки ставил пользователь
+    DocumentVersion = apps.get_model("docs", "DocumentVersion")
+    DocumentVersion.objects.exclude(label__regex=r"^v[0-9]+$").update(manual=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docs', '0006_generation_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentversion',
+            name='manual',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_labeled_snapshots, migrations.RunPython.noop),
+    ]
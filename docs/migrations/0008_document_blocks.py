@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:03
+
+import django.db.models.deletion
+import docs.models
+from django.db import migrations, models
+from django.db.models.functions import Length
+
+
+def split_documents(apps, schema_editor):
+    # большие документы переносим в блоки (docs/blocks.py), по одному
+    from docs import blocks
+
+    Document = apps.get_model("docs", "Document")
+    DocumentBlock = apps.get_model("docs", "DocumentBlock")
+    threshold = blocks.conf()["THRESHOLD"]
+    if threshold is None:
+        return
+    ids = Document.objects.annotate(n=Length("content_html")).filter(n__gte=threshold).values_list("pk", flat=True)
+    for pk in list(ids):
+        content = Document.objects.filter(pk=pk).values_list("content_html", flat=True).get()
+        DocumentBlock.objects.bulk_create(
+            DocumentBlock(document_id=pk, position=i, hash=blocks.digest(html), html=html)
+            for i, html in enumerate(blocks.split(content))
+        )
+        Document.objects.filter(pk=pk).update(content_html="", chunked=True)
+
+
+def join_documents(apps, schema_editor):
+    Document = apps.get_model("docs", "Document")
+    DocumentBlock = apps.get_model("docs", "DocumentBlock")
+    for pk in list(Document.objects.filter(chunked=True).values_list("pk", flat=True)):
+        parts = DocumentBlock.objects.filter(document_id=pk).order_by("position").values_list("html", flat=True)
+        Document.objects.filter(pk=pk).update(content_html="".join(parts), chunked=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docs', '0007_version_manual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='chunked',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='content_html',
+            field=docs.models.ContentField(blank=True, default=''),
+        ),
+        migrations.CreateModel(
+            name='DocumentBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('hash', models.CharField(max_length=40)),
+                ('html', models.TextField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocks', to='docs.document')),
+            ],
+            options={
+                'ordering': ['position'],
+                'indexes': [models.Index(fields=['document', 'position'], name='docblock_doc_pos_idx')],
+            },
+        ),
+        migrations.RunPython(split_documents, join_documents),
+    ]
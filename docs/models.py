@@ -1,28 +1,174 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
+from django.db.models.query_utils import DeferredAttribute
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+
+class BlockContent(DeferredAttribute):
+    """content_html блочного документа собирается из DocumentBlock при первом обращении."""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        name = self.field.attname
+        if name not in instance.__dict__ and instance.pk is not None and instance.chunked:
+            from .blocks import assemble
+            instance.__dict__[name] = assemble(instance.pk)
+        return super().__get__(instance, cls)
+
+
+class ContentField(models.TextField):
+    descriptor_class = BlockContent
+
+    def pre_save(self, model_instance, add):
+        # у блочного документа содержимое в DocumentBlock, колонка пустая
+        if model_instance.chunked:
+            return ""
+        return super().pre_save(model_instance, add)
+
+
 class Document(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="documents")
     title = models.CharField(max_length=255, default="Без названия")
-    content_html = models.TextField(blank=True, default="")
+    content_html = ContentField(blank=True, default="")
+    # содержимое хранится блоками (docs/blocks.py)
+    chunked = models.BooleanField(default=False)
     is_deleted = models.BooleanField(default=False)
+    # растёт при каждом изменении содержимого; база для PATCH-операций (docs/patching.py)
+    revision = models.PositiveIntegerField(default=0)
+    # номер последней созданной версии; растёт атомарно (versioning.next_version_number)
+    version_seq = models.PositiveIntegerField(default=0)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-updated_at"]
+        indexes = [
+            # список документов владельца: WHERE owner AND NOT is_deleted ORDER BY updated_at DESC
+            models.Index(
+                fields=["owner", "-updated_at"],
+                condition=models.Q(is_deleted=False),
+                name="doc_owner_live_updated_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.owner})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if instance.__dict__.get("chunked"):
+            # пустая колонка — не содержимое: соберётся из блоков при обращении
+            instance.__dict__.pop("content_html", None)
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if "content_html" not in self.__dict__ or (update_fields is not None and "content_html" not in update_fields):
+            return super().save(*args, **kwargs)
+        from . import blocks
+
+        was_chunked = self.chunked
+        self.chunked = blocks.should_chunk(self.content_html)
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "chunked"}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.chunked or was_chunked:
+                blocks.sync(self.pk, self.content_html if self.chunked else "")
+
+
+class DocumentBlock(models.Model):
+    """Блок содержимого большого документа (docs/blocks.py)."""
+
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="blocks")
+    position = models.PositiveIntegerField()
+    hash = models.CharField(max_length=40)  # SHA-1 html
+    html = models.TextField()
+
+    class Meta:
+        ordering = ["position"]
+        indexes = [
+            models.Index(fields=["document", "position"], name="docblock_doc_pos_idx"),
+        ]
+
+
 class DocumentVersion(models.Model):
+    KIND_CHOICES = [("full", "Полный снимок"), ("delta", "Дельта")]
+
     document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name="versions")
     label = models.CharField(max_length=32, default="v1")
-    content_html = models.TextField(blank=True, default="")
+    # содержимое хранится сжатым: полный снимок (ключевой кадр) или дельта к кадру base
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES, default="full")
+    base = models.ForeignKey("self", null=True, blank=True, on_delete=models.RESTRICT, related_name="deltas")
+    data = models.BinaryField(default=b"")
+    size = models.PositiveIntegerField(default=0)  # длина исходного HTML
+    # снимок, сделанный пользователем вручную: политика хранения его не удаляет
+    manual = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["document", "-created_at"], name="docver_doc_created_idx"),
+        ]
+
+    @property
+    def content_html(self):
+        if not hasattr(self, "_content_html"):
+            from .versioning import load_content
+            self._content_html = load_content(self)
+        return self._content_html
+
+
+class GenerationJob(models.Model):
+    """Фоновая AI-генерация (docs/jobs.py): не держит HTTP-воркер на время вызова провайдера."""
+
+    QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+    STATUS_CHOICES = [
+        (QUEUED, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (SUCCEEDED, "Готово"),
+        (FAILED, "Ошибка"),
+        (CANCELLED, "Отменено"),
+    ]
+    WRITE_CHOICES = [("", "Не записывать"), ("append", "В конец документа"), ("replace", "Заменить"), ("new", "Новый документ")]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="generation_jobs")
+    mode = models.CharField(max_length=16, default="generate")
+    params = models.JSONField(default=dict)  # prompt, selection, html, title
+    # куда записать результат
+    document = models.ForeignKey(Document, null=True, blank=True, on_delete=models.SET_NULL, related_name="generation_jobs")
+    write = models.CharField(max_length=8, choices=WRITE_CHOICES, blank=True, default="")
+    version = models.ForeignKey(DocumentVersion, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    cancel_requested = models.BooleanField(default=False)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    next_attempt_at = models.DateTimeField(auto_now_add=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # последний признак жизни воркера
+    result_text = models.TextField(blank=True, default="")
+    error = models.TextField(blank=True, default="")
+
     created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
-        ordering = ["-created_at"]
\ No newline at end of file
+        ordering = ["-created_at"]
+        indexes = [
+            # выборка следующей задачи воркером
+            models.Index(fields=["status", "next_attempt_at"], name="genjob_status_next_idx"),
+            models.Index(fields=["owner", "-created_at"], name="genjob_owner_created_idx"),
+        ]
+
+    @property
+    def finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED, self.CANCELLED)
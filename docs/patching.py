@@ -0,0 +1,86 @@
+"""
+Инкрементальное обновление содержимого документа.
+
+Клиент присылает операции над текстом content_html базовой ревизии:
+
+    {"base_revision": 12, "ops": [
+        {"op": "replace", "start": 120, "end": 130, "text": "<b>новое</b>"},
+        {"op": "insert", "at": 500, "text": "<p>абзац</p>"},
+        {"op": "delete", "start": 900, "end": 950},
+    ]}
+
+Все смещения — относительно базовой ревизии (а не результата предыдущей
+операции) и считаются в единицах UTF-16, как String.length в браузере.
+Диапазоны не должны пересекаться.
+"""
+
+
+class PatchError(ValueError):
+    pass
+
+
+def _int(op, name):
+    value = op.get(name)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+        raise PatchError(f"{name}: ожидается неотрицательное целое")
+    return value
+
+
+def normalize_ops(ops) -> list:
+    """Проверяет операции и приводит к списку (start, end, text), отсортированному по start."""
+    if not isinstance(ops, list) or not ops:
+        raise PatchError("ops: ожидается непустой список операций")
+    ranges = []
+    for i, op in enumerate(ops):
+        if not isinstance(op, dict):
+            raise PatchError(f"ops[{i}]: ожидается объект")
+        kind = op.get("op")
+        try:
+            if kind == "replace":
+                start, end, text = _int(op, "start"), _int(op, "end"), op.get("text", "")
+            elif kind == "insert":
+                start = end = _int(op, "at")
+                text = op.get("text", "")
+            elif kind == "delete":
+                start, end, text = _int(op, "start"), _int(op, "end"), ""
+            else:
+                raise PatchError(f"неизвестная операция {kind!r}")
+        except PatchError as e:
+            raise PatchError(f"ops[{i}]: {e}") from None
+        if not isinstance(text, str):
+            raise PatchError(f"ops[{i}]: text должен быть строкой")
+        if end < start:
+            raise PatchError(f"ops[{i}]: end < start")
+        ranges.append((start, end, text))
+    ranges.sort(key=lambda r: (r[0], r[1]))
+    for (_, prev_end, _), (start, _, _) in zip(ranges, ranges[1:]):
+        if start < prev_end:
+            raise PatchError("диапазоны операций пересекаются")
+    return ranges
+
+
+def _splice(base, ranges, empty):
+    if ranges[-1][1] > len(base):
+        raise PatchError("смещение за пределами документа")
+    parts, pos = [], 0
+    for start, end, text in ranges:
+        parts.append(base[pos:start])
+        parts.append(text)
+        pos = end
+    parts.append(base[pos:])
+    return empty.join(parts)
+
+
+def apply_ops(base: str, ops) -> str:
+    """Применяет операции к тексту базовой ревизии; PatchError — если они некорректны."""
+    ranges = normalize_ops(ops)
+    raw = None if base.isascii() else base.encode("utf-16-le", "surrogatepass")
+    if raw is None or len(raw) == 2 * len(base):
+        # без символов вне BMP индексы UTF-16 совпадают с индексами str
+        return _splice(base, ranges, "")
+    # иначе режем UTF-16 байты: смещение n → 2n
+    encoded = [(s * 2, e * 2, t.encode("utf-16-le", "surrogatepass")) for s, e, t in ranges]
+    try:
+        return _splice(raw, encoded, b"").decode("utf-16-le")
+    except UnicodeDecodeError:
+        raise PatchError("смещение попадает внутрь суррогатной пары") from None
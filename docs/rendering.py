@@ -0,0 +1,380 @@
+"""
+Ответ модели (Markdown с блоками ```mermaid и ```chart) → безопасный HTML.
+
+Markdown разбирается своим подмножеством: весь текст экранируется, а
+разметка порождается только из известных конструкций — заголовки, абзацы,
+списки, цитаты, таблицы, черта, блоки кода, **жирный**, *курсив*, `код`,
+~~зачёркнутый~~, ссылки и картинки (http/https/mailto). Результат можно
+вставлять в документ без отдельной санитизации.
+
+Mermaid чинится так же, как раньше фронтенд перед каждой отрисовкой:
+невидимые символы и типографские тире, лишние заголовки диаграмм,
+недостающий заголовок; для flowchart — скобки в подписях, хвосты после
+узлов, незакрытые subgraph; задачи gantt без параметров; синтаксис
+quadrantChart. Chart — JSON для Chart.js: комментарии, висячие запятые,
+ключи и строки без двойных кавычек; если не чинится — остаётся обычным
+блоком кода. Починенные блоки помечены data-normalized, фронтенд их
+больше не трогает.
+
+HTML каждого блока кэшируется по SHA-256 исходника: одинаковые блоки
+(повтор генерации, стрим и итоговый ответ) не обрабатываются повторно.
+BlockRenderer отдаёт HTML по мере завершения блоков — для стрима.
+"""
+import hashlib
+import html
+import json
+import re
+
+from django.conf import settings
+
+from .lru import LRUCache
+
+_blocks = LRUCache(maxsize=getattr(settings, "AI_RENDER_CACHE_SIZE", 1024))
+
+_FENCE_RE = re.compile(r"^```", re.MULTILINE)
+_BLANK_RE = re.compile(r"\n[ \t]*\n")
+
+
+# ---------- разбиение на блоки ----------
+
+def _take_block(buf, final=False):
+    """(завершённый блок, остаток) или (None, buf), если блок ещё не дописан."""
+    stripped = buf.lstrip("\n")
+    if not stripped.strip():
+        return None, ("" if final else buf)
+    buf = stripped
+    if buf.startswith("```"):
+        first = buf.find("\n")
+        if first >= 0:
+            m = re.compile(r"^```[ \t]*$", re.MULTILINE).search(buf, first + 1)
+            if m:
+                end = buf.find("\n", m.end())
+                end = len(buf) if end < 0 else end + 1
+                return buf[:end], buf[end:]
+        return (buf, "") if final else (None, buf)
+    ends = [m.start() for m in (_BLANK_RE.search(buf), _FENCE_RE.search(buf, 1)) if m]
+    if ends:
+        end = min(ends)
+        return buf[:end], buf[end:]
+    return (buf, "") if final else (None, buf)
+
+
+class BlockRenderer:
+    """Инкрементальный рендер: feed() → HTML блоков, завершённых к этому моменту."""
+
+    def __init__(self):
+        self._buf = ""
+
+    def feed(self, text):
+        self._buf += text
+        return self._drain(False)
+
+    def finish(self):
+        return self._drain(True)
+
+    def _drain(self, final):
+        out = []
+        while True:
+            block, self._buf = _take_block(self._buf, final)
+            if block is None:
+                return out
+            fragment = render_block(block)
+            if fragment:
+                out.append(fragment)
+
+
+def render_markdown(text: str) -> str:
+    renderer = BlockRenderer()
+    return "\n".join(renderer.feed(text or "") + renderer.finish())
+
+
+def render_block(block: str) -> str:
+    key = hashlib.sha256(block.encode("utf-8")).hexdigest()
+    fragment = _blocks.get(key)
+    if fragment is None:
+        fragment = _render_fenced(block) if block.startswith("```") else _render_text(block)
+        _blocks.set(key, fragment)
+    return fragment
+
+
+# ---------- блоки кода ----------
+
+def _code(code, lang="", normalized=False):
+    attrs = f' class="language-{lang}"' if lang else ""
+    if normalized:
+        attrs += ' data-normalized="1"'
+    return f"<pre><code{attrs}>{html.escape(code, quote=False)}</code></pre>"
+
+
+def _render_fenced(block):
+    header, _, body = block.partition("\n")
+    lang = re.sub(r"[^\w-]", "", header[3:].strip().split(" ")[0]).lower()
+    body = re.sub(r"\n?```[ \t]*\n?$", "", body)
+    if lang == "mermaid":
+        return _code(repair_mermaid(body), lang, normalized=True)
+    if lang == "chart":
+        config = repair_chart(body)
+        if config is not None:
+            return _code(config, lang, normalized=True)
+    return _code(body.rstrip("\n"), lang)
+
+
+# ---------- Mermaid ----------
+
+_DIAGRAM_TYPES = (
+    "flowchart", "graph", "sequenceDiagram", "classDiagram", "stateDiagram-v2", "stateDiagram",
+    "erDiagram", "journey", "gantt", "pie", "mindmap", "timeline", "quadrantChart", "gitGraph",
+)
+_HEADER_RE = re.compile(r"^\s*(" + "|".join(re.escape(t) for t in _DIAGRAM_TYPES) + r")\b", re.IGNORECASE)
+_GANTT_DIRECTIVE_RE = re.compile(
+    r"^(gantt|title|dateFormat|axisFormat|excludes|includes|todayMarker|tickInterval|weekday|section)\b", re.I
+)
+# после закрытого узла допустимы только связь, класс или стиль; остальное — мусор модели
+_NODE_TAIL_RE = re.compile(r"([\])])[ \t]+(?![ \t]|[-=.~&:|<]|style\b|class\b|click\b|linkStyle\b).+$")
+
+
+def _escape_parens(m):
+    return m.group(0)[0] + m.group(1).replace("(", "&#40;").replace(")", "&#41;") + m.group(0)[-1]
+
+
+def repair_mermaid(code: str) -> str:
+    code = code.lstrip("\ufeff").replace("\r\n", "\n").replace("\r", "\n")
+    code = re.sub(r"[\u00a0\u1680\u180e\u2000-\u200b\u202f\u205f\u3000\ufeff]", " ", code)
+    code = re.sub(r"[\u200c-\u200f\u061c]", "", code)  # ZWNJ/ZWJ, метки направления
+    code = re.sub(r"[\u2795\ufe62\uff0b]", "+", code)
+    code = re.sub(r"[\uff08\ufe59]", "(", code)
+    code = re.sub(r"[\uff09\ufe5a]", ")", code)
+    code = re.sub(r"[\u2010-\u2015\u2212]", "-", code)
+    code = code.replace("\t", "  ").replace("\\n", "<br/>")
+    lines = [line.rstrip() for line in code.strip("\n").split("\n")]
+
+    # несколько заголовков диаграмм (типичный артефакт) — оставляем один:
+    # quadrantChart, если он есть (flowchart над ним — заготовка модели), иначе первый
+    headers = [i for i, line in enumerate(lines) if _HEADER_RE.match(line)]
+    if len(headers) > 1:
+        keep = next((i for i in headers if lines[i].strip().lower().startswith("quadrantchart")), headers[0])
+        lines = [line for i, line in enumerate(lines) if i == keep or i not in headers]
+    header = next((_HEADER_RE.match(line) for line in lines if line.strip()), None)
+    if header is None:
+        lines.insert(0, "flowchart TD")
+        kind = "flowchart"
+    else:
+        kind = header.group(1).lower()
+
+    if kind in ("flowchart", "graph"):
+        lines = _repair_flowchart(lines)
+    elif kind == "gantt":
+        lines = [
+            line if not line.strip() or line.strip().startswith("%%") or ":" in line
+            or _GANTT_DIRECTIVE_RE.match(line.strip()) else re.sub(r"^(\s*)", r"\1%% ", line)
+            for line in lines
+        ]
+    elif kind == "quadrantchart":
+        lines = [_repair_quadrant(line) for line in lines]
+    return "\n".join(lines) + "\n"
+
+
+def _repair_flowchart(lines):
+    out = []
+    for line in lines:
+        line = re.sub(r"\[([^\[\]]*?)---([^\[\]]*?)\]", r"[\1—\2]", line)
+        line = re.sub(r"\(([^()]*?)---([^()]*?)\)", r"(\1—\2)", line)
+        line = re.sub(r"\[([^\[\]]*)\]", _escape_parens, line)
+        line = re.sub(r"\{([^{}]*)\}", _escape_parens, line)
+        line = re.sub(r"(^|[^:])//.*$", r"\1", line).rstrip()
+        if re.match(r"^\s*end\b", line, re.I):
+            line = re.sub(r"^(\s*end)\b.*$", r"\1", line, flags=re.I)
+        line = _NODE_TAIL_RE.sub(r"\1", line)
+        line = re.sub(r"([\])])\s*:\s*$", r"\1", line)
+        out.append(line)
+    opened = sum(bool(re.match(r"^\s*subgraph\b", line, re.I)) for line in out)
+    closed = sum(bool(re.match(r"^\s*end\s*$", line, re.I)) for line in out)
+    out.extend(["end"] * max(0, opened - closed))
+    return out
+
+
+def _repair_quadrant(line):
+    m = re.match(r'^\s*([xy]-axis)\s+([^"\n]+?)\s*-->\s*([^"\n]+?)\s*$', line, re.I)
+    if m:
+        return f'{m.group(1)} "{m.group(2).strip()}" --> "{m.group(3).strip()}"'
+    m = re.match(r'^\s*("?[^":]+?"?)\s*:\s*\[?\s*([0-9]+(?:\.[0-9]+)?)\s*,\s*([0-9]+(?:\.[0-9]+)?)\s*\]?\s*$', line)
+    if m and not _HEADER_RE.match(line) and not re.match(r"^\s*(title|quadrant-\d)\b", line):
+        return f'"{m.group(1).strip().strip(chr(34)).strip()}" : [{m.group(2)}, {m.group(3)}]'
+    return line
+
+
+# ---------- Chart.js ----------
+
+def repair_chart(code: str):
+    """Конфиг Chart.js канонизированным JSON или None, если это не конфиг."""
+    text = code.strip()
+    try:
+        config = json.loads(text)
+    except ValueError:
+        fixed = re.sub(r"/\*.*?\*/", "", text, flags=re.DOTALL)
+        fixed = re.sub(r"(^|[\s,{\[])//[^\n]*", r"\1", fixed)
+        fixed = re.sub(r"'((?:[^'\\\n]|\\.)*)'", lambda m: json.dumps(m.group(1)), fixed)
+        fixed = re.sub(r"([{,]\s*)([A-Za-z_$][\w$]*)\s*:", r'\1"\2":', fixed)
+        fixed = re.sub(r",\s*([}\]])", r"\1", fixed)
+        try:
+            config = json.loads(fixed)
+        except ValueError:
+            return None
+    if not isinstance(config, dict) or "type" not in config or "data" not in config:
+        return None
+    return json.dumps(config, ensure_ascii=False, indent=2)
+
+
+# ---------- Markdown ----------
+
+_HEADING_RE = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$")
+_HR_RE = re.compile(r"^\s{0,3}([-*_])(\s*\1){2,}\s*$")
+_LIST_RE = re.compile(r"^( *)([-*+]|\d{1,9}[.)])\s+(.*)$")
+_TABLE_SEP_RE = re.compile(r"^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$")
+_CODE_SPAN_RE = re.compile(r"(`+)(.+?)\1", re.DOTALL)
+_SAFE_URL_RE = re.compile(r"^(https?:|mailto:|/|#)", re.I)
+_INLINE = [
+    (re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*|__(?=\S)(.+?)(?<=\S)__"), "strong"),
+    (re.compile(r"\*(?=\S)(.+?)(?<=\S)\*|(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)"), "em"),
+    (re.compile(r"~~(?=\S)(.+?)(?<=\S)~~"), "del"),
+]
+
+
+def _link(m, keep):
+    image, text, url = m.group(1), m.group(2), html.unescape(m.group(3))
+    if not _SAFE_URL_RE.match(url) or (image and not url.lower().startswith(("http:", "https:"))):
+        return m.group(0)
+    url = html.escape(url)
+    if image:
+        return keep(f'<img src="{url}" alt="{text.replace(chr(34), "&quot;")}">')
+    return keep(f'<a href="{url}" rel="noopener noreferrer">') + text + "</a>"
+
+
+def _inline_text(text):
+    text = html.escape(text.replace("\0", ""), quote=False)
+    text = re.sub(r"&lt;br\s*/?&gt;", "<br>", text)
+    # готовые теги прячем за \0N\0: выделение не должно разбирать «_» и «*» в href/src/alt
+    tags = []
+
+    def keep(tag):
+        tags.append(tag)
+        return f"\0{len(tags) - 1}\0"
+
+    text = re.sub(r"(!?)\[([^\]]*)\]\(\s*([^()\s]+)\s*\)", lambda m: _link(m, keep), text)
+    for pattern, tag in _INLINE:
+        text = pattern.sub(lambda m, tag=tag: f"<{tag}>{m.group(1) or m.group(2)}</{tag}>", text)
+    return re.sub(r"\0(\d+)\0", lambda m: tags[int(m.group(1))], text)
+
+
+def inline(text: str) -> str:
+    out, pos = [], 0
+    for m in _CODE_SPAN_RE.finditer(text):
+        out.append(_inline_text(text[pos:m.start()]))
+        out.append(f"<code>{html.escape(m.group(2).strip(), quote=False)}</code>")
+        pos = m.end()
+    out.append(_inline_text(text[pos:]))
+    return "".join(out)
+
+
+def _cells(line):
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|"):
+        line = line[:-1]
+    return [cell.strip() for cell in line.split("|")]
+
+
+def _render_table(lines):
+    aligns = []
+    for cell in _cells(lines[1]):
+        left, right = cell.startswith(":"), cell.endswith(":")
+        aligns.append("center" if left and right else "right" if right else "left" if left else "")
+
+    def row(line, tag):
+        cells = _cells(line)
+        out = []
+        for i, cell in enumerate(cells):
+            align = aligns[i] if i < len(aligns) else ""
+            style = f' style="text-align:{align}"' if align else ""
+            out.append(f"<{tag}{style}>{inline(cell)}</{tag}>")
+        return "<tr>" + "".join(out) + "</tr>"
+
+    body = "".join(row(line, "td") for line in lines[2:])
+    return f"<table><thead>{row(lines[0], 'th')}</thead><tbody>{body}</tbody></table>"
+
+
+def _render_list(lines):
+    out, stack = [], []  # stack: (отступ, тег)
+    for line in lines:
+        m = _LIST_RE.match(line)
+        if m is None:
+            out.append(" " + inline(line.strip()))  # продолжение пункта
+            continue
+        indent, marker = len(m.group(1)), m.group(2)
+        tag = "ol" if marker[0].isdigit() else "ul"
+        if not stack or indent > stack[-1][0]:
+            start = int(marker[:-1]) if tag == "ol" and int(marker[:-1]) != 1 else None
+            out.append(f'<{tag} start="{start}">' if start else f"<{tag}>")
+            stack.append((indent, tag))
+        else:
+            while len(stack) > 1 and indent < stack[-1][0]:
+                out.append(f"</li></{stack.pop()[1]}>")
+            out.append("</li>")
+            if stack[-1][1] != tag:
+                out.append(f"</{stack[-1][1]}><{tag}>")
+                stack[-1] = (stack[-1][0], tag)
+        out.append("<li>" + inline(m.group(3)))
+    while stack:
+        out.append(f"</li></{stack.pop()[1]}>")
+    return "".join(out)
+
+
+def _render_text(text):
+    lines = text.rstrip("\n").split("\n")
+    out, para = [], []
+
+    def flush():
+        if para:
+            out.append("<p>" + inline("\n".join(para)) + "</p>")
+            para.clear()
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        m = _HEADING_RE.match(line)
+        if m:
+            flush()
+            level = len(m.group(1))
+            out.append(f"<h{level}>{inline(m.group(2))}</h{level}>")
+            i += 1
+        elif _HR_RE.match(line):
+            flush()
+            out.append("<hr>")
+            i += 1
+        elif line.lstrip().startswith(">"):
+            flush()
+            quoted = []
+            while i < len(lines) and lines[i].lstrip().startswith(">"):
+                quoted.append(re.sub(r"^\s*> ?", "", lines[i]))
+                i += 1
+            out.append("<blockquote>" + _render_text("\n".join(quoted)) + "</blockquote>")
+        elif "|" in line and i + 1 < len(lines) and _TABLE_SEP_RE.match(lines[i + 1]) and "-" in lines[i + 1]:
+            flush()
+            j = i + 2
+            while j < len(lines) and "|" in lines[j]:
+                j += 1
+            out.append(_render_table(lines[i:j]))
+            i = j
+        elif _LIST_RE.match(line):
+            flush()
+            j = i + 1
+            while j < len(lines) and (_LIST_RE.match(lines[j]) or lines[j].startswith((" ", "\t"))):
+                j += 1
+            out.append(_render_list(lines[i:j]))
+            i = j
+        else:
+            para.append(line.strip())
+            i += 1
+    flush()
+    return "\n".join(out)
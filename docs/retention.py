@@ -0,0 +1,183 @@
+"""
+Политика хранения версий и сжатие накопленной истории.
+
+Склейка автосохранений (docs/versioning.py) не даёт плодить версии на
+каждую правку, а здесь прореживается то, что уже накопилось. Остаются:
+- все версии моложе KEEP_ALL;
+- последняя версия каждого часа — моложе HOURLY;
+- последняя версия каждого дня — моложе DAILY;
+- ручные снимки (manual) и последняя версия документа — всегда.
+None вместо срока — ярус без ограничения по возрасту.
+
+Удаление идёт группами «ключевой кадр + его дельты», каждая в своей
+короткой транзакции: если кадр удаляется, а часть его дельт остаётся,
+они перекодируются (versioning.rebase_deltas) до удаления кадра.
+Документы обходятся порциями по BATCH_SIZE с паузой PAUSE между ними.
+
+    python manage.py compact_versions [--document ID] [--dry-run]
+
+Периодически — в процессе: поток запускается при первой записи версии и
+раз в INTERVAL секунд сжимает историю. При нескольких процессах проход за
+интервал выполняет один из них (блокировка в общем Django-кэше).
+
+    DOCS_VERSION_RETENTION = {"KEEP_ALL": 3600, "HOURLY": 86400, "DAILY": 2592000, ...}
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import versioning
+from .models import Document, DocumentVersion
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "KEEP_ALL": 3600,
+    "HOURLY": 24 * 3600,
+    "DAILY": 30 * 24 * 3600,
+    "BATCH_SIZE": 200,
+    "PAUSE": 0.05,
+    "INTERVAL": 3600,
+}
+TIERS = (("HOURLY", 3600), ("DAILY", 24 * 3600))
+LOCK_KEY = "docs:version-retention"
+
+
+def conf() -> dict:
+    return {**DEFAULTS, **getattr(settings, "DOCS_VERSION_RETENTION", {})}
+
+
+def retained(versions, now, options=None) -> set:
+    """
+    id версий, которые остаются по политике.
+    versions — (id, created_at, manual) от новых к старым.
+    """
+    options = options or conf()
+    keep, seen = set(), set()
+    for i, (pk, created_at, manual) in enumerate(versions):
+        age = (now - created_at).total_seconds()
+        stamp = int(created_at.timestamp())
+        buckets = [(tier, stamp // span) for tier, span in TIERS]
+        kept = i == 0 or age < options["KEEP_ALL"]
+        if not kept:
+            for (tier, _), bucket in zip(TIERS, buckets):
+                limit = options[tier]
+                if limit is None or age < limit:
+                    kept = bucket not in seen
+                    break
+        if kept:
+            seen.update(buckets)
+        if kept or manual:
+            keep.add(pk)
+    return keep
+
+
+def _compact_group(key, members, keep):
+    dropped = [pk for pk in members if pk not in keep]
+    if key not in keep:
+        survivors = [pk for pk in members if pk != key and pk in keep]
+        if survivors:
+            versioning.rebase_deltas(key, survivors)
+    DocumentVersion.objects.filter(pk__in=[pk for pk in dropped if pk != key]).delete()
+    if key not in keep:
+        # RESTRICT: если к кадру успела добавиться дельта, транзакция откатится
+        DocumentVersion.objects.filter(pk=key).delete()
+
+
+def compact_document(document_id, now=None, options=None, dry_run=False) -> int:
+    """Прореживает историю одного документа; возвращает число удалённых версий."""
+    now = now or timezone.now()
+    rows = list(
+        DocumentVersion.objects.filter(document_id=document_id)
+        .order_by("-created_at", "-id")
+        .values_list("id", "created_at", "manual", "kind", "base_id")
+    )
+    keep = retained([row[:3] for row in rows], now, options)
+    if len(keep) == len(rows):
+        return 0
+
+    groups = defaultdict(list)  # кадр → [кадр, его дельты]
+    for pk, _, _, kind, base_id in rows:
+        groups[pk if kind == versioning.KIND_FULL else base_id].append(pk)
+    deleted = 0
+    for key, members in groups.items():
+        dropped = sum(pk not in keep for pk in members)
+        if not dropped:
+            continue
+        if not dry_run:
+            try:
+                with transaction.atomic():
+                    _compact_group(key, members, keep)
+            except IntegrityError:
+                logger.warning("version group %s of document %s changed during compaction", key, document_id)
+                continue
+            if key not in keep:
+                versioning.forget_keyframe(key)
+        deleted += dropped
+    return deleted
+
+
+def compact(now=None, options=None, dry_run=False, document_ids=None) -> dict:
+    """Проход по всем документам, у которых есть версии старше KEEP_ALL."""
+    options = options or conf()
+    now = now or timezone.now()
+    old = DocumentVersion.objects.filter(
+        document=OuterRef("pk"), manual=False, created_at__lt=now - timedelta(seconds=options["KEEP_ALL"])
+    )
+    docs = Document.objects.filter(Exists(old)).order_by("pk")
+    if document_ids is not None:
+        docs = docs.filter(pk__in=document_ids)
+    stats = {"documents": 0, "deleted": 0}
+    last = 0
+    while True:
+        batch = list(docs.filter(pk__gt=last).values_list("pk", flat=True)[:options["BATCH_SIZE"]])
+        if not batch:
+            return stats
+        for pk in batch:
+            stats["deleted"] += compact_document(pk, now, options, dry_run)
+        stats["documents"] += len(batch)
+        last = batch[-1]
+        if options["PAUSE"]:
+            time.sleep(options["PAUSE"])
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _run_periodically(interval):
+    while True:
+        time.sleep(interval)
+        if not cache.add(LOCK_KEY, True, interval):
+            continue
+        try:
+            stats = compact()
+            logger.info("version compaction: %(deleted)s versions in %(documents)s documents", stats)
+        except Exception:
+            logger.exception("version compaction failed")
+        finally:
+            close_old_connections()
+
+
+def schedule():
+    """Запускает периодическое сжатие в этом процессе (один раз, если INTERVAL задан)."""
+    global _scheduler
+    if _scheduler is not None:
+        return
+    interval = conf()["INTERVAL"]
+    if not interval:
+        return
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(
+                target=_run_periodically, args=(interval,), name="version-retention", daemon=True
+            )
+            _scheduler.start()
@@ -0,0 +1,331 @@
+"""
+Полнотекстовый поиск по документам.
+
+При сохранении из content_html извлекается plain text, слова приводятся
+к основе (стеммер Snowball для русского) и пишутся в индекс.
+Бэкенд выбирается настройкой DOCS_SEARCH_BACKEND; по умолчанию на sqlite —
+FTS5 с ранжированием bm25, на остальных СУБД — простой icontains по основам.
+"""
+import html
+import re
+from functools import lru_cache
+from html.parser import HTMLParser
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+FTS_TABLE = "docs_document_fts"
+
+_BLOCK_TAGS = {
+    "p", "div", "br", "li", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6",
+    "tr", "td", "th", "table", "pre", "blockquote", "section", "article", "hr",
+}
+_SKIP_TAGS = {"script", "style", "template"}
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(content_html: str) -> str:
+    """Plain text без разметки; блоки разделены переводом строки."""
+    parser = _TextExtractor()
+    parser.feed(content_html or "")
+    parser.close()
+    text = "".join(parser.parts)
+    text = re.sub(r"[ \t\r\f\v]+", " ", text)
+    return re.sub(r"\s*\n\s*", "\n", text).strip()
+
+
+# --- Стеммер (Snowball, русский) ---
+
+_VOWELS = set("аеиоуыэюя")
+
+
+def _table(group1="", group2=""):
+    """
+    Таблица суффиксов для _cut: [(длина, {суффикс: нужна ли «а»/«я» перед ним})]
+    по убыванию длины. group1 — суффиксы, требующие «а»/«я» перед собой.
+    """
+    by_len = {}
+    for need_a, group in ((True, group1), (False, group2)):
+        for suf in group.split():
+            by_len.setdefault(len(suf), {})[suf] = need_a
+    return sorted(by_len.items(), reverse=True)
+
+
+_ADJECTIVE = "ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого ему ому их ых ую юю ая яя ою ею"
+_PARTICIPLE_1 = "ем нн вш ющ щ"
+_PARTICIPLE_2 = "ивш ывш ующ"
+
+_PERFECTIVE = _table("в вши вшись", "ив ивши ившись ыв ывши ывшись")
+_REFLEXIVE = _table("", "ся сь")
+_ADJECTIVAL = _table(
+    " ".join(p + a for p in _PARTICIPLE_1.split() for a in _ADJECTIVE.split()),
+    " ".join(p + a for p in _PARTICIPLE_2.split() for a in _ADJECTIVE.split()) + " " + _ADJECTIVE,
+)
+_VERB = _table(
+    "ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно",
+    "ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило ыло ено ят "
+    "ует уют ит ыт ены ить ыть ишь ую ю",
+)
+_NOUN = _table(
+    "",
+    "а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям ием ем ам ом о у "
+    "ах иях ях ы ь ию ью ю ия ья я",
+)
+_SUPERLATIVE = _table("", "ейш ейше")
+_DERIVATIONAL = _table("", "ост ость")
+
+
+def _regions(word):
+    rv = r1 = r2 = len(word)
+    for i, ch in enumerate(word):
+        if ch in _VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in _VOWELS and word[i] not in _VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in _VOWELS and word[i] not in _VOWELS:
+            r2 = i + 1
+            break
+    return rv, r1, r2
+
+
+def _cut(word, start, table):
+    """Отрезает самый длинный подходящий суффикс в области word[start:]."""
+    region = word[start:]
+    for length, suffixes in table:
+        if length > len(region):
+            continue
+        need_a = suffixes.get(region[-length:])
+        if need_a is None:
+            continue
+        # суффиксы группы 1 требуют «а»/«я» перед собой (внутри RV),
+        # иначе пробуем более короткие
+        if need_a and (length == len(region) or region[-length - 1] not in "ая"):
+            continue
+        return word[:-length]
+    return None
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    if len(word) < 3 or not any("а" <= ch <= "я" for ch in word):
+        return word
+    rv, _, r2 = _regions(word)
+
+    # шаг 1
+    res = _cut(word, rv, _PERFECTIVE)
+    if res is None:
+        word = _cut(word, rv, _REFLEXIVE) or word
+        res = _cut(word, rv, _ADJECTIVAL)
+        if res is None:
+            res = _cut(word, rv, _VERB)
+        if res is None:
+            res = _cut(word, rv, _NOUN)
+    if res is not None:
+        word = res
+
+    # шаг 2
+    if word[rv:].endswith("и"):
+        word = word[:-1]
+
+    # шаг 3
+    word = _cut(word, r2, _DERIVATIONAL) or word
+
+    # шаг 4
+    if word[rv:].endswith("нн"):
+        word = word[:-1]
+    else:
+        res = _cut(word, rv, _SUPERLATIVE)
+        if res is not None:
+            word = res[:-1] if res[rv:].endswith("нн") else res
+        elif word[rv:].endswith("ь"):
+            word = word[:-1]
+    return word
+
+
+def stems(text: str) -> list:
+    return [stem(w) for w in _WORD_RE.findall(text or "")]
+
+
+def make_snippet(text: str, query_stems, width: int = 160) -> str:
+    """Фрагмент текста вокруг первого совпадения; совпадения в <mark>, остальное экранировано."""
+    query_stems = set(query_stems)
+    words = list(_WORD_RE.finditer(text))
+    hits = [m for m in words if stem(m.group()) in query_stems]
+    if not hits:
+        return html.escape(text[:width].replace("\n", " "))
+    start = max(0, hits[0].start() - width // 3)
+    end = min(len(text), start + width)
+    if start > 0:
+        # не режем слово посередине
+        start = text.rfind(" ", 0, start) + 1
+    out, pos = [], start
+    for m in hits:
+        if m.start() < start:
+            continue
+        if m.end() > end:
+            break
+        out.append(html.escape(text[pos:m.start()]))
+        out.append("<mark>" + html.escape(m.group()) + "</mark>")
+        pos = m.end()
+    out.append(html.escape(text[pos:end]))
+    snippet = "".join(out).replace("\n", " ")
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+class SearchHit:
+    __slots__ = ("document_id", "rank", "snippet")
+
+    def __init__(self, document_id, rank, snippet):
+        self.document_id = document_id
+        self.rank = rank
+        self.snippet = snippet
+
+
+class BaseSearchBackend:
+    """Интерфейс бэкенда поиска."""
+
+    def index_documents(self, docs):
+        pass
+
+    def remove_documents(self, ids):
+        pass
+
+    def rebuild(self, batch_size=500):
+        from .models import Document
+
+        self.clear()
+        qs = Document.objects.only("id", "title", "content_html", "chunked").order_by("id")
+        batch = []
+        for doc in qs.iterator(chunk_size=batch_size):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                self.index_documents(batch)
+                batch = []
+        if batch:
+            self.index_documents(batch)
+
+    def clear(self):
+        pass
+
+    def search(self, owner_id, query: str, limit: int = 50) -> list:
+        raise NotImplementedError
+
+
+class SqliteFTSBackend(BaseSearchBackend):
+    """
+    FTS5-таблица: title/body — основы слов (по ним MATCH и bm25),
+    plain — исходный текст для сниппетов (не индексируется).
+    """
+
+    def index_documents(self, docs):
+        rows = []
+        for doc in docs:
+            plain = html_to_text(doc.content_html)
+            rows.append((doc.id, " ".join(stems(doc.title)), " ".join(stems(plain)), plain))
+        if not rows:
+            return
+        with connection.cursor() as c:
+            c.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(r[0],) for r in rows])
+            c.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, body, plain) VALUES (%s, %s, %s, %s)", rows
+            )
+
+    def remove_documents(self, ids):
+        with connection.cursor() as c:
+            c.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(i,) for i in ids])
+
+    def clear(self):
+        with connection.cursor() as c:
+            c.execute(f"DELETE FROM {FTS_TABLE}")
+
+    def search(self, owner_id, query, limit=50):
+        terms = [s for s in stems(query) if s]
+        if not terms:
+            return []
+        # каждое слово — префиксный терм, все термы обязательны
+        match = " ".join('"%s"*' % t.replace('"', '""') for t in terms)
+        sql = (
+            f"SELECT f.rowid, bm25({FTS_TABLE}, 5.0, 1.0) AS rank, f.plain "
+            f"FROM {FTS_TABLE} f JOIN docs_document d ON d.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND d.owner_id = %s AND d.is_deleted = %s "
+            f"ORDER BY rank LIMIT %s"
+        )
+        with connection.cursor() as c:
+            c.execute(sql, [match, owner_id, False, limit])
+            rows = c.fetchall()
+        return [SearchHit(pk, -rank, make_snippet(plain, terms)) for pk, rank, plain in rows]
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Без индекса: icontains по основам слов, ранжирование по числу вхождений."""
+
+    def search(self, owner_id, query, limit=50):
+        from django.db.models import Exists, OuterRef, Q
+
+        from .models import Document, DocumentBlock
+
+        terms = [s for s in stems(query) if s]
+        if not terms:
+            return []
+        qs = Document.objects.filter(owner_id=owner_id, is_deleted=False)
+        for t in terms:
+            # у блочного документа (docs/blocks.py) текст — в блоках
+            in_blocks = Exists(DocumentBlock.objects.filter(document=OuterRef("pk"), html__icontains=t))
+            qs = qs.filter(Q(title__icontains=t) | Q(content_html__icontains=t) | in_blocks)
+        hits = []
+        for doc in qs.only("id", "title", "content_html", "chunked")[:limit * 4]:
+            plain = html_to_text(doc.content_html)
+            low_title, low_plain = doc.title.lower(), plain.lower()
+            rank = sum(5 * low_title.count(t) + low_plain.count(t) for t in terms)
+            hits.append(SearchHit(doc.id, rank, make_snippet(plain, terms)))
+        hits.sort(key=lambda h: h.rank, reverse=True)
+        return hits[:limit]
+
+
+_backend = None
+
+
+def get_backend() -> BaseSearchBackend:
+    global _backend
+    if _backend is None:
+        path = getattr(settings, "DOCS_SEARCH_BACKEND", None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == "sqlite":
+            _backend = SqliteFTSBackend()
+        else:
+            _backend = SimpleSearchBackend()
+    return _backend
+
+
+def index_document(doc):
+    get_backend().index_documents([doc])
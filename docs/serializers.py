@@ -1,19 +1,91 @@
+import html
+import re
+
 from rest_framework import serializers
-from .models import Document, DocumentVersion
+from .models import Document, DocumentVersion, GenerationJob
+
+EXCERPT_SCAN = 600   # сколько символов HTML тянем из БД для превью
+EXCERPT_LENGTH = 200
+
+_TAG_RE = re.compile(r"<[^>]*>|<[^>]*$")
+_WS_RE = re.compile(r"\s+")
+
+
+def make_excerpt(raw_html: str) -> str:
+    text = html.unescape(_TAG_RE.sub(" ", raw_html or ""))
+    text = _WS_RE.sub(" ", text).strip()
+    if len(text) > EXCERPT_LENGTH:
+        text = text[:EXCERPT_LENGTH].rstrip() + "…"
+    return text
+
 
 class DocumentVersionSerializer(serializers.ModelSerializer):
     class Meta:
         model = DocumentVersion
         fields = ["id", "label", "content_html", "created_at"]
 
+class DocumentVersionListSerializer(serializers.ModelSerializer):
+    # без content_html: содержимое версии грузится отдельным запросом
+    class Meta:
+        model = DocumentVersion
+        fields = ["id", "label", "size", "manual", "created_at"]
+
 class DocumentSerializer(serializers.ModelSerializer):
-    versions = DocumentVersionSerializer(many=True, read_only=True)
+    class Meta:
+        model = Document
+        fields = ["id", "title", "content_html", "is_deleted", "revision", "created_at", "updated_at"]
+        read_only_fields = ["revision"]
 
+class DocumentMetaSerializer(serializers.ModelSerializer):
+    # без content_html: содержимое грузится блоками (GET documents/{id}/blocks/)
     class Meta:
         model = Document
-        fields = ["id", "title", "content_html", "is_deleted", "created_at", "updated_at", "versions"]
+        fields = ["id", "title", "is_deleted", "chunked", "revision", "created_at", "updated_at"]
+
+class DocumentListSerializer(serializers.ModelSerializer):
+    # version_count и excerpt_raw приходят аннотациями из get_queryset
+    version_count = serializers.IntegerField(read_only=True)
+    excerpt = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Document
+        fields = ["id", "title", "created_at", "updated_at", "version_count", "excerpt"]
+
+    def get_excerpt(self, obj):
+        return make_excerpt(getattr(obj, "excerpt_raw", ""))
 
 class DocumentCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
-        fields = ["title", "content_html"]
\ No newline at end of file
+        fields = ["id", "title", "content_html", "revision"]
+        read_only_fields = ["id", "revision"]
+
+class DocumentPatchSerializer(serializers.Serializer):
+    # операции над content_html ревизии base_revision, см. docs/patching.py
+    base_revision = serializers.IntegerField(min_value=0)
+    ops = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+    title = serializers.CharField(max_length=255, required=False)
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GenerationJob
+        fields = [
+            "id", "mode", "status", "document", "write", "version", "attempts", "max_attempts",
+            "next_attempt_at", "error", "result_text", "created_at", "started_at", "finished_at",
+        ]
+        read_only_fields = fields
+
+class GenerationJobCreateSerializer(serializers.Serializer):
+    mode = serializers.CharField(max_length=16, default="generate")
+    prompt = serializers.CharField(allow_blank=True, default="")
+    selection = serializers.CharField(allow_blank=True, default="")
+    html = serializers.CharField(allow_blank=True, default="")
+    title = serializers.CharField(max_length=255, allow_blank=True, default="")
+    document_id = serializers.IntegerField(required=False)
+    write = serializers.ChoiceField(choices=["", "append", "replace", "new"], default="")
+    max_attempts = serializers.IntegerField(min_value=1, max_value=10, required=False)
+
+    def validate(self, attrs):
+        if attrs["write"] in ("append", "replace") and "document_id" not in attrs:
+            raise serializers.ValidationError({"document_id": "Нужен документ для записи результата."})
+        return attrs
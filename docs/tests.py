@@ -1,3 +1,1410 @@
-from django.test import TestCase
+import asyncio
+import atexit
+import gzip
+import io
+import json
+import re
+import tempfile
+import tracemalloc
+import zipfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
 
-# Create your tests here.
+import httpx
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    ai_client, ai_limits, ai_providers, ai_stream, authentication, autosave, blocks, diffing, jobs, metrics, rendering,
+    retention, views,
+)
+from .ai_context import build_context, estimate_tokens, parse_sections
+from .models import Document, DocumentVersion, GenerationJob
+from .patching import PatchError, apply_ops
+from .versioning import apply_delta, create_version, encode_delta
+
+User = get_user_model()
+
+
+class ApiTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class VersionStoreTests(ApiTestCase):
+    def test_delta_roundtrip(self):
+        base = "<h1>План</h1>\n<p>Первый абзац</p>\n<p>Второй абзац</p>\n"
+        target = "<h1>План</h1>\n<p>Второй абзац</p>\n<p>Новый абзац</p>\n<p>Первый абзац</p>\n"
+        self.assertEqual(apply_delta(base, encode_delta(base, target)), target)
+        self.assertEqual(apply_delta(base, encode_delta(base, "")), "")
+        self.assertEqual(apply_delta("", encode_delta("", target)), target)
+
+    @override_settings(DOCS_VERSION_KEYFRAME_INTERVAL=3)
+    def test_keyframes_and_reconstruction(self):
+        body = "".join(f"<p>Абзац номер {i} с текстом</p>\n" for i in range(200))
+        doc = Document.objects.create(owner=self.user, content_html=body)
+        contents = [body + f"<p>правка {i}</p>" for i in range(8)]
+        for i, html in enumerate(contents):
+            create_version(doc, html, f"v{i + 1}")
+
+        versions = list(DocumentVersion.objects.filter(document=doc).order_by("id"))
+        self.assertEqual([v.kind for v in versions], ["full", "delta", "delta", "delta"] * 2)
+        for v, html in zip(versions, contents):
+            if v.kind == "delta":
+                self.assertLess(len(v.data), len(html) // 10)
+            fresh = DocumentVersion.objects.get(pk=v.pk)
+            self.assertEqual(fresh.content_html, html)
+
+    @override_settings(DOCS_VERSION_COALESCE_SECONDS=0)
+    def test_update_stores_version(self):
+        self.client.post("/api/documents/", {"title": "A", "content_html": "<p>один</p>"}, format="json")
+        doc = Document.objects.get(owner=self.user)
+        self.client.patch(f"/api/documents/{doc.id}/", {"content_html": "<p>два</p>"}, format="json")
+        versions = self.client.get(f"/api/documents/{doc.id}/versions/").json()["results"]
+        self.assertEqual([v["label"] for v in versions], ["v2", "v1"])
+        contents = [
+            self.client.get(f"/api/documents/{doc.id}/versions/{v['id']}/").json()["content_html"]
+            for v in versions
+        ]
+        self.assertEqual(contents, ["<p>два</p>", "<p>один</p>"])
+
+
+class VersionRetentionTests(ApiTestCase):
+    def test_autosaves_coalesce_into_latest_version(self):
+        self.client.post("/api/documents/", {"title": "A", "content_html": "<p>0</p>"}, format="json")
+        doc = Document.objects.get(owner=self.user)
+        for i in range(1, 4):
+            self.client.patch(f"/api/documents/{doc.id}/", {"content_html": f"<p>{i}</p>"}, format="json")
+        version = doc.versions.get()
+        self.assertEqual((version.label, version.content_html), ("v1", "<p>3</p>"))
+
+        self.client.post(f"/api/documents/{doc.id}/snapshot/", {"label": "релиз"}, format="json")
+        self.client.patch(f"/api/documents/{doc.id}/", {"content_html": "<p>4</p>"}, format="json")
+        # окно отсчитывается от первой правки: старая версия дальше не склеивается
+        doc.versions.filter(label="v3").update(created_at=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+        self.client.patch(f"/api/documents/{doc.id}/", {"content_html": "<p>5</p>"}, format="json")
+        labels = list(doc.versions.order_by("id").values_list("label", "manual"))
+        self.assertEqual(labels, [("v1", False), ("релиз", True), ("v3", False), ("v4", False)])
+
+    @override_settings(DOCS_VERSION_KEYFRAME_INTERVAL=3, DOCS_VERSION_COALESCE_SECONDS=0)
+    def test_compaction_rebases_deltas_of_dropped_keyframes(self):
+        doc = Document.objects.create(owner=self.user)
+        stamps = [
+            (datetime(2025, 11, 20, 10), False),  # старше месяца
+            (datetime(2025, 11, 25, 10), True),   # старше месяца, но ручной снимок
+            (datetime(2026, 1, 5, 9), False),
+            (datetime(2026, 1, 5, 15), False),    # последняя за день
+            (datetime(2026, 1, 9, 20), False),
+            (datetime(2026, 1, 9, 20, 30), False),  # последняя за час
+            (datetime(2026, 1, 10, 11, 30), False),
+            (datetime(2026, 1, 10, 11, 50), False),
+        ]
+        body = "".join(f"<p>Абзац {i}</p>\n" for i in range(100))
+        contents = {}
+        for i, (stamp, manual) in enumerate(stamps):
+            version = create_version(doc, body + f"<p>правка {i}</p>", manual=manual)
+            DocumentVersion.objects.filter(pk=version.pk).update(created_at=stamp.replace(tzinfo=dt_timezone.utc))
+            contents[version.pk] = body + f"<p>правка {i}</p>"
+        ids = list(contents)
+        now = datetime(2026, 1, 10, 12, tzinfo=dt_timezone.utc)
+
+        self.assertEqual(retention.compact(now=now, dry_run=True)["deleted"], 3)
+        self.assertEqual(retention.compact(now=now)["deleted"], 3)
+        left = {v.pk: v for v in DocumentVersion.objects.filter(document=doc)}
+        self.assertEqual(sorted(left), [ids[1], ids[3], ids[5], ids[6], ids[7]])
+        self.assertEqual([left[pk].kind for pk in sorted(left)], ["full", "delta", "full", "delta", "delta"])
+        self.assertEqual(left[ids[3]].base_id, ids[1])
+        for pk, version in left.items():
+            self.assertEqual(DocumentVersion.objects.get(pk=pk).content_html, contents[pk])
+        self.assertEqual(retention.compact(now=now)["deleted"], 0)
+
+
+class VersionDiffTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        diffing._diffs.clear()  # id версий повторяются между тестами
+
+    def test_diff_opcodes_are_minimal(self):
+        a, b = list("ABCABBA"), list("CBABAC")
+        ops = diffing.opcodes(a, b)
+        # наибольшая общая подпоследовательность — 4 (difflib находит 3)
+        self.assertEqual(sum(i2 - i1 for tag, i1, i2, _, _ in ops if tag == "equal"), 4)
+        self.assertEqual(diffing.opcodes(a, b, max_edits=1), [("change", 0, 7, 0, 6)])
+
+        old = "<h1>План</h1><p>Первый абзац</p><ul><li>один</li></ul>"
+        new = "<h1>План</h1><p>Первый новый абзац</p><ul><li>один</li><li>два</li></ul>"
+        result = diffing.diff(old, new)
+        self.assertEqual([h["ops"] for h in result["hunks"]], [
+            [["=", "<p>Первый "], ["+", "новый "], ["=", "абзац</p>"]],
+            [["+", "<li>два</li>"]],
+        ])
+        text = diffing.diff(old, new, "text")
+        self.assertEqual(text["units"], [3, 4])
+        self.assertEqual(text["hunks"][-1]["ops"], [["+", "два"]])
+
+    @override_settings(DOCS_VERSION_COALESCE_SECONDS=0)
+    def test_endpoint_caches_immutable_diff(self):
+        doc = Document.objects.create(owner=self.user, content_html="<p>один</p>")
+        v1 = create_version(doc, "<p>один</p><p>два</p>", "v1")
+        v2 = create_version(doc, "<p>один</p><p>три</p>", "v2")
+        url = f"/api/documents/{doc.id}/versions/{v1.pk}/diff/{v2.pk}/"
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.data["a"], resp.data["b"], resp.data["deleted"], resp.data["inserted"]), (v1.pk, v2.pk, 3, 3))
+        self.assertIn("immutable", resp["Cache-Control"])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resp["ETag"]).status_code, 304)
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.get(url)
+        self.assertEqual(again.data, resp.data)
+        self.assertFalse([q for q in ctx.captured_queries if '"data"' in q["sql"]])
+        self.assertEqual(self.client.get(url + "?mode=text").data["hunks"][0]["ops"], [["-", "два"], ["+", "три"]])
+        self.assertEqual(self.client.get(url + "?mode=xml").status_code, 400)
+
+        other = Document.objects.create(owner=self.user, content_html="")
+        foreign = create_version(other, "<p>x</p>", "v1")
+        self.assertEqual(self.client.get(f"/api/documents/{doc.id}/versions/{v1.pk}/diff/{foreign.pk}/").status_code, 404)
+
+
+class PatchTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doc = Document.objects.create(owner=self.user, title="A", content_html="<p>Привет, мир</p>")
+        self.url = f"/api/documents/{self.doc.id}/content/"
+
+    def test_ops_are_relative_to_base(self):
+        ops = [
+            {"op": "insert", "at": 0, "text": "<h1>Заголовок</h1>"},
+            {"op": "replace", "start": 11, "end": 14, "text": "<b>мир</b>"},
+        ]
+        self.assertEqual(apply_ops("<p>Привет, мир</p>", ops), "<h1>Заголовок</h1><p>Привет, <b>мир</b></p>")
+        # смещения в единицах UTF-16, как в браузере: эмодзи занимает два
+        self.assertEqual(apply_ops("😀 мир", [{"op": "delete", "start": 0, "end": 3}]), "мир")
+        with self.assertRaises(PatchError):
+            apply_ops("abc", [{"op": "delete", "start": 0, "end": 2}, {"op": "delete", "start": 1, "end": 3}])
+
+    def test_patch_updates_revision_and_versions(self):
+        resp = self.client.patch(self.url, {
+            "base_revision": 0, "title": "B", "ops": [{"op": "replace", "start": 3, "end": 9, "text": "Пока"}],
+        }, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["revision"], 1)
+        self.doc.refresh_from_db()
+        self.assertEqual((self.doc.title, self.doc.content_html), ("B", "<p>Пока, мир</p>"))
+        self.assertEqual(self.doc.versions.get().content_html, "<p>Пока, мир</p>")
+
+    def test_stale_revision_conflicts(self):
+        self.client.patch(f"/api/documents/{self.doc.id}/", {"content_html": "<p>другое</p>"}, format="json")
+        resp = self.client.patch(self.url, {"base_revision": 0, "ops": [{"op": "insert", "at": 0, "text": "x"}]}, format="json")
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.json()["revision"], 1)
+
+    def test_invalid_ops(self):
+        resp = self.client.patch(self.url, {"base_revision": 0, "ops": [{"op": "delete", "start": 0, "end": 999}]}, format="json")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("ops", resp.json())
+
+
+class AutosaveBufferTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.journal = Path(tmp.name) / "autosave.journal"
+        # фоновый поток не вмешивается: сбрасываем вручную
+        options = {"ENABLED": True, "JOURNAL": self.journal, "IDLE": 0, "TICK": 3600}
+        override = override_settings(AUTOSAVE=options)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(autosave.reset)
+        self.doc = Document.objects.create(owner=self.user, title="A", content_html="<p>0</p>")
+        self.url = f"/api/documents/{self.doc.id}/"
+
+    def _save(self, base, text):
+        ops = [{"op": "replace", "start": 3, "end": 4, "text": text}]
+        return self.client.patch(f"{self.url}content/", {"base_revision": base, "ops": ops}, format="json")
+
+    def test_saves_are_buffered_and_flushed_in_batch(self):
+        for i in range(3):
+            self.assertEqual(self._save(i, str(i + 1)).status_code, 200)
+        self.assertEqual(self._save(1, "x").status_code, 409)
+        resp = self.client.get(self.url)
+        self.assertEqual((resp.json()["content_html"], resp.json()["revision"]), ("<p>3</p>", 3))
+        self.assertEqual(Document.objects.get(pk=self.doc.pk).revision, 0)
+
+        self.assertEqual(autosave.get_buffer().flush(), 1)
+        self.doc.refresh_from_db()
+        self.assertEqual((self.doc.content_html, self.doc.revision), ("<p>3</p>", 3))
+        self.assertEqual(self.doc.versions.count(), 1)
+        self.assertEqual(self.journal.read_text(), "")
+
+    def test_full_update_flushes_first(self):
+        self._save(0, "1")
+        resp = self.client.patch(self.url, {"title": "B"}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        self.doc.refresh_from_db()
+        self.assertEqual((self.doc.title, self.doc.content_html, self.doc.revision), ("B", "<p>1</p>", 2))
+
+    def test_journal_replayed_after_crash(self):
+        self._save(0, "1")
+        self._save(1, "2")
+        # «падение»: буфер пропадает без сброса, последняя строка журнала оборвана
+        crashed, autosave._buffer = autosave._buffer, None
+        crashed._stopping.set()
+        atexit.unregister(crashed.close)
+        with self.journal.open("a", encoding="utf-8") as f:
+            f.write('{"id": 1, "rev')
+
+        with self.assertLogs("docs.autosave", "WARNING"):
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.json()["content_html"], "<p>2</p>")
+        autosave.reset()
+        self.doc.refresh_from_db()
+        self.assertEqual((self.doc.content_html, self.doc.revision), ("<p>2</p>", 2))
+
+
+@override_settings(DOCS_BLOCKS={"THRESHOLD": 500, "BLOCK_SIZE": 300, "PAGE_SIZE": 2})
+class BlockStorageTests(ApiTestCase):
+    HTML = "".join(
+        f"<h2>Раздел {i}</h2>" + "".join(f"<p>Абзац {i}.{j}</p>" for j in range(8)) for i in range(6)
+    ) + '<p>до разрыва</p><div class="page-break"></div><p>новая страница</p>'
+
+    def test_split_by_sections_and_pages(self):
+        parts = blocks.split(self.HTML)
+        self.assertEqual("".join(parts), self.HTML)
+        self.assertEqual(len(parts), 7)
+        self.assertTrue(all(p.startswith("<h2>") for p in parts[1:6]))
+        self.assertEqual(parts[-1], "<p>новая страница</p>")
+        self.assertEqual(len(blocks.split("<table>" + "<tr><td>x</td></tr>" * 100 + "</table>", 50)), 1)
+
+    def test_save_rewrites_only_changed_blocks(self):
+        resp = self.client.post("/api/documents/", {"title": "Большой", "content_html": self.HTML}, format="json")
+        doc = Document.objects.get(pk=resp.data["id"])
+        self.assertTrue(doc.chunked)
+        self.assertEqual(Document.objects.filter(pk=doc.pk).values_list("content_html", flat=True).get(), "")
+        self.assertEqual(doc.content_html, self.HTML)
+        before = dict(doc.blocks.values_list("position", "id"))
+
+        html = self.HTML.replace("Абзац 3.4", "Правка").replace("<h2>Раздел 1</h2>", "<h2>Новый</h2><p>x</p><h2>Раздел 1</h2>")
+        ops = [{"op": "replace", "start": 0, "end": len(self.HTML), "text": html}]
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.patch(f"/api/documents/{doc.id}/content/", {"base_revision": 0, "ops": ops}, format="json")
+        self.assertEqual(resp.status_code, 200)
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith(("UPDATE", "INSERT")) and "documentblock" in q["sql"]]
+        # новый раздел — вставка, изменённый — UPDATE, сдвиг неизменных — UPDATE позиций на участок (их два)
+        self.assertEqual(len(writes), 4)
+        doc = Document.objects.get(pk=doc.pk)
+        self.assertEqual(doc.content_html, html)
+        after = dict(doc.blocks.values_list("position", "id"))
+        self.assertEqual(after[0], before[0])
+        self.assertEqual(after[2], before[1])
+        self.assertEqual(list(doc.blocks.values_list("position", flat=True)), list(range(8)))
+
+    def test_blocks_endpoint_pages_content(self):
+        doc = Document.objects.create(owner=self.user, title="Большой", content_html=self.HTML)
+        meta = self.client.get(f"/api/documents/{doc.id}/?content=0")
+        self.assertNotIn("content_html", meta.data)
+        self.assertTrue(meta.data["chunked"])
+
+        html, start, pages = "", 0, 0
+        while start is not None:
+            page = self.client.get(f"/api/documents/{doc.id}/blocks/?start={start}").json()
+            self.assertEqual((page["count"], page["revision"]), (7, 0))
+            html += "".join(b["html"] for b in page["blocks"])
+            start, pages = page["next"], pages + 1
+        self.assertEqual((html, pages), (self.HTML, 4))
+        self.assertEqual(page["blocks"][-1]["hash"], blocks.digest("<p>новая страница</p>"))
+
+        listing = self.client.get("/api/documents/").json()["results"][0]
+        self.assertTrue(listing["excerpt"].startswith("Раздел 0 Абзац 0.0"))
+        self.client.patch(f"/api/documents/{doc.id}/", {"content_html": "<p>коротко</p>"}, format="json")
+        doc.refresh_from_db()
+        self.assertEqual((doc.chunked, doc.blocks.count(), doc.content_html), (False, 0, "<p>коротко</p>"))
+
+
+class ExportTests(ApiTestCase):
+    def test_single_export_streams_gzip(self):
+        doc = Document.objects.create(owner=self.user, title="<Отчёт>", content_html="<p>текст</p>" * 20000)
+        resp = self.client.get(f"/api/documents/{doc.id}/export/", HTTP_ACCEPT_ENCODING="gzip, br;q=0")
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp["Content-Encoding"], "gzip")
+        body = gzip.decompress(b"".join(resp.streaming_content)).decode()
+        self.assertTrue(body.startswith('<!DOCTYPE html><html><head><meta charset="utf-8"><title>&lt;Отчёт&gt;'))
+        self.assertTrue(body.endswith(doc.content_html + "</body></html>"))
+
+    @override_settings(DOCS_VERSION_COALESCE_SECONDS=0)
+    def test_bulk_zip_with_versions(self):
+        self.client.post("/api/documents/", {"title": "План", "content_html": "<p>1</p>"}, format="json")
+        doc = Document.objects.get(title="План")
+        self.client.patch(f"/api/documents/{doc.id}/", {"content_html": "<p>2</p>"}, format="json")
+        Document.objects.create(owner=self.user, title="Удалён", is_deleted=True)
+
+        resp = self.client.get("/api/documents/export/?versions=1")
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(resp.streaming_content)))
+        names = archive.namelist()
+        self.assertEqual(names[0], f"{doc.id}-план.html")
+        self.assertEqual(len(names), 3)
+        self.assertIn("<p>2</p>", archive.read(names[0]).decode())
+        self.assertIn("<p>1</p>", archive.read(names[1]).decode())
+
+    def _zip_peak(self, count, asgi=False):
+        body = "<p>" + "абзац текста " * 4000 + "</p>"
+        Document.objects.filter(owner=self.user).delete()
+        Document.objects.bulk_create(
+            [Document(owner=self.user, title=f"d{i}", content_html=body + str(i)) for i in range(count)]
+        )
+        if asgi:
+            return async_to_sync(self._asgi_zip_peak)()
+        resp = self.client.get("/api/documents/export/")
+        tracemalloc.start()
+        try:
+            total = sum(len(chunk) for chunk in resp.streaming_content)
+            return tracemalloc.get_traced_memory()[1], total
+        finally:
+            tracemalloc.stop()
+
+    async def _asgi_zip_peak(self):
+        # через ASGI-обработчик: синхронный итератор Django прочитал бы тут целиком
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.user).access_token))()
+        tracemalloc.start()
+        try:
+            resp = await AsyncClient().get("/api/documents/export/", headers={"Authorization": f"Bearer {token}"})
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.is_async)
+            total = 0
+            async for chunk in resp.streaming_content:
+                total += len(chunk)
+            return tracemalloc.get_traced_memory()[1], total
+        finally:
+            tracemalloc.stop()
+
+    def test_bulk_zip_memory_is_flat(self):
+        raw = 240 * len("абзац текста ".encode()) * 4000
+        for asgi in (False, True):
+            with self.subTest(asgi=asgi):
+                small_peak, _ = self._zip_peak(60, asgi)
+                peak, total = self._zip_peak(240, asgi)
+                # пик не растёт с числом документов и много меньше объёма данных
+                self.assertLess(peak, small_peak * 1.2)
+                self.assertLess(peak, raw / 3)
+                self.assertGreater(total, 0)
+
+
+class ConditionalRequestTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.doc = Document.objects.create(owner=self.user, title="A", content_html="<p>тело</p>" * 1000)
+        self.url = f"/api/documents/{self.doc.id}/"
+
+    def _validation_sql(self, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url, **headers)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b"")
+        return [q["sql"] for q in ctx.captured_queries]
+
+    def test_document_not_modified_reads_only_metadata(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp["Cache-Control"], "private, no-cache")
+        etag = resp["ETag"]
+        sql = self._validation_sql(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(sql), 1)
+        self.assertNotIn("content_html", sql[0])
+        self.assertNotIn('"title"', sql[0])
+        self._validation_sql(self.url, HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"])
+
+        self.client.patch(self.url, {"title": "B"}, format="json")
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp["ETag"], etag)
+
+    def test_if_match_prevents_lost_update(self):
+        etag = self.client.get(self.url)["ETag"]
+        resp = self.client.patch(self.url, {"title": "B"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        # второй клиент пишет со старым ETag
+        resp = self.client.patch(self.url, {"title": "C"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(resp.status_code, 412)
+        self.doc.refresh_from_db()
+        self.assertEqual((self.doc.title, self.doc.revision), ("B", 1))
+
+        ops = {"base_revision": 1, "ops": [{"op": "insert", "at": 0, "text": "x"}]}
+        resp = self.client.patch(f"{self.url}content/", ops, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(resp.status_code, 412)
+
+    def test_version_is_immutable(self):
+        create_version(self.doc, self.doc.content_html)
+        version = self.doc.versions.get()
+        url = f"{self.url}versions/{version.id}/"
+        resp = self.client.get(url)
+        self.assertEqual(resp["Cache-Control"], "private, max-age=31536000, immutable")
+        for q in self._validation_sql(url, HTTP_IF_NONE_MATCH=resp["ETag"]):
+            self.assertNotIn('"data"', q)
+            self.assertNotIn("content_html", q)
+
+    def test_export_etag_depends_on_encoding(self):
+        url = f"{self.url}export/"
+        plain = self.client.get(url)["ETag"]
+        gz = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+        self.assertNotEqual(plain, gz)
+        self._validation_sql(url, HTTP_IF_NONE_MATCH=gz, HTTP_ACCEPT_ENCODING="gzip")
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=gz)
+        self.assertEqual(resp.status_code, 200)
+
+
+class BulkImportTests(ApiTestCase):
+    def test_ndjson_with_per_item_errors(self):
+        lines = [
+            json.dumps({"title": "Первый", "content_html": '<p onclick="x()">раз</p><script>alert(1)</script>'}),
+            "{не json",
+            json.dumps({"content_html": "<html><head><title>Из title</title></head><body><p>два</p></body></html>"}),
+        ]
+        resp = self.client.generic(
+            "POST", "/api/documents/import/?batch_size=1", "\n".join(lines).encode(), "application/x-ndjson"
+        )
+        self.assertEqual(resp.status_code, 201)
+        report = resp.json()
+        self.assertEqual((report["created"], report["failed"]), (2, 1))
+        self.assertEqual(report["errors"][0]["name"], "line 2")
+
+        docs = Document.objects.filter(owner=self.user).order_by("id")
+        self.assertEqual([(d.title, d.content_html) for d in docs], [("Первый", "<p>раз</p>"), ("Из title", "<p>два</p>")])
+        self.assertEqual(DocumentVersion.objects.filter(document__in=docs).count(), 2)
+        self.assertEqual(len(self.client.get("/api/documents/?q=два").json()["results"]), 1)
+
+    def test_sanitizer_implied_end_tags(self):
+        from .importing import sanitize_html
+
+        page = "<!DOCTYPE html><html><head><meta charset=utf-8><title>T</title><body><p>hello</p></body></html>"
+        self.assertEqual(sanitize_html(page), ("<p>hello</p>", "T"))
+        self.assertEqual(sanitize_html("<head><link rel=x><title>T</title>текст"), ("текст", "T"))
+        self.assertEqual(sanitize_html("<p>a<noscript>b</p>c"), ("<p>a</p>c", ""))
+
+    def test_zip_upload_roundtrips_export(self):
+        Document.objects.create(owner=self.user, title="Отчёт", content_html="<p>итоги</p>")
+        archive = b"".join(self.client.get("/api/documents/export/").streaming_content)
+        upload = io.BytesIO(archive)
+        upload.name = "backup.zip"
+        resp = self.client.post("/api/documents/import/", {"file": upload}, format="multipart")
+        self.assertEqual(resp.json()["created"], 1)
+        copy = Document.objects.get(pk=resp.json()["ids"][0])
+        self.assertEqual((copy.title, copy.content_html), ("Отчёт", "<p>итоги</p>"))
+
+    def test_batches_use_bulk_inserts(self):
+        lines = "\n".join(json.dumps({"title": f"d{i}", "content_html": f"<p>{i}</p>"}) for i in range(50))
+        # на пачку: savepoint, INSERT документов, INSERT версий, индекс (DELETE + INSERT), release
+        with self.assertNumQueries(2 * 6):
+            self.client.generic("POST", "/api/documents/import/?batch_size=25", lines.encode(), "application/x-ndjson")
+        self.assertEqual(Document.objects.filter(owner=self.user).count(), 50)
+
+
+class DocumentListTests(ApiTestCase):
+    def make_docs(self, n, versions=3):
+        for i in range(n):
+            doc = Document.objects.create(owner=self.user, title=f"Док {i}", content_html=f"<h1>Заголовок {i}</h1><p>Текст &amp; ещё</p>")
+            for j in range(versions):
+                create_version(doc, doc.content_html, f"v{j + 1}")
+
+    def test_list_returns_summary(self):
+        self.make_docs(2)
+        data = self.client.get("/api/documents/").json()
+        self.assertIsNone(data["next"])
+        item = data["results"][0]
+        self.assertEqual(set(item), {"id", "title", "created_at", "updated_at", "version_count", "excerpt"})
+        self.assertEqual(item["version_count"], 3)
+        self.assertEqual(item["excerpt"], "Заголовок 1 Текст & ещё")
+
+    def test_list_query_count_is_constant(self):
+        self.make_docs(3)
+        with self.assertNumQueries(1):
+            self.client.get("/api/documents/")
+        self.make_docs(30, versions=5)
+        with self.assertNumQueries(1):
+            resp = self.client.get("/api/documents/?page_size=10")
+        self.assertIsNotNone(resp.json()["next"])
+
+    def test_cursor_pagination_walks_all_documents(self):
+        self.make_docs(7, versions=1)
+        url, seen = "/api/documents/?page_size=3", []
+        while url:
+            data = self.client.get(url).json()
+            seen += [d["title"] for d in data["results"]]
+            url = data["next"]
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+
+class QueryPlanTests(ApiTestCase):
+    def plan(self, url):
+        """EXPLAIN QUERY PLAN для SQL-запросов, которые выполнил эндпоинт."""
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        plans = []
+        with connection.cursor() as c:
+            for q in ctx.captured_queries:
+                if q["sql"].startswith("SELECT"):
+                    c.execute("EXPLAIN QUERY PLAN " + q["sql"])
+                    plans.append("\n".join(row[-1] for row in c.fetchall()))
+        return plans
+
+    def test_owner_listing_uses_partial_index(self):
+        Document.objects.create(owner=self.user, title="A")
+        plan = self.plan("/api/documents/")[-1]
+        self.assertIn("USING INDEX doc_owner_live_updated_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_version_listing_uses_index(self):
+        doc = Document.objects.create(owner=self.user)
+        create_version(doc, "<p>1</p>")
+        plan = self.plan(f"/api/documents/{doc.id}/versions/")[-1]
+        self.assertIn("docver_doc_created_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    @override_settings(DOCS_VERSION_COALESCE_SECONDS=0)
+    def test_version_labels_come_from_counter(self):
+        self.client.post("/api/documents/", {"title": "A", "content_html": "<p>1</p>"}, format="json")
+        doc = Document.objects.get(owner=self.user)
+        self.client.patch(f"/api/documents/{doc.id}/", {"content_html": "<p>2</p>"}, format="json")
+        self.client.post(f"/api/documents/{doc.id}/snapshot/", {"label": "релиз"}, format="json")
+        DocumentVersion.objects.filter(label="v1").delete()
+        self.client.patch(f"/api/documents/{doc.id}/", {"content_html": "<p>3</p>"}, format="json")
+        labels = list(doc.versions.order_by("id").values_list("label", flat=True))
+        self.assertEqual(labels, ["v2", "релиз", "v4"])
+        doc.refresh_from_db()
+        self.assertEqual(doc.version_seq, 4)
+
+
+class SearchTests(ApiTestCase):
+    def create(self, title, html, owner=None):
+        self.client.force_authenticate(owner or self.user)
+        self.client.post("/api/documents/", {"title": title, "content_html": html}, format="json")
+        self.client.force_authenticate(self.user)
+        return Document.objects.filter(title=title).latest("id")
+
+    def test_russian_stemming_and_snippets(self):
+        self.create("ТЗ", "<h1>Техническое задание</h1><p>Требования к <b>разработке</b> модуля отчётов.</p>")
+        self.create("Разработка", "<p>План разработки: разработка API и разработка UI.</p>")
+        self.create("Другое", "<p>Маркетинговая стратегия</p>")
+
+        results = self.client.get("/api/documents/?q=разработка").json()["results"]
+        self.assertEqual([r["title"] for r in results], ["Разработка", "ТЗ"])
+        self.assertIn("<mark>разработке</mark>", results[1]["snippet"])
+        self.assertNotIn("<b>", results[1]["snippet"])
+
+    def test_search_respects_owner_and_soft_delete(self):
+        bob = User.objects.create_user("bob", password="pw")
+        self.create("Чужой", "<p>секретный отчёт</p>", owner=bob)
+        doc = self.create("Мой", "<p>секретный отчёт</p>")
+        self.assertEqual(len(self.client.get("/api/documents/?q=отчёт").json()["results"]), 1)
+        self.client.delete(f"/api/documents/{doc.id}/")
+        self.assertEqual(self.client.get("/api/documents/?q=отчёт").json()["results"], [])
+
+    def test_markup_is_not_searchable(self):
+        self.create("HTML", '<p class="highlight">обычный текст</p>')
+        self.assertEqual(self.client.get("/api/documents/?q=highlight").json()["results"], [])
+
+
+class AiContextTests(TestCase):
+    HTML = (
+        "<p>Вступление к документу.</p>"
+        "<h2>Бюджет</h2><p>Смета расходов на <b>оборудование</b> и зарплаты.</p>"
+        "<h2>Сроки</h2><p>Запуск проекта в марте.</p>"
+        "<script>alert(1)</script>"
+        "<h2>Риски</h2><p>Задержка поставки оборудования.</p>"
+    )
+
+    def test_sections_without_markup(self):
+        sections = parse_sections(self.HTML)
+        self.assertEqual([s.title for s in sections], ["", "Бюджет", "Сроки", "Риски"])
+        self.assertEqual(sections[1].text, "Смета расходов на оборудование и зарплаты.")
+        self.assertNotIn("alert", "".join(s.text for s in sections))
+
+    def test_relevant_sections_first(self):
+        ctx = build_context("generate", self.HTML, "распиши сроки запуска")
+        self.assertIn("## Сроки", ctx)
+        self.assertNotIn("Бюджет", ctx)
+
+    def test_continue_keeps_tail_within_budget(self):
+        html = "".join(f"<h2>Раздел {i}</h2><p>{'текст ' * 200}конец{i}</p>" for i in range(50))
+        ctx = build_context("continue", html, "", budget=300)
+        self.assertIn("конец49", ctx)
+        self.assertNotIn("<", ctx)
+        self.assertLessEqual(estimate_tokens(ctx), 330)
+
+    def test_outline_has_toc(self):
+        ctx = build_context("outline", self.HTML, "")
+        self.assertTrue(ctx.startswith("Оглавление:\n- Бюджет\n- Сроки\n- Риски"))
+
+
+class RenderingTests(TestCase):
+    def test_markdown_is_escaped(self):
+        out = rendering.render_markdown(
+            "# Итоги <script>\n\n- **раз** [сайт](https://a.ru?x=1&y=2)\n  - [зло](javascript:alert(1))\n\n"
+            "| a | b |\n|---|--:|\n| `<i>` | 2 |"
+        )
+        self.assertIn("<h1>Итоги &lt;script&gt;</h1>", out)
+        self.assertIn('<li><strong>раз</strong> <a href="https://a.ru?x=1&amp;y=2" rel="noopener noreferrer">', out)
+        self.assertIn("<ul><li>[зло](javascript:alert(1))</li></ul>", out)
+        self.assertIn('<td><code>&lt;i&gt;</code></td><td style="text-align:right">2</td>', out)
+
+    def test_emphasis_skips_link_attributes(self):
+        out = rendering.inline("[*a*](http://e.com/_x_y_) ![b](https://e.com/a*b*.png) _c_")
+        self.assertEqual(
+            out,
+            '<a href="http://e.com/_x_y_" rel="noopener noreferrer"><em>a</em></a> '
+            '<img src="https://e.com/a*b*.png" alt="b"> <em>c</em>',
+        )
+
+    def test_mermaid_and_chart_repair(self):
+        mermaid = rendering.repair_mermaid("flowchart TD\ngraph LR\nA[Старт (1)] --> B[Конец] мусор\nsubgraph S\nB --> C")
+        self.assertEqual(mermaid, "flowchart TD\nA[Старт &#40;1&#41;] --> B[Конец]\nsubgraph S\nB --> C\nend\n")
+        self.assertEqual(rendering.repair_mermaid("A --> B"), "flowchart TD\nA --> B\n")
+        chart = rendering.repair_chart("{type: 'bar', // тип\n data: {labels: ['a',], datasets: []},}")
+        self.assertEqual(json.loads(chart), {"type": "bar", "data": {"labels": ["a"], "datasets": []}})
+        self.assertIsNone(rendering.repair_chart("{не json"))
+        self.assertIn(
+            '<pre><code class="language-chart">{не json</code></pre>', rendering.render_markdown("```chart\n{не json\n```")
+        )
+
+    def test_stream_blocks_match_full_render(self):
+        text = "Абзац *один*.\n\n```mermaid\nA --> B\n```\nхвост\n\n1. пункт\n2. ещё"
+        renderer = rendering.BlockRenderer()
+        fragments = []
+        for i in range(0, len(text), 3):
+            fragments += renderer.feed(text[i:i + 3])
+        self.assertEqual(len(fragments), 3)  # всё, кроме списка, готово до конца стрима
+        self.assertIn('data-normalized="1"', fragments[1])
+        self.assertEqual("\n".join(fragments + renderer.finish()), rendering.render_markdown(text))
+
+
+def sse_lines(*deltas):
+    lines = [
+        "data: " + json.dumps({"choices": [{"delta": {"content": d}}]}, ensure_ascii=False) + "\n\n"
+        for d in deltas
+    ]
+    return "".join(lines) + "data: [DONE]\n\n"
+
+
+class AiProxyTestCase(TestCase):
+    """Тесты AI-эндпоинтов с подменой провайдера через httpx.MockTransport."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("alice", password="pw")
+        self.auth = {"Authorization": f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+        self.upstream = []
+        ai_client.set_transport(httpx.MockTransport(self.handle))
+        ai_limits.reset()
+        ai_stream.reset()
+        ai_providers.reset()
+
+    def tearDown(self):
+        ai_client.set_transport(None)
+
+    def handle(self, request):
+        payload = json.loads(request.content)
+        self.upstream.append(payload)
+        if payload.get("stream") is False:
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ответ"}}]})
+        return httpx.Response(200, text=sse_lines("При", "вет"), headers={"content-type": "text/event-stream"})
+
+    async def post(self, url, data, headers=None):
+        headers = {**self.auth, **(headers or {})}
+        return await self.async_client.post(url, data, content_type="application/json", headers=headers)
+
+
+class AiProxyTests(AiProxyTestCase):
+    async def test_requires_auth(self):
+        resp = await self.async_client.post("/api/ai/", {"prompt": "x"}, content_type="application/json")
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual(resp["Access-Control-Allow-Origin"], "*")
+
+    async def test_proxy_returns_provider_json(self):
+        resp = await self.post("/api/ai/", {"mode": "rewrite", "prompt": "короче", "selection": "текст"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["choices"][0]["message"]["content"], "ответ")
+        self.assertEqual(resp.json()["html"], "<p>ответ</p>")
+        self.assertIn("Перепиши фрагмент: текст", self.upstream[0]["messages"][1]["content"])
+
+    async def test_provider_html_is_not_relayed(self):
+        def provider(request):
+            return httpx.Response(200, json={"text": "", "html": '<img src=x onerror="alert(1)">'})
+
+        ai_client.set_transport(httpx.MockTransport(provider))
+        resp = await self.post("/api/ai/", {"prompt": "x"})
+        self.assertEqual(resp.json()["html"], "")
+
+    async def test_stream_relays_sse(self):
+        resp = await self.post("/api/ai/stream/", {"prompt": "привет"})
+        body = b"".join([chunk async for chunk in resp.streaming_content]).decode()
+        self.assertEqual(resp["Content-Type"], "text/event-stream")
+        # дельты «При» и «вет» склеены в один кадр с номером
+        self.assertRegex(body, r"id: (\w+):1\nevent: content\ndata: Привет\n\n")
+        self.assertIn("event: html\ndata: <p>Привет</p>\n\n", body)
+        self.assertTrue(body.endswith("event: done\ndata: [DONE]\n\n"))
+        self.assertIn(f": generation {resp['X-AI-Generation']}\n", body)
+
+    async def test_context_from_document_id(self):
+        doc = await Document.objects.acreate(
+            owner=self.user, title="T", content_html="<h2>Итоги</h2><p>Квартал закрыт с прибылью.</p>"
+        )
+        resp = await self.post("/api/ai/", {"mode": "continue", "prompt": "", "document_id": doc.id})
+        self.assertEqual(resp.status_code, 200)
+        content = self.upstream[0]["messages"][1]["content"]
+        self.assertIn("## Итоги\nКвартал закрыт с прибылью.", content)
+        self.assertNotIn("<p>", content)
+
+    async def test_stream_reports_upstream_error(self):
+        def fail(request):
+            raise httpx.ConnectError("нет соединения")
+
+        ai_client.set_transport(httpx.MockTransport(fail))
+        resp = await self.post("/api/ai/stream/", {"prompt": "привет"})
+        body = b"".join([chunk async for chunk in resp.streaming_content]).decode()
+        self.assertIn("event: error\ndata: нет соединения", body)
+
+
+@override_settings(AI_CACHE={"BACKEND": "docs.ai_cache.LocMemBackend", "TTL": 60, "MODES": ["outline"]})
+class AiCacheTests(AiProxyTestCase):
+    async def test_repeated_request_is_served_from_cache(self):
+        body = {"mode": "outline", "prompt": "план", "html": "<p>текст</p>"}
+        first = await self.post("/api/ai/", body)
+        second = await self.post("/api/ai/", body)
+        self.assertEqual((first["X-AI-Cache"], second["X-AI-Cache"]), ("MISS", "HIT"))
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(len(self.upstream), 1)
+
+        bypass = await self.post("/api/ai/", {**body, "cache": False})
+        self.assertEqual(bypass["X-AI-Cache"], "BYPASS")
+        self.assertEqual(len(self.upstream), 2)
+
+    async def test_other_modes_are_not_cached(self):
+        await self.post("/api/ai/", {"mode": "generate", "prompt": "x"})
+        await self.post("/api/ai/", {"mode": "generate", "prompt": "x"})
+        self.assertEqual(len(self.upstream), 2)
+
+    async def test_stream_replays_cached_generation(self):
+        body = {"mode": "outline", "prompt": "план", "html": "<p>текст</p>"}
+        live = await self.post("/api/ai/stream/", body)
+        live_body = b"".join([c async for c in live.streaming_content]).decode()
+        cached = await self.post("/api/ai/stream/", body)
+        cached_body = b"".join([c async for c in cached.streaming_content]).decode()
+        self.assertEqual(len(self.upstream), 1)
+
+        # кадр в кадр, включая id и преамбулу, — с точностью до id генерации
+        self.assertNotEqual(cached["X-AI-Generation"], live["X-AI-Generation"])
+        self.assertEqual(
+            cached_body.replace(cached["X-AI-Generation"], "<gen>"),
+            live_body.replace(live["X-AI-Generation"], "<gen>"),
+        )
+        self.assertIn("Привет<p>Привет</p>", "".join(re.findall(r"^data: (.*)$", cached_body, re.M)))
+
+        # повтор из кэша дочитывается по Last-Event-ID, как живой стрим
+        resumed = await self.post(
+            "/api/ai/stream/", body, {"Last-Event-ID": f"{cached['X-AI-Generation']}:1"}
+        )
+        resumed_body = b"".join([c async for c in resumed.streaming_content]).decode()
+        self.assertEqual(resumed.status_code, 200)
+        self.assertNotIn(f"id: {cached['X-AI-Generation']}:1\n", resumed_body)
+        self.assertTrue(resumed_body.endswith("event: done\ndata: [DONE]\n\n"))
+
+
+class AiCacheBackendTests(TestCase):
+    def test_locmem_evicts_by_size_and_ttl(self):
+        from .ai_cache import LocMemBackend
+
+        backend = LocMemBackend(ttl=60, max_entries=2)
+        for k in "abc":
+            backend.set(k, {"v": k})
+        self.assertIsNone(backend.get("a"))
+        self.assertEqual(backend.get("c"), {"v": "c"})
+        expired = LocMemBackend(ttl=-1)
+        expired.set("a", 1)
+        self.assertIsNone(expired.get("a"))
+
+    def test_django_backend_clear_keeps_other_keys(self):
+        from django.core.cache import cache
+
+        from .ai_cache import DjangoCacheBackend
+
+        backend = DjangoCacheBackend(ttl=60)
+        backend.set("k", {"v": 1})
+        cache.set("docs:jwt-revoked:abc", True)
+        self.addCleanup(cache.delete, "docs:jwt-revoked:abc")
+        backend.clear()
+        self.assertIsNone(backend.get("k"))
+        self.assertTrue(cache.get("docs:jwt-revoked:abc"))
+        backend.set("k", {"v": 2})
+        self.assertEqual(backend.get("k"), {"v": 2})
+
+    def test_file_backend_roundtrip(self):
+        import tempfile
+
+        from .ai_cache import FileBackend
+
+        with tempfile.TemporaryDirectory() as tmp:
+            backend = FileBackend(ttl=60, path=tmp, max_bytes=10_000)
+            backend.set("proxy:abc", {"text": "ответ"})
+            self.assertEqual(backend.get("proxy:abc"), {"text": "ответ"})
+            self.assertIsNone(backend.get("proxy:missing"))
+
+
+class AiCoalescingTests(AiProxyTestCase):
+    def setUp(self):
+        super().setUp()
+        ai_client.set_transport(httpx.MockTransport(self.slow_handle))
+        self.gate = None
+
+    async def slow_handle(self, request):
+        # провайдер отвечает, только когда тест откроет «шлюз» (или через 0.3 с)
+        if self.gate is not None:
+            await self.gate.wait()
+        else:
+            await asyncio.sleep(0.3)
+        return self.handle(request)
+
+    async def test_identical_requests_share_upstream_call(self):
+        body = {"mode": "generate", "prompt": "ТЗ"}
+        first, second = await asyncio.gather(self.post("/api/ai/", body), self.post("/api/ai/", body))
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(len(self.upstream), 1)
+
+    async def test_identical_streams_fan_out(self):
+        async def read(resp):
+            return b"".join([c async for c in resp.streaming_content]).decode()
+
+        self.gate = asyncio.Event()
+        body = {"mode": "generate", "prompt": "ТЗ"}
+        responses = await asyncio.gather(self.post("/api/ai/stream/", body), self.post("/api/ai/stream/", body))
+        self.gate.set()
+        first, second = await asyncio.gather(*(read(r) for r in responses))
+        self.assertEqual(first, second)
+        self.assertIn("data: При", first)
+        self.assertEqual(len(self.upstream), 1)
+
+    @override_settings(AI_CONCURRENCY={"PER_USER": 1})
+    async def test_per_user_limit_waits_in_queue(self):
+        ai_limits.reset()
+        responses = await asyncio.gather(
+            self.post("/api/ai/", {"prompt": "первый"}),
+            self.post("/api/ai/", {"prompt": "второй"}),
+        )
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(len(self.upstream), 2)
+
+    @override_settings(AI_CONCURRENCY={"PER_USER": 1, "QUEUE_TIMEOUT": 0.05, "RETRY_AFTER": 7})
+    async def test_per_user_queue_timeout_returns_429(self):
+        ai_limits.reset()
+        responses = await asyncio.gather(
+            self.post("/api/ai/", {"prompt": "первый"}),
+            self.post("/api/ai/", {"prompt": "второй"}),
+        )
+        codes = sorted(r.status_code for r in responses)
+        self.assertEqual(codes, [200, 429])
+        rejected = next(r for r in responses if r.status_code == 429)
+        self.assertEqual(rejected["Retry-After"], "7")
+        self.assertEqual(len(self.upstream), 1)
+
+
+@override_settings(AI_STREAM={"FRAME_WINDOW": 0.01, "HEARTBEAT": 0.05})
+class AiStreamTests(AiProxyTestCase):
+    def setUp(self):
+        super().setUp()
+        ai_client.set_transport(httpx.MockTransport(self.gated_handle))
+        self.gate = asyncio.Event()
+
+    async def gated_handle(self, request):
+        # первая дельта сразу, остальное — после открытия шлюза
+        self.upstream.append(json.loads(request.content))
+        gate = self.gate
+
+        async def body():
+            yield sse_lines("начало").replace("data: [DONE]\n\n", "").encode()
+            await gate.wait()
+            yield sse_lines("конец").encode()
+
+        return httpx.Response(200, content=body(), headers={"content-type": "text/event-stream"})
+
+    async def read_until(self, chunks, marker):
+        text = ""
+        async for chunk in chunks:
+            text += chunk.decode()
+            if marker in text:
+                return text
+        return text
+
+    async def test_resume_with_last_event_id(self):
+        resp = await self.post("/api/ai/stream/", {"prompt": "ТЗ"})
+        chunks = aiter(resp.streaming_content)
+        text = await self.read_until(chunks, "data: начало")
+        last_id = re.search(r"id: (\S+)\nevent: content\ndata: начало", text).group(1)
+        await chunks.aclose()  # клиент отвалился
+
+        self.gate.set()
+        resumed = await self.post("/api/ai/stream/", {}, headers={"Last-Event-ID": last_id})
+        body = b"".join([c async for c in resumed.streaming_content]).decode()
+        self.assertNotIn("data: начало", body)
+        self.assertIn("data: конец", body)
+        self.assertTrue(body.endswith("data: [DONE]\n\n"))
+        self.assertEqual(len(self.upstream), 1)
+
+    async def test_joined_user_can_resume_shared_generation(self):
+        bob = await sync_to_async(User.objects.create_user)("bob", password="pw")
+        bob_auth = {"Authorization": f"Bearer {RefreshToken.for_user(bob).access_token}"}
+        alice = aiter((await self.post("/api/ai/stream/", {"prompt": "ТЗ"})).streaming_content)
+        await self.read_until(alice, "data: начало")
+        joined = await self.post("/api/ai/stream/", {"prompt": "ТЗ"}, headers=bob_auth)
+        chunks = aiter(joined.streaming_content)
+        text = await self.read_until(chunks, "data: начало")
+        last_id = re.search(r"id: (\S+)\nevent: content\ndata: начало", text).group(1)
+        await chunks.aclose()
+
+        self.gate.set()
+        resumed = await self.post("/api/ai/stream/", {}, headers={**bob_auth, "Last-Event-ID": last_id})
+        self.assertEqual(resumed.status_code, 200)
+        self.assertIn("data: конец", b"".join([c async for c in resumed.streaming_content]).decode())
+        self.assertEqual(len(self.upstream), 1)
+        await alice.aclose()
+
+    async def test_unknown_generation_is_gone(self):
+        resp = await self.post("/api/ai/stream/", {}, headers={"Last-Event-ID": "nope:3"})
+        self.assertEqual(resp.status_code, 410)
+
+    async def test_heartbeat_while_waiting(self):
+        resp = await self.post("/api/ai/stream/", {"prompt": "ТЗ"})
+        chunks = aiter(resp.streaming_content)
+        text = await self.read_until(chunks, ": ping\n\n")
+        self.assertIn("data: начало", text)
+        self.gate.set()
+        text += b"".join([c async for c in chunks]).decode()
+        self.assertIn("data: конец", text)
+
+
+@override_settings(
+    AI_PROVIDERS=[
+        {"name": "slow", "url": "http://slow.test/v1", "weight": 1},
+        {"name": "spare", "url": "http://spare.test/v1", "weight": 0},
+    ],
+    AI_ROUTING={"HEDGE_DELAY": 0.05, "HEDGE_MIN_DELAY": 0.01, "MIN_CALLS": 2, "COOLDOWN": 60},
+)
+class ProviderRoutingTests(AiProxyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.delay = {"slow": 0, "spare": 0}
+        self.status = {"slow": 200, "spare": 200}
+        self.body_delay = 0
+        self.bodies = []
+        ai_client.set_transport(httpx.MockTransport(self.fake_provider))
+
+    async def fake_provider(self, request):
+        name = request.url.host.split(".")[0]
+        self.upstream.append(name)
+        self.bodies.append(json.loads(request.content))
+        await asyncio.sleep(self.delay[name])
+        if self.status[name] != 200:
+            return httpx.Response(self.status[name], text="сбой")
+        if json.loads(request.content).get("stream") is False:
+            if self.body_delay:
+                return httpx.Response(
+                    200, content=self.slow_body(name), headers={"content-type": "application/json"}
+                )
+            return httpx.Response(200, json={"text": name})
+        return httpx.Response(200, text=sse_lines(name), headers={"content-type": "text/event-stream"})
+
+    async def test_hedges_slow_first_byte(self):
+        self.delay["slow"] = 5
+        started = asyncio.get_running_loop().time()
+        resp = await self.post("/api/ai/stream/", {"prompt": "ТЗ"})
+        body = b"".join([c async for c in resp.streaming_content]).decode()
+        self.assertIn("data: spare", body)
+        self.assertLess(asyncio.get_running_loop().time() - started, 2)
+        self.assertEqual(self.upstream, ["slow", "spare"])
+        self.assertEqual(ai_providers.health("slow").hedged, 1)
+
+    async def test_failover_opens_breaker(self):
+        self.status["slow"] = 503
+        for _ in range(2):
+            resp = await self.post("/api/ai/", {"prompt": "ТЗ"})
+            self.assertEqual(resp.json()["text"], "spare")
+        self.assertEqual(self.upstream, ["slow", "spare", "slow", "spare"])
+
+        # после двух ошибок подряд slow разомкнут и не вызывается
+        await self.post("/api/ai/", {"prompt": "ТЗ"})
+        self.assertEqual(self.upstream[-1:], ["spare"])
+        self.assertEqual(len(self.upstream), 5)
+
+        self.user.is_staff = True
+        await self.user.asave()
+        status = (await self.async_client.get("/api/ai/providers/", headers=self.auth)).json()
+        self.assertEqual({p["name"]: p["state"] for p in status}, {"slow": "open", "spare": "closed"})
+
+    async def test_stream_body_per_provider_format(self):
+        resp = await self.post("/api/ai/stream/", {"prompt": "ТЗ"})
+        b"".join([c async for c in resp.streaming_content])
+        self.assertEqual((self.bodies[0]["stream"], self.bodies[0]["model"]), (True, views.DEFAULT_MODEL))
+        n8n = ai_providers.Provider("n8n", "http://n8n.test/hook", format="messages")
+        self.assertEqual(n8n.prepare(self.bodies[0], stream=True), {"messages": self.bodies[0]["messages"]})
+
+    async def slow_body(self, name):
+        await asyncio.sleep(self.body_delay)
+        yield json.dumps({"text": name}).encode()
+
+    @override_settings(AI_ROUTING={"HEDGE_DELAY": 0.05, "MIN_CALLS": 2, "SLOW_CALL": 0.05, "SLOW_RATE": 0.5})
+    async def test_long_answer_is_not_slow_call(self):
+        # заголовки сразу, тело генерируется дольше SLOW_CALL: это не медленный вызов
+        self.body_delay = 0.1
+        for _ in range(3):
+            resp = await self.post("/api/ai/", {"prompt": "ТЗ"})
+            self.assertEqual(resp.json()["text"], "slow")
+        self.assertEqual(self.upstream, ["slow"] * 3)
+        snapshot = ai_providers.health("slow").snapshot(ai_providers.conf())
+        self.assertEqual(snapshot["state"], "closed")
+        self.assertLess(snapshot["ttfb_p95_ms"], 50)
+
+    async def test_surplus_success_is_released(self):
+        # обе попытки отвечают в один момент: стрим проигравшей закрывается и учитывается
+        both, opened, closed = asyncio.Event(), [], []
+
+        async def attempt(provider):
+            opened.append(provider.name)
+            if len(opened) == 2:
+                both.set()
+            await both.wait()
+            return provider.name
+
+        async def release(name):
+            closed.append(name)
+
+        provider, result = await ai_providers.hedged("stream", attempt, release=release)
+        self.assertEqual(sorted(opened), ["slow", "spare"])
+        self.assertEqual(closed, [n for n in opened if n != result])
+        snapshot = ai_providers.health(closed[0]).snapshot(ai_providers.conf())
+        self.assertEqual((snapshot["total_calls"], snapshot["total_failures"]), (1, 0))
+
+    def test_half_open_probe(self):
+        options = {**ai_providers.conf(), "MIN_CALLS": 1, "COOLDOWN": 0}
+        health = ai_providers.Health(options)
+        health.record(False, 0.1, options, "HTTP 500")
+        self.assertEqual(health.state, ai_providers.OPEN)
+        self.assertTrue(health.allow(options))   # проба
+        self.assertFalse(health.allow(options))  # вторая — ждёт исхода первой
+        health.record(True, 0.1, options)
+        self.assertEqual(health.state, ai_providers.CLOSED)
+
+    def test_status_requires_staff(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get("/api/ai/providers/").status_code, 403)
+
+
+class AuthCacheTests(TestCase):
+    def setUp(self):
+        authentication.reset()
+        self.user = User.objects.create_user("alice", password="pw")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+
+    def user_queries(self, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = getattr(self.client, method)(url, **kwargs)
+        return resp, [q["sql"] for q in ctx.captured_queries if '"auth_user"' in q["sql"]]
+
+    def test_cached_token_skips_user_query(self):
+        resp, queries = self.user_queries("get", "/api/documents/")
+        self.assertEqual((resp.status_code, len(queries)), (200, 1))
+        resp, queries = self.user_queries("get", "/api/documents/")
+        self.assertEqual((resp.status_code, queries), (200, []))
+
+    def test_deactivation_and_password_change_invalidate(self):
+        self.client.get("/api/documents/")
+        self.user.set_password("new")
+        self.user.save()
+        resp, queries = self.user_queries("get", "/api/documents/")
+        self.assertEqual((resp.status_code, len(queries)), (200, 1))
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/documents/").status_code, 401)
+
+    def test_logout_revokes_token(self):
+        self.assertEqual(self.client.get("/api/documents/").status_code, 200)
+        self.assertEqual(self.client.post("/api/auth/logout/").status_code, 204)
+        self.assertEqual(self.client.get("/api/documents/").status_code, 401)
+        authentication.reset()  # другой процесс: локального кэша нет, отзыв виден через Django-кэш
+        self.assertEqual(self.client.get("/api/documents/").status_code, 401)
+
+    @override_settings(AUTH_CACHE={"STATELESS_READS": True})
+    def test_stateless_reads(self):
+        doc = Document.objects.create(owner=self.user, title="A", content_html="<p>a</p>")
+        resp, queries = self.user_queries("get", f"/api/documents/{doc.pk}/")
+        self.assertEqual((resp.status_code, queries), (200, []))
+        resp, queries = self.user_queries("patch", f"/api/documents/{doc.pk}/", data={"title": "B"}, format="json")
+        self.assertEqual((resp.status_code, len(queries)), (200, 1))
+
+    @override_settings(AUTH_CACHE={"STATELESS_READS": True})
+    def test_stateless_reads_keep_admin_views(self):
+        # IsAdminUser нужен is_staff — такие вью читают пользователя из БД (дальше — из кэша токенов)
+        self.user.is_staff = True
+        self.user.save()
+        authentication.reset()  # токен выдан после изменения: stateless-путь ему доступен
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        resp, queries = self.user_queries("get", "/metrics")
+        self.assertEqual((resp.status_code, len(queries)), (200, 1))
+        self.assertEqual(self.client.get("/api/ai/providers/").status_code, 200)
+
+
+class MetricsTests(AiProxyTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_view_latency_and_db_queries(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        Document.objects.create(owner=self.user, title="A", content_html="<p>a</p>")
+        self.assertEqual(client.get("/api/documents/").status_code, 200)
+
+        self.assertEqual(metrics.http_requests.get("document-list", "GET", "200"), 1)
+        self.assertEqual(metrics.http_latency.count("document-list", "GET"), 1)
+        queries = metrics.http_db_queries.values[("document-list", "GET")][1]
+        self.assertGreaterEqual(queries, 1)
+
+    async def test_ai_stream_hooks_per_mode(self):
+        resp = await self.post("/api/ai/stream/", {"mode": "rewrite", "selection": "x", "prompt": "y"})
+        b"".join([c async for c in resp.streaming_content])
+        self.assertEqual(metrics.ai_requests.get("stream", "rewrite", "n8n", "ok"), 1)
+        self.assertEqual(metrics.ai_tokens.get("stream", "rewrite"), 2)
+        self.assertEqual(metrics.ai_bytes.get("stream", "rewrite"), len("Привет".encode()))
+        self.assertEqual(metrics.ai_ttfb.count("stream", "rewrite"), 1)
+        # SQL аутентификации из sync_to_async тоже привязан к запросу
+        self.assertGreaterEqual(metrics.http_db_queries.values[("ai-stream", "POST")][1], 1)
+
+    def test_metrics_endpoint_is_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get("/metrics").status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        client.get("/api/documents/")
+        resp = client.get("/metrics")
+        self.assertEqual(resp.status_code, 200)
+        text = resp.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+        self.assertIn('http_requests_total{view="document-list",method="GET",status="200"} 1', text)
+        self.assertIn('ai_jobs{status="queued"} 0', text)
+
+    def test_slow_request_profile(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.settings(METRICS={"SLOW_REQUEST": 0, "PROFILE_DIR": tmp, "PROFILE_KEEP": 1}), \
+                    self.assertLogs("docs.metrics", "WARNING"):
+                client.get("/api/documents/")
+                client.get("/api/documents/")
+            profiles = list(Path(tmp).glob("*.prof"))
+            self.assertEqual(len(profiles), 1)
+            self.assertIn("document-list", profiles[0].name)
+        self.assertEqual(metrics.slow_profiles.get("document-list"), 2)
+
+
+@override_settings(AI_JOBS={"EMBEDDED": False, "BACKOFF": 0, "FLUSH_INTERVAL": 0.01})
+class GenerationJobTests(AiProxyTestCase):
+    async def submit(self, **data):
+        resp = await self.post("/api/ai/jobs/", {"prompt": "ТЗ", **data})
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.json()["status"], "queued")
+        return resp.json()["id"]
+
+    async def job(self, job_id):
+        return await GenerationJob.objects.select_related("document", "version").aget(pk=job_id)
+
+    async def test_job_writes_new_document(self):
+        job_id = await self.submit(write="new", title="ТЗ на CRM")
+        self.assertTrue(await jobs.process_next())
+        job = await self.job(job_id)
+        self.assertEqual((job.status, job.result_text, job.attempts), ("succeeded", "Привет", 1))
+        self.assertEqual((job.document.title, job.document.content_html), ("ТЗ на CRM", "<p>Привет</p>"))
+        self.assertEqual(job.version.document_id, job.document.pk)
+
+        resp = await self.async_client.get(f"/api/ai/jobs/{job_id}/", headers=self.auth)
+        self.assertEqual(resp.json()["document"], job.document.pk)
+
+    async def test_append_to_document(self):
+        doc = await Document.objects.acreate(owner=self.user, title="A", content_html="<p>было</p>")
+        job_id = await self.submit(document_id=doc.pk, write="append")
+        await jobs.process_next()
+        await doc.arefresh_from_db()
+        self.assertEqual((doc.content_html, doc.revision), ("<p>было</p>\n<p>Привет</p>", 1))
+        self.assertIn("было", (await self.job(job_id)).params["html"])
+
+    @override_settings(DOCS_VERSION_COALESCE_SECONDS=300)
+    async def test_replace_keeps_previous_version(self):
+        # запись задачи не склеивается с правкой из редактора: текст до замены остаётся в истории
+        doc = await Document.objects.acreate(owner=self.user, title="A", content_html="<p>было</p>")
+        await sync_to_async(create_version)(doc, doc.content_html, coalesce=True)
+        await self.submit(document_id=doc.pk, write="replace")
+        await jobs.process_next()
+        history = await sync_to_async(lambda: [v.content_html for v in doc.versions.order_by("id")])()
+        self.assertEqual(history, ["<p>было</p>", "<p>Привет</p>"])
+
+    @override_settings(AI_JOBS={"EMBEDDED": False, "HEARTBEAT": 0.05, "LEASE": 1})
+    async def test_lease_renewed_while_provider_silent(self):
+        silence = asyncio.Event()
+        self.addCleanup(silence.set)
+
+        async def body():
+            yield sse_lines("При").split("data: [DONE]")[0].encode()
+            await silence.wait()
+
+        def provider(request):
+            return httpx.Response(200, content=body(), headers={"content-type": "text/event-stream"})
+
+        ai_client.set_transport(httpx.MockTransport(provider))
+        job_id = await self.submit()
+        run = asyncio.ensure_future(jobs.process_next())
+        await asyncio.sleep(0.3)
+        job = await self.job(job_id)
+        self.assertGreater(job.heartbeat_at - job.started_at, timedelta(seconds=0.2))
+        self.assertEqual(job.result_text, "При")
+
+        # отмену замечает тот же таймер, хотя событий от провайдера нет
+        await sync_to_async(jobs.cancel)(job)
+        await asyncio.wait_for(run, 2)
+        self.assertEqual((await self.job(job_id)).status, "cancelled")
+
+    async def test_retry_with_backoff_then_fail(self):
+        def fail(request):
+            return httpx.Response(503, text="перегружен")
+
+        ai_client.set_transport(httpx.MockTransport(fail))
+        job_id = await self.submit(max_attempts=2)
+        await jobs.process_next()
+        job = await self.job(job_id)
+        self.assertEqual((job.status, job.attempts), ("queued", 1))
+        self.assertIn("HTTP 503", job.error)
+        await jobs.process_next()
+        job = await self.job(job_id)
+        self.assertEqual((job.status, job.attempts), ("failed", 2))
+        self.assertFalse(await jobs.process_next())
+
+    async def test_cancel_queued_job(self):
+        job_id = await self.submit()
+        resp = await self.post(f"/api/ai/jobs/{job_id}/cancel/", {})
+        self.assertEqual(resp.json()["status"], "cancelled")
+        self.assertFalse(await jobs.process_next())
+
+    async def test_progress_stream(self):
+        job_id = await self.submit()
+        await jobs.process_next()
+        resp = await self.async_client.get(f"/api/ai/jobs/{job_id}/stream/", headers=self.auth)
+        body = b"".join([c async for c in resp.streaming_content]).decode()
+        self.assertIn("id: 6\nevent: content\ndata: Привет\n", body)
+        self.assertIn('event: status\ndata: {"status": "succeeded", "error": ""}', body)
+        resp = await self.async_client.get(
+            f"/api/ai/jobs/{job_id}/stream/", headers={**self.auth, "Last-Event-ID": "6"}
+        )
+        body = b"".join([c async for c in resp.streaming_content]).decode()
+        self.assertNotIn("Привет", body)
+
+
+class ConcurrencyLimiterTests(TestCase):
+    async def test_queue_and_backpressure(self):
+        limiter = ai_limits.ConcurrencyLimiter(
+            global_limit=1, per_user=10, max_queue=1, queue_timeout=1, retry_after=3
+        )
+        await limiter.acquire("a")
+        waiter = asyncio.ensure_future(limiter.acquire("b"))
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.queue_depth, 1)
+        with self.assertRaises(ai_limits.Overloaded) as ctx:
+            await limiter.acquire("c")
+        self.assertEqual(ctx.exception.queue_depth, 1)
+        limiter.release("a")
+        await waiter
+        self.assertEqual(limiter.stats(), {"active": 1, "waiting": 0, "users": 1})
+
+    async def test_per_user_limit_queues(self):
+        limiter = ai_limits.ConcurrencyLimiter(
+            global_limit=10, per_user=1, max_queue=1, queue_timeout=1, retry_after=3
+        )
+        await limiter.acquire("a")
+        waiter = asyncio.ensure_future(limiter.acquire("a"))
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.stats(), {"active": 1, "waiting": 1, "users": 1})
+        # очередь общая: ждущий сверх лимита пользователя занимает в ней место
+        with self.assertRaises(ai_limits.Overloaded) as ctx:
+            await limiter.acquire("a")
+        self.assertEqual(ctx.exception.reason, "queue is full")
+        await limiter.acquire("b")
+        limiter.release("a")
+        await waiter
+        self.assertEqual(limiter.stats(), {"active": 2, "waiting": 0, "users": 2})
+
+
+class StaticAssetsTests(TestCase):
+    def setUp(self):
+        from django.core.management import call_command
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        override = override_settings(STATIC_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+    def asgi_get(self, path, **headers):
+        from docs.assets import StaticFiles
+
+        async def fallback(scope, receive, send):
+            await send({"type": "http.response.start", "status": 404, "headers": []})
+            await send({"type": "http.response.body", "body": b"django"})
+
+        scope = {"type": "http", "method": "GET", "path": path,
+                 "headers": [(k.replace("_", "-").lower().encode(), v.encode()) for k, v in headers.items()]}
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(StaticFiles(fallback)(scope, None, send))
+        return messages[0]["status"], dict(messages[0]["headers"]), b"".join(m.get("body", b"") for m in messages[1:])
+
+    def test_index_without_collectstatic(self):
+        with tempfile.TemporaryDirectory() as empty, override_settings(DEBUG=False, STATIC_ROOT=Path(empty)):
+            resp = self.client.get("/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('src="/static/frontend/app.js"', resp.content.decode())
+
+    def test_minify_keeps_js_semantics(self):
+        from docs.assets import minify_css, minify_js
+
+        src = "let a = b / 2; // деление\nlet r = /[/]+\\//g;\nreturn `x ${ y } // ${'}'}`\n+ +c\n"
+        self.assertEqual(minify_js(src), "let a=b/2;let r=/[/]+\\//g;return`x ${ y } // ${'}'}`\n+ +c\n")
+        # пробел перед «:» не убирается: в селекторе он значим
+        self.assertEqual(minify_css("a :hover , b { color: red ; } /* x */"), "a :hover,b{color:red}\n")
+
+    def test_collectstatic_and_serving(self):
+        html = self.client.get("/").content.decode()
+        js = re.search(r'src="/static/(frontend/app\.[0-9a-f]{12}\.js)"', html).group(1)
+        source = (Path(__file__).resolve().parent.parent / "frontend/static/frontend/app.js").read_text()
+        self.assertLess((self.root / js).stat().st_size, len(source.encode()))
+        self.assertTrue((self.root / (js + ".gz")).exists())
+
+        status, headers, body = self.asgi_get("/static/" + js, accept_encoding="gzip, deflate")
+        self.assertEqual((status, headers[b"content-encoding"], headers[b"vary"]), (200, b"gzip", b"Accept-Encoding"))
+        self.assertIn(b"immutable", headers[b"cache-control"])
+        self.assertEqual(gzip.decompress(body), (self.root / js).read_bytes())
+        self.assertEqual(self.asgi_get("/static/" + js, accept_encoding="gzip", if_none_match=headers[b"etag"].decode())[0], 304)
+
+        status, headers, body = self.asgi_get("/static/frontend/app.js", accept_encoding="gzip;q=0")
+        self.assertEqual((status, headers[b"cache-control"], body), (200, b"public, no-cache", source.encode()))
+        self.assertNotIn(b"content-encoding", headers)
+        self.assertEqual(self.asgi_get("/static/../manage.py")[2], b"django")
+        self.assertEqual(self.asgi_get("/static/frontend/missing.js")[2], b"django")
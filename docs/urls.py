@@ -1,11 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import DocumentViewSet, ai_proxy, ai_proxy_stream
+from .views import AiProviderViewSet, DocumentViewSet, GenerationJobViewSet, ai_job_stream, ai_proxy, ai_proxy_stream
 
 router = DefaultRouter()
 router.register(r"documents", DocumentViewSet, basename="document")
+router.register(r"ai/jobs", GenerationJobViewSet, basename="ai-job")
+router.register(r"ai/providers", AiProviderViewSet, basename="ai-provider")
 
 urlpatterns = [
+    path("ai/jobs/<uuid:job_id>/stream/", ai_job_stream, name="ai-job-stream"),
     path("", include(router.urls)),
     path("ai/", ai_proxy, name="ai-proxy"),
     path("ai/stream/", ai_proxy_stream, name="ai-stream"),  # стримовый SSE
@@ -0,0 +1,302 @@
+"""
+Хранилище версий документа: ключевые кадры + дельты.
+
+Каждая версия — либо полный снимок (kind="full", сжатый zlib),
+либо дельта относительно последнего ключевого кадра (kind="delta").
+Дельта всегда ссылается прямо на ключевой кадр, поэтому любая версия
+восстанавливается максимум одним применением дельты.
+
+Формат дельты — JSON-список операций:
+    [start, end]  — скопировать base[start:end]
+    "текст"       — вставить литерал
+
+Автосохранения склеиваются: правка в пределах DOCS_VERSION_COALESCE_SECONDS
+от создания последней автоматической версии заменяет её (та же метка и
+время, новый id — содержимое версии с данным id не меняется никогда).
+Прореживание накопленной истории — docs/retention.py.
+"""
+import json
+import re
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .lru import LRUCache
+
+KIND_FULL = "full"
+KIND_DELTA = "delta"
+
+# распакованный контент ключевых кадров (они неизменяемы)
+_keyframes = LRUCache(maxsize=getattr(settings, "DOCS_VERSION_CACHE_SIZE", 64))
+
+# HTML режем на куски, заканчивающиеся на ">" или перевод строки
+_TOKEN_RE = re.compile(r"[^>\n]*[>\n]|[^>\n]+")
+# короче этого токен дешевле вставить литералом, чем ссылаться на него
+_MIN_COPY = 8
+
+
+def compress(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), 6)
+
+
+def decompress(data) -> str:
+    return zlib.decompress(bytes(data)).decode("utf-8")
+
+
+def _common_prefix(a: str, b: str) -> int:
+    # бинарный поиск по срезам: сравнение строк идёт в C, а не посимвольно в Python
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def encode_delta(base: str, target: str) -> list:
+    """Строит список операций, превращающих base в target."""
+    # общий префикс/суффикс отрезаем заранее — типичная правка локальна
+    pre = _common_prefix(base, target)
+    suf = _common_suffix(base, target, min(len(base), len(target)) - pre)
+
+    ops = []
+
+    def copy(start, end):
+        if start == end:
+            return
+        if ops and isinstance(ops[-1], list) and ops[-1][1] == start:
+            ops[-1][1] = end
+        else:
+            ops.append([start, end])
+
+    def insert(text):
+        if not text:
+            return
+        if ops and isinstance(ops[-1], str):
+            ops[-1] += text
+        else:
+            ops.append(text)
+
+    copy(0, pre)
+    a_mid = base[pre:len(base) - suf]
+    b_mid = target[pre:len(target) - suf]
+    if a_mid and b_mid:
+        # индекс токенов base → смещение первого вхождения; копировать можно
+        # из любого места base, поэтому кодирование получается линейным
+        index = {}
+        off = pre
+        for tok in _TOKEN_RE.findall(a_mid):
+            index.setdefault(tok, off)
+            off += len(tok)
+        for tok in _TOKEN_RE.findall(b_mid):
+            last = ops[-1] if ops and isinstance(ops[-1], list) else None
+            if last is not None and base.startswith(tok, last[1]):
+                last[1] += len(tok)
+            elif len(tok) >= _MIN_COPY and tok in index:
+                copy(index[tok], index[tok] + len(tok))
+            else:
+                insert(tok)
+    else:
+        insert(b_mid)
+    copy(len(base) - suf, len(base))
+    return ops
+
+
+def apply_delta(base: str, ops: list) -> str:
+    return "".join(base[op[0]:op[1]] if isinstance(op, list) else op for op in ops)
+
+
+def pack_delta(ops: list) -> bytes:
+    raw = json.dumps(ops, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(raw.encode("utf-8"), 6)
+
+
+def unpack_delta(data) -> list:
+    return json.loads(zlib.decompress(bytes(data)).decode("utf-8"))
+
+
+def plan_version(content_html: str, keyframe_content, keyframe_deltas: int):
+    """
+    Решает, как сохранить новую версию.
+    Возвращает (kind, data): для "delta" data — упакованная дельта к кадру.
+    """
+    # после стольких дельт на один ключевой кадр начинаем новый кадр
+    interval = getattr(settings, "DOCS_VERSION_KEYFRAME_INTERVAL", 32)
+    # если дельта весит больше этой доли от полного снимка — пишем полный снимок
+    max_ratio = getattr(settings, "DOCS_VERSION_DELTA_MAX_RATIO", 0.5)
+
+    if keyframe_content is None or keyframe_deltas >= interval:
+        return KIND_FULL, compress(content_html)
+    delta = pack_delta(encode_delta(keyframe_content, content_html))
+    # HTML жмётся zlib не лучше чем в ~16 раз: совсем маленькую дельту
+    # принимаем без сжатия полного снимка ради сравнения
+    if len(delta) * 32 < len(content_html):
+        return KIND_DELTA, delta
+    full = compress(content_html)
+    if len(delta) > len(full) * max_ratio:
+        return KIND_FULL, full
+    return KIND_DELTA, delta
+
+
+def keyframe_content(version) -> str:
+    content = _keyframes.get(version.pk)
+    if content is None:
+        content = decompress(version.data)
+        _keyframes.set(version.pk, content)
+    return content
+
+
+def _keyframe_by_id(pk) -> str:
+    from .models import DocumentVersion
+
+    content = _keyframes.get(pk)
+    if content is None:
+        # сам кадр не подгружаем через FK, если он уже есть в кэше
+        data = DocumentVersion.objects.filter(pk=pk).values_list("data", flat=True).get()
+        content = decompress(data)
+        _keyframes.set(pk, content)
+    return content
+
+
+def forget_keyframe(pk):
+    _keyframes.pop(pk)
+
+
+def rebase_deltas(keyframe_id, delta_ids):
+    """
+    Готовит удаление кадра: первая из оставшихся дельт становится полным
+    снимком, остальные перекодируются к ней. Вызывать в транзакции.
+    """
+    from .models import DocumentVersion
+
+    base = _keyframe_by_id(keyframe_id)
+    rows = DocumentVersion.objects.filter(pk__in=delta_ids).order_by("id").values_list("id", "data")
+    contents = [(pk, apply_delta(base, unpack_delta(data))) for pk, data in rows]
+    if not contents:
+        return
+    key_id, key_html = contents[0]
+    DocumentVersion.objects.filter(pk=key_id).update(kind=KIND_FULL, base=None, data=compress(key_html))
+    _keyframes.set(key_id, key_html)
+    for pk, html in contents[1:]:
+        kind, data = plan_version(html, key_html, 0)
+        DocumentVersion.objects.filter(pk=pk).update(
+            kind=kind, base_id=key_id if kind == KIND_DELTA else None, data=data
+        )
+
+
+def load_content(version) -> str:
+    """Восстанавливает HTML версии (не более одного применения дельты)."""
+    if version.kind == KIND_FULL:
+        return keyframe_content(version)
+    return apply_delta(_keyframe_by_id(version.base_id), unpack_delta(version.data))
+
+
+def latest_keyframe(document):
+    from .models import DocumentVersion
+
+    return (
+        DocumentVersion.objects.filter(document=document, kind=KIND_FULL)
+        .annotate(n_deltas=Count("deltas"))
+        .order_by("-id")
+        .first()
+    )
+
+
+def next_version_number(document) -> int:
+    """
+    Атомарно увеличивает счётчик версий документа и возвращает новый номер.
+    UPDATE ... SET version_seq = version_seq + 1 блокирует строку до конца
+    транзакции, поэтому параллельные сохранения получают разные номера.
+    """
+    from .models import Document
+
+    with transaction.atomic():
+        Document.objects.filter(pk=document.pk).update(version_seq=F("version_seq") + 1)
+        number = Document.objects.filter(pk=document.pk).values_list("version_seq", flat=True).get()
+    document.version_seq = number
+    return number
+
+
+def _coalescible(document):
+    """Последняя версия, которую новая правка может заменить, или None."""
+    from .models import DocumentVersion
+
+    window = getattr(settings, "DOCS_VERSION_COALESCE_SECONDS", 0)
+    if not window:
+        return None
+    latest = (
+        DocumentVersion.objects.filter(document=document)
+        .defer("data")
+        .annotate(n_deltas=Count("deltas"))
+        .order_by("-id")
+        .first()
+    )
+    if latest is None or latest.manual or latest.n_deltas:
+        return None
+    if latest.created_at < timezone.now() - timedelta(seconds=window):
+        return None
+    return latest
+
+
+def create_version(document, content_html: str, label: str = None, manual: bool = False, coalesce: bool = False):
+    """
+    Сохраняет новую версию документа в виде кадра или дельты.
+    Без label версия получает метку v<номер> по счётчику документа.
+    coalesce — правка из редактора (PUT, PATCH content/, сброс автосохранения):
+    такие версии склеиваются в пределах окна; остальные записи (задачи ИИ,
+    импорт) всегда заводят новую. manual — ручной снимок, его не трогают ни
+    склейка, ни политика хранения.
+    """
+    from .models import DocumentVersion
+    from .retention import schedule
+
+    with transaction.atomic():
+        previous = _coalescible(document) if coalesce and not (label or manual) else None
+        # параллельная правка могла заменить ту же версию — тогда заводим новую
+        if previous is not None and DocumentVersion.objects.filter(pk=previous.pk).delete()[0]:
+            label = previous.label
+        else:
+            previous = None
+            number = next_version_number(document)
+            label = label or f"v{number}"
+        key = latest_keyframe(document)
+        if key is None:
+            kind, data = plan_version(content_html, None, 0)
+        else:
+            kind, data = plan_version(content_html, keyframe_content(key), key.n_deltas)
+        version = DocumentVersion.objects.create(
+            document=document,
+            label=label,
+            kind=kind,
+            base=key if kind == KIND_DELTA else None,
+            data=data,
+            size=len(content_html),
+            manual=manual,
+        )
+        if previous is not None:
+            # окно склейки отсчитывается от первой правки, а не от последней
+            version.created_at = previous.created_at
+            DocumentVersion.objects.filter(pk=version.pk).update(created_at=previous.created_at)
+    if previous is not None and previous.kind == KIND_FULL:
+        forget_keyframe(previous.pk)
+    if kind == KIND_FULL:
+        _keyframes.set(version.pk, content_html)
+    schedule()
+    return version
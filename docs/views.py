@@ -1,78 +1,435 @@
+import asyncio
 import json
 import httpx
-from django.conf import settings
-from django.db.models import Q
-from rest_framework import status, viewsets
-from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf, Substr
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, mixins, viewsets
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from django.http import StreamingHttpResponse
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 
-from .models import Document, DocumentVersion
-from .serializers import DocumentSerializer, DocumentCreateSerializer
+from . import (
+    ai_cache, ai_client, ai_limits, ai_providers, ai_stream, autosave, blocks, conditional, diffing, jobs, metrics,
+    rendering,
+)
+from .authentication import CachedJWTAuthentication, revoke_token
+from .ai_stream import sse_frame
+from .ai_context import build_context, estimate_tokens
+from .export import negotiate_encoding, streaming_html_response, streaming_zip_response
+from .importing import ImportItemError, bulk_import, detect_format, iter_items, spool
+from .models import Document, DocumentBlock, DocumentVersion, GenerationJob
+from .pagination import DocumentCursorPagination, VersionCursorPagination
+from .serializers import (
+    EXCERPT_SCAN,
+    DocumentCreateSerializer,
+    DocumentListSerializer,
+    DocumentMetaSerializer,
+    DocumentPatchSerializer,
+    DocumentSerializer,
+    DocumentVersionListSerializer,
+    DocumentVersionSerializer,
+    GenerationJobCreateSerializer,
+    GenerationJobSerializer,
+)
+from .patching import PatchError, apply_ops
 from .permissions import IsOwner
-
-# AI_URL = settings.AI_PROVIDER_URL
-AI_URL = "https://router.huggingface.co/v1/chat/completions"
+from .search import get_backend as get_search_backend, index_document
+from .versioning import create_version
 
 
 class DocumentViewSet(viewsets.ModelViewSet):
     queryset = Document.objects.all()
     serializer_class = DocumentSerializer
     permission_classes = [IsAuthenticated, IsOwner]
+    pagination_class = DocumentCursorPagination
 
     def get_queryset(self):
         qs = Document.objects.filter(owner=self.request.user, is_deleted=False)
-        q = self.request.query_params.get("q")
-        if q:
-            # быстрый поиск по названию и содержимому
-            qs = qs.filter(Q(title__icontains=q) | Q(content_html__icontains=q))
+        if self.action == "list":
+            # список — только сводка: без полного HTML, счётчик версий одним запросом.
+            # Коррелированный подзапрос вместо JOIN + GROUP BY: порядок берётся
+            # из индекса doc_owner_live_updated_idx без сортировки всей выборки
+            versions = (
+                DocumentVersion.objects.filter(document=OuterRef("pk"))
+                .order_by()
+                .values("document")
+                .annotate(n=Count("id"))
+                .values("n")
+            )
+            first_block = DocumentBlock.objects.filter(document=OuterRef("pk"), position=0).values("html")[:1]
+            qs = qs.defer("content_html").annotate(
+                version_count=Coalesce(Subquery(versions), Value(0)),
+                # у блочного документа колонка пустая — превью из первого блока
+                excerpt_raw=Coalesce(
+                    NullIf(Substr("content_html", 1, EXCERPT_SCAN), Value("")),
+                    Substr(Subquery(first_block), 1, EXCERPT_SCAN),
+                    Value(""),
+                ),
+            )
         return qs
 
     def get_serializer_class(self):
         if self.action in ["create", "update", "partial_update"]:
             return DocumentCreateSerializer
+        if self.action == "list":
+            return DocumentListSerializer
         return DocumentSerializer
 
+    def list(self, request, *args, **kwargs):
+        q = request.query_params.get("q")
+        if not q:
+            return super().list(request, *args, **kwargs)
+        # полнотекстовый поиск: результаты по релевантности, без курсора
+        limit = self.paginator.get_page_size(request)
+        hits = get_search_backend().search(request.user.id, q, limit=limit)
+        docs = self.get_queryset().in_bulk([h.document_id for h in hits])
+        results = []
+        for hit in hits:
+            doc = docs.get(hit.document_id)
+            if doc is None:
+                continue
+            item = DocumentListSerializer(doc).data
+            item["snippet"] = hit.snippet
+            item["rank"] = hit.rank
+            results.append(item)
+        return Response({"next": None, "previous": None, "results": results})
+
+    def get_object(self):
+        # несброшенные автосохранения (docs/autosave.py) видны сразу
+        return autosave.overlay(super().get_object())
+
+    def _meta(self, fields=()):
+        """Документ только с метаданными (без content_html) — для условных заголовков."""
+        qs = self.get_queryset().only(*conditional.DOCUMENT_FIELDS, *fields)
+        obj = get_object_or_404(qs, pk=self.kwargs["pk"])
+        self.check_object_permissions(self.request, obj)
+        return autosave.overlay(obj)
+
+    def _preconditions(self, variant=""):
+        """
+        Проверка If-* по метаданным: 304 — готовый ответ, несовпадение If-Match — 412.
+        Возвращает (ответ или None, ожидаемая ревизия или None).
+        """
+        if not conditional.is_conditional(self.request):
+            return None, None
+        meta = self._meta()
+        return conditional.evaluate(self.request, conditional.document_etag(meta, variant), meta.updated_at), meta.revision
+
+    def retrieve(self, request, *args, **kwargs):
+        # ?content=0 — без содержимого: большой документ клиент грузит блоками (blocks/)
+        with_content = request.query_params.get("content") not in ("0", "false", "no")
+        variant = "" if with_content else "meta"
+        early, _ = self._preconditions(variant)
+        if early is not None:
+            return early
+        if with_content:
+            doc = self.get_object()
+            data = self.get_serializer(doc).data
+        else:
+            doc = self._meta(DocumentMetaSerializer.Meta.fields)
+            data = DocumentMetaSerializer(doc).data
+        response = Response(data)
+        return conditional.set_validators(response, conditional.document_etag(doc, variant), doc.updated_at)
+
+    def update(self, request, *args, **kwargs):
+        autosave.flush_document(self.kwargs["pk"])
+        early, self._expected_revision = self._preconditions()
+        if early is not None:
+            return early
+        response = super().update(request, *args, **kwargs)
+        doc = self._saved
+        return conditional.set_validators(response, conditional.document_etag(doc), doc.updated_at)
+
+    def destroy(self, request, *args, **kwargs):
+        autosave.flush_document(self.kwargs["pk"])
+        early, _ = self._preconditions()
+        if early is not None:
+            return early
+        return super().destroy(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         doc = serializer.save(owner=self.request.user)
         # создаём первую версию
-        DocumentVersion.objects.create(document=doc, label="v1", content_html=doc.content_html)
+        create_version(doc, doc.content_html)
+        index_document(doc)
 
     def perform_update(self, serializer):
-        doc = serializer.save()
-        # снапшот версии
-        label = f"v{doc.versions.count()+1}"
-        DocumentVersion.objects.create(document=doc, label=label, content_html=doc.content_html)
+        expected = getattr(self, "_expected_revision", None)
+        with transaction.atomic():
+            doc = serializer.save(revision=F("revision") + 1)
+            doc.refresh_from_db(fields=["revision"])
+            # If-Match: документ могли изменить между проверкой и записью — откатываем
+            if expected is not None and doc.revision != expected + 1:
+                raise conditional.PreconditionFailed()
+            # снапшот версии
+            create_version(doc, doc.content_html, coalesce=True)
+        index_document(doc)
+        self._saved = doc
 
     def perform_destroy(self, instance):
         # мягкое удаление
         instance.is_deleted = True
         instance.save(update_fields=["is_deleted"])
 
+    @action(detail=True, methods=["patch"], url_path="content")
+    def patch_content(self, request, pk=None):
+        """
+        Инкрементальное сохранение: операции над текстом ревизии base_revision.
+        Если документ успели изменить — 409 с текущей ревизией.
+        """
+        doc = self.get_object()
+        conditional.evaluate(request, conditional.document_etag(doc), doc.updated_at)
+        serializer = DocumentPatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        base = data["base_revision"]
+        if doc.revision != base:
+            return self._revision_conflict(doc.revision)
+        try:
+            html = apply_ops(doc.content_html, data["ops"])
+        except PatchError as e:
+            raise exceptions.ValidationError({"ops": [str(e)]})
+
+        if autosave.enabled():
+            # отложенная запись: в БД уйдёт последнее состояние, когда документ затихнет
+            entry = autosave.get_buffer().put(doc, base, data.get("title", doc.title), html)
+            if entry is None:
+                return self._revision_conflict(autosave.overlay(doc).revision)
+            autosave.overlay(doc)
+            response = Response({"id": doc.id, "revision": doc.revision, "updated_at": doc.updated_at})
+            return conditional.set_validators(response, conditional.document_etag(doc), doc.updated_at)
+
+        fields = {"content_html": html, "revision": base + 1, "updated_at": timezone.now()}
+        if "title" in data:
+            fields["title"] = data["title"]
+        with transaction.atomic():
+            # условный UPDATE: параллельное сохранение той же ревизии получит 409
+            qs = Document.objects.filter(pk=doc.pk, revision=base)
+            if not blocks.update(qs, doc.pk, fields, was_chunked=doc.chunked):
+                current = Document.objects.filter(pk=doc.pk).values_list("revision", flat=True).first()
+                return self._revision_conflict(current)
+            for name, value in fields.items():
+                setattr(doc, name, value)
+            doc.chunked = blocks.should_chunk(html)
+            create_version(doc, html, coalesce=True)
+        index_document(doc)
+        response = Response({"id": doc.id, "revision": doc.revision, "updated_at": doc.updated_at})
+        return conditional.set_validators(response, conditional.document_etag(doc), doc.updated_at)
+
+    @staticmethod
+    def _revision_conflict(current):
+        return Response({"detail": "Документ изменён, ревизия устарела.", "revision": current}, status=409)
+
+    @action(detail=True, methods=["get"], url_path="blocks")
+    def content_blocks(self, request, pk=None):
+        """
+        Содержимое диапазоном блоков (docs/blocks.py): ?start=0&limit=20.
+        Ответ: блоки с позициями и хэшами, всего блоков (count) и next — откуда
+        продолжать; клиент рисует первую порцию и догружает остальное.
+        """
+        try:
+            start = int(request.query_params.get("start", 0))
+            limit = int(request.query_params.get("limit", 0)) or None
+        except ValueError:
+            raise exceptions.ValidationError({"start": ["Ожидается число."]})
+        variant = f"blocks-{start}-{limit or ''}"
+        early, _ = self._preconditions(variant)
+        if early is not None:
+            return early
+        doc = self._meta(("chunked",))
+        response = Response(blocks.page(doc, start, limit))
+        return conditional.set_validators(response, conditional.document_etag(doc, variant), doc.updated_at)
+
     @action(detail=True, methods=["post"])
     def snapshot(self, request, pk=None):
         doc = self.get_object()
-        label = request.data.get("label") or f"v{doc.versions.count()+1}"
-        DocumentVersion.objects.create(document=doc, label=label, content_html=doc.content_html)
-        return Response({"ok": True, "label": label})
+        version = create_version(doc, doc.content_html, request.data.get("label") or None, manual=True)
+        return Response({"ok": True, "label": version.label})
+
+    @action(detail=True, methods=["get"])
+    def versions(self, request, pk=None):
+        doc = self._meta()
+        qs = doc.versions.defer("data")
+        paginator = VersionCursorPagination()
+        page = paginator.paginate_queryset(qs, request, view=self)
+        return paginator.get_paginated_response(DocumentVersionListSerializer(page, many=True).data)
+
+    @action(detail=True, methods=["get"], url_path=r"versions/(?P<version_id>[0-9]+)")
+    def version_detail(self, request, pk=None, version_id=None):
+        # версии неизменяемы: ETag — id, ответ клиент держит в кэше без перепроверки
+        doc = self._meta()
+        etag = conditional.version_etag(version_id)
+        if conditional.is_conditional(request):
+            created_at = doc.versions.filter(pk=version_id).values_list("created_at", flat=True).first()
+            if created_at is None:
+                raise Http404
+            early = conditional.evaluate(request, etag, created_at, conditional.IMMUTABLE)
+            if early is not None:
+                return early
+        version = get_object_or_404(doc.versions, pk=version_id)
+        response = Response(DocumentVersionSerializer(version).data)
+        return conditional.set_validators(response, etag, version.created_at, conditional.IMMUTABLE)
+
+    @action(detail=True, methods=["get"], url_path=r"versions/(?P<version_id>[0-9]+)/diff/(?P<other_id>[0-9]+)")
+    def version_diff(self, request, pk=None, version_id=None, other_id=None):
+        """
+        Сравнение версий на сервере (docs/diffing.py): изменённые участки от
+        version_id к other_id. ?mode=text — по тексту без разметки (format занят
+        DRF под выбор рендерера).
+        Обе версии неизменяемы — и ответ тоже: кэш на сервере и у клиента.
+        """
+        fmt = request.query_params.get("mode", "html")
+        if fmt not in diffing.FORMATS:
+            raise exceptions.ValidationError({"mode": [f"Ожидается одно из: {', '.join(diffing.FORMATS)}."]})
+        doc = self._meta()
+        ids = (int(version_id), int(other_id))
+        stamps = dict(doc.versions.filter(pk__in=ids).values_list("pk", "created_at"))
+        if len(stamps) != len(set(ids)):
+            raise Http404
+        etag = f'"vd{ids[0]}-{ids[1]}-{fmt}"'
+        last_modified = max(stamps.values())
+        early = conditional.evaluate(request, etag, last_modified, conditional.IMMUTABLE)
+        if early is not None:
+            return early
+        result = diffing.cached(*ids, fmt)
+        if result is None:
+            versions = doc.versions.in_bulk(ids)
+            result = diffing.version_diff(versions[ids[0]], versions[ids[1]], fmt)
+        return conditional.set_validators(Response(result), etag, last_modified, conditional.IMMUTABLE)
 
     @action(detail=True, methods=["get"])
     def export(self, request, pk=None):
+        # сжатый и несжатый ответы — разные байты, значит и разные сильные ETag
+        variant = "-".join(filter(None, ["html", negotiate_encoding(request.headers.get("Accept-Encoding"))]))
+        early, _ = self._preconditions(variant)
+        if early is not None:
+            early["Vary"] = "Accept-Encoding"
+            return early
         doc = self.get_object()
-        html = f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{doc.title}</title></head><body>{doc.content_html}</body></html>'
-        return Response(html, content_type="text/html")
+        response = streaming_html_response(request, doc)
+        return conditional.set_validators(response, conditional.document_etag(doc, variant), doc.updated_at)
+
+    @action(detail=False, methods=["get"], url_path="export")
+    def export_all(self, request):
+        # ZIP всех документов; ?versions=1 — вместе с историей версий
+        with_versions = request.query_params.get("versions") in ("1", "true", "yes")
+        return streaming_zip_response(request, request.user, with_versions)
+
+    @action(detail=False, methods=["post"], url_path="import")
+    def import_bulk(self, request):
+        """
+        Массовый импорт: ZIP с .html или NDJSON — файлом в multipart (поле file)
+        или телом запроса (application/zip, application/x-ndjson).
+        """
+        if request.content_type.startswith("multipart/"):
+            upload = request.FILES.get("file")
+            if upload is None:
+                raise exceptions.ValidationError({"file": ["Файл не передан."]})
+            fileobj, filename = upload, upload.name
+        else:
+            fileobj, filename = spool(request.stream), ""
+        fmt = detect_format(fileobj.read(4), request.content_type, filename)
+        fileobj.seek(0)
+        try:
+            batch_size = int(request.query_params.get("batch_size", 200))
+        except ValueError:
+            batch_size = 200
+        try:
+            report = bulk_import(request.user, iter_items(fileobj, fmt), batch_size=max(1, min(batch_size, 1000)))
+        except ImportItemError as e:
+            raise exceptions.ValidationError({"file": [str(e)]})
+        return Response(report.as_dict(), status=201 if report.created else 200)
 
     @action(detail=False, methods=["post"])
     def import_html(self, request):
         title = request.data.get("title") or "Импортированный документ"
         html = request.data.get("content_html") or ""
         doc = Document.objects.create(owner=request.user, title=title, content_html=html)
-        DocumentVersion.objects.create(document=doc, label="v1", content_html=html)
+        create_version(doc, html)
+        index_document(doc)
         return Response(DocumentSerializer(doc).data, status=201)
 
 
-def build_payload(mode: str, prompt: str, html: str, selection: str, *, stream: bool = False):
+class GenerationJobViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Фоновые генерации (docs/jobs.py): POST ставит задачу и сразу отвечает 202,
+    GET — состояние и прогресс, POST {id}/cancel/ — отмена.
+    Прогресс стримом: /api/ai/jobs/{id}/stream/.
+    """
+
+    serializer_class = GenerationJobSerializer
+    permission_classes = [IsAuthenticated, IsOwner]
+
+    def get_queryset(self):
+        qs = GenerationJob.objects.filter(owner=self.request.user)
+        status = self.request.query_params.get("status")
+        if status:
+            qs = qs.filter(status=status)
+        return qs
+
+    def create(self, request, *args, **kwargs):
+        serializer = GenerationJobCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        document = None
+        if "document_id" in data:
+            document = get_object_or_404(Document, pk=data["document_id"], owner=request.user, is_deleted=False)
+        params = {k: data[k] for k in ("prompt", "selection", "html", "title") if data[k]}
+        if document is not None and not params.get("html"):
+            params["html"] = document.content_html
+        job = jobs.submit(
+            request.user, data["mode"], params, document=document, write=data["write"],
+            max_attempts=data.get("max_attempts"),
+        )
+        return Response(GenerationJobSerializer(job).data, status=202)
+
+    @action(detail=True, methods=["post"])
+    def cancel(self, request, pk=None):
+        job = jobs.cancel(self.get_object())
+        return Response(GenerationJobSerializer(job).data)
+
+
+class LogoutView(APIView):
+    """Отзывает текущий access-токен (docs/authentication.py)."""
+
+    def post(self, request):
+        if request.auth is not None:
+            revoke_token(request.auth)
+        return Response(status=204)
+
+
+class MetricsView(APIView):
+    """Метрики в текстовом формате Prometheus (docs/metrics.py); Bearer-токен или сессия staff."""
+
+    authentication_classes = [CachedJWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class AiProviderViewSet(viewsets.ViewSet):
+    """Состояние AI-провайдеров: circuit breaker, ошибки, время до первого байта."""
+
+    permission_classes = [IsAdminUser]
+
+    def list(self, request):
+        return Response(ai_providers.status())
+
+
+DEFAULT_MODEL = "openai/gpt-oss-120b:cerebras"
+
+
+def build_payload(mode: str, prompt: str, html: str, selection: str, *, stream: bool = False, version_key=None):
     """
     Формируем payload в формате, которого ждёт твой n8n:
     {
@@ -146,10 +503,10 @@ def build_payload(mode: str, prompt: str, html: str, selection: str, *, stream:
     elif mode == "rewrite":
         user_msg = f"Перепиши фрагмент: {selection}\n\nИнструкция: {prompt}"
     elif mode == "continue":
-        ctx = (html or "")[-1000:]
+        ctx = build_context("continue", html, prompt, selection, version_key)
         user_msg = f"Продолжи текст: {ctx}\n\nИнструкция: {prompt}"
     elif mode == "outline":
-        src = (html or "")[:1000]
+        src = build_context("outline", html, prompt, selection, version_key)
         user_msg = f"Составь план документа на основе:\n{src}\n\nИнструкция: {prompt}"
     else:
         user_msg = prompt or html or ""
@@ -162,105 +519,15 @@ def build_payload(mode: str, prompt: str, html: str, selection: str, *, stream:
         "temperature": 0.7,
         "top_p": 0.95,
         "stream": stream,
-        "model": "openai/gpt-oss-120b:cerebras"
+        "model": DEFAULT_MODEL
     }
 
 
-@api_view(["POST", "OPTIONS"])
-@permission_classes([IsAuthenticated])
-def ai_proxy(request):
+def build_stream_payload(mode: str, prompt: str, html: str, selection: str, context: str = "", version_key=None):
     """
-    Обычный (нестримовый) AI-эндпоинт:
-    - принимает {mode, prompt, html, selection}
-    - нормализует в {messages: [...], temperature, top_p, max_tokens, stream:false}
-    - вызывает n8n
-    - возвращает JSON от n8n как есть (если не JSON — вернём {"text": "..."}).
-
-    Если тебе НУЖЕН стрим, используй /api/ai/stream/ (другая вью).
+    Payload для стримового эндпоинта. Провайдеру с format "messages" (n8n)
+    уходят только messages, "chat" — ещё model и stream (Provider.prepare).
     """
-    # CORS для фронта на другом origin (127.0.0.1:5500 → 127.0.0.1:8000)
-    cors_headers = {
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization",
-        "Access-Control-Allow-Methods": "POST, OPTIONS",
-    }
-    if request.method == "OPTIONS":
-        return Response(status=204, headers=cors_headers)
-
-    # Забираем простые поля от фронта
-    mode = request.data.get("mode", "generate")
-    prompt = request.data.get("prompt", "") or ""
-    html = request.data.get("html", "") or ""
-    selection = request.data.get("selection", "") or ""
-
-    # Собираем payload под твой n8n (НЕ стрим)
-    payload = build_payload(mode, prompt, html, selection, stream=False)
-
-    try:
-        r = httpx.post(AI_URL, json=payload, timeout=120)
-
-        # Пытаемся вернуть JSON как есть
-        content_type = r.headers.get("content-type", "")
-        if "application/json" in content_type:
-            try:
-                data = r.json()
-                return Response(data, status=r.status_code, headers=cors_headers)
-            except json.JSONDecodeError:
-                pass  # упадём в текстовый путь ниже
-
-        # Если провайдер вернул не JSON (или это SSE без stream=false) — соберём текст грубо
-        text = r.text or ""
-        # Попытка распарсить OpenAI-SSE (на случай, если на стороне n8n всё-таки включён stream)
-        if "data:" in text:
-            acc = []
-            for line in text.splitlines():
-                line = line.strip()
-                if not line.startswith("data:"):
-                    continue
-                chunk = line[5:].strip()
-                if chunk == "[DONE]":
-                    break
-                try:
-                    j = json.loads(chunk)
-                    choice = (j.get("choices") or [{}])[0]
-                    delta = choice.get("delta") or {}
-                    piece = delta.get("content") or delta.get("reasoning_content") or ""
-                    if not piece:
-                        # иногда финал приходит в message.content
-                        msg = (choice.get("message") or {}).get("content") or ""
-                        piece = msg
-                    if piece:
-                        acc.append(piece)
-                except Exception:
-                    # если это не JSON — добавим как сырой текст
-                    if chunk:
-                        acc.append(chunk)
-            return Response({"text": "".join(acc)}, status=200, headers=cors_headers)
-
-        # Иначе вернём как простой текст
-        return Response({"text": text}, status=r.status_code, headers=cors_headers)
-
-    except httpx.HTTPError as e:
-        return Response({"error": str(e)}, status=502, headers=cors_headers)
-      
-      
-@api_view(["OPTIONS", "POST"])
-@permission_classes([IsAuthenticated])
-def ai_proxy_stream(request):
-    cors = {
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization",
-        "Access-Control-Allow-Methods": "POST, OPTIONS",
-    }
-    if request.method == "OPTIONS":
-        return Response(status=204, headers=cors)
-
-    mode = request.data.get("mode", "generate")
-    prompt = request.data.get("prompt", "")
-    html = request.data.get("html", "")
-    selection = request.data.get("selection", "")
-
-    # Собираем messages в зависимости от режима
     messages = [
         {"role": "system", "content": "Ты помощник, который помогает создавать документы."}
     ]
@@ -273,7 +540,7 @@ def ai_proxy_stream(request):
             "content": f"Перепиши этот фрагмент: {selection}\n\nИнструкция: {prompt}"
         })
     elif mode == "continue":
-        ctx = request.data.get("context") or html[-1000:]
+        ctx = context or build_context("continue", html, prompt, selection, version_key)
         messages.append({
             "role": "user",
             "content": f"Продолжи текст: {ctx}\n\nИнструкция: {prompt}"
@@ -281,22 +548,301 @@ def ai_proxy_stream(request):
     elif mode == "outline":
         messages.append({
             "role": "user",
-            "content": f"Составь план документа на основе:\n{html[:1000]}\n\nИнструкция: {prompt}"
+            "content": f"Составь план документа на основе:\n{build_context('outline', html, prompt, selection, version_key)}\n\nИнструкция: {prompt}"
         })
     else:
         messages.append({"role": "user", "content": prompt or html})
 
-    payload = {"messages": messages}
+    return {"messages": messages, "model": DEFAULT_MODEL}
 
-    def sse_emit(event: str, data: str):
-        return (f"event: {event}\n" + f"data: {data}\n\n").encode("utf-8")
 
-    def stream():
-        with httpx.stream("POST", settings.AI_PROVIDER_URL, json=payload, timeout=None) as r:
-            for raw in r.iter_lines():
-                if not raw:
+def parse_sse_text(text: str) -> str:
+    """Склеивает текст из OpenAI-SSE (на случай, если провайдер всё-таки стримит)."""
+    acc = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith("data:"):
+            continue
+        chunk = line[5:].strip()
+        if chunk == "[DONE]":
+            break
+        try:
+            j = json.loads(chunk)
+            choice = (j.get("choices") or [{}])[0]
+            delta = choice.get("delta") or {}
+            piece = delta.get("content") or delta.get("reasoning_content") or ""
+            if not piece:
+                # иногда финал приходит в message.content
+                msg = (choice.get("message") or {}).get("content") or ""
+                piece = msg
+            if piece:
+                acc.append(piece)
+        except Exception:
+            # если это не JSON — добавим как сырой текст
+            if chunk:
+                acc.append(chunk)
+    return "".join(acc)
+
+
+# CORS для фронта на другом origin (127.0.0.1:5500 → 127.0.0.1:8000)
+AI_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization, Last-Event-ID",
+    "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+    "Access-Control-Expose-Headers": "X-AI-Cache, X-AI-Queue-Depth, X-AI-Generation, Retry-After",
+}
+
+
+def _with_cors(resp):
+    for k, v in AI_CORS_HEADERS.items():
+        resp[k] = v
+    return resp
+
+
+async def _authenticate(request):
+    """
+    Та же аутентификация, что и у DRF-вью (JWT), но для обычной async-вью.
+    Проверка токена/загрузка пользователя синхронные — уводим их в поток.
+    """
+    def run():
+        for auth_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+            result = auth_class().authenticate(request)
+            if result is not None:
+                return result[0]
+        return None
+
+    try:
+        user = await sync_to_async(run)()
+    except exceptions.APIException:
+        return None
+    if user is None or not user.is_authenticated:
+        return None
+    request.user = user
+    return user
+
+
+def _read_fields(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except (ValueError, UnicodeDecodeError):
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    return data
+
+
+async def _preflight(request, handler):
+    """OPTIONS/метод/аутентификация; возвращает готовый ответ или (user, data)."""
+    if request.method == "OPTIONS":
+        return _with_cors(HttpResponse(status=204))
+    if request.method != "POST":
+        return _with_cors(JsonResponse({"detail": "Method not allowed"}, status=405))
+    user = await _authenticate(request)
+    if user is None:
+        return _with_cors(JsonResponse({"detail": "Authentication credentials were not provided."}, status=401))
+    return await handler(request, user, _read_fields(request))
+
+
+async def _open_call(provider, payload):
+    """
+    Нестримовый вызов одного провайдера до заголовков ответа. Попытка
+    хеджирования решается по заголовкам: латентность в ai_providers — время
+    до ответа, а не генерации целиком (длинный ответ не «медленный вызов»).
+    Тело читает _read_call уже у победителя; проигравших закрывает release.
+    """
+    client = ai_client.get_client()
+    request = client.build_request("POST", provider.url, json=provider.prepare(payload), headers=provider.headers)
+    try:
+        r = await client.send(request, stream=True)
+    except httpx.HTTPError as e:
+        message = str(e) or type(e).__name__
+        raise ai_providers.ProviderError(message, (502, {"error": message})) from None
+    if r.status_code >= 500 or r.status_code == 429:
+        # сбой на стороне провайдера — пробуем следующего (docs/ai_providers.py)
+        try:
+            result = await _read_call(r)
+        except httpx.HTTPError:
+            result = r.status_code, {"error": f"HTTP {r.status_code}"}, 0
+        raise ai_providers.ProviderError(f"HTTP {r.status_code}", result[:2])
+    return r
+
+
+async def _read_call(r):
+    """Дочитывает ответ _open_call → (status, data, size) в том виде, как отдаём клиенту."""
+    try:
+        await r.aread()
+    finally:
+        await r.aclose()
+
+    # Пытаемся вернуть JSON как есть
+    content_type = r.headers.get("content-type", "")
+    result = None
+    if "application/json" in content_type:
+        try:
+            result = r.status_code, r.json()
+        except json.JSONDecodeError:
+            pass  # упадём в текстовый путь ниже
+
+    if result is None:
+        # Если провайдер вернул не JSON (или это SSE без stream=false) — соберём текст грубо
+        text = r.text or ""
+        if "data:" in text:
+            result = 200, {"text": parse_sse_text(text)}
+        else:
+            # Иначе вернём как простой текст
+            result = r.status_code, {"text": text}
+    return result + (len(r.content),)
+
+
+def _attach_html(body):
+    """Кладёт в ответ провайдера "html" — Markdown ответа, отрендеренный сервером (docs/rendering.py)."""
+    obj = body[0] if isinstance(body, list) and body else body
+    if not isinstance(obj, dict):
+        return
+    choice = (obj.get("choices") or [{}])[0]
+    text = (choice.get("message") or {}).get("content") or obj.get("text") or ""
+    # "html" от провайдера не пропускаем: фронтенд вставляет его без санитайзера
+    obj["html"] = rendering.render_markdown(text) if text else ""
+
+
+def _completion_tokens(body):
+    if not isinstance(body, dict):
+        return 0
+    usage = body.get("usage") or {}
+    if usage.get("completion_tokens"):
+        return usage["completion_tokens"]
+    choice = (body.get("choices") or [{}])[0]
+    return estimate_tokens((choice.get("message") or {}).get("content") or body.get("text") or "")
+
+
+async def _call_provider(payload, mode=""):
+    """Нестримовый вызов через реестр провайдеров: хеджирование и failover."""
+    call = metrics.AiCall("call", mode)
+    try:
+        provider, response = await ai_providers.hedged(
+            "call", lambda provider: _open_call(provider, payload), release=lambda r: r.aclose()
+        )
+    except ai_providers.NoProviders as e:
+        call.finish(None, "unavailable")
+        return 503, {"error": str(e)}
+    except ai_providers.ProviderError as e:
+        call.finish(None, "error")
+        return e.result or (502, {"error": str(e)})
+    call.first_byte()
+    try:
+        status_code, body, size = await _read_call(response)
+    except httpx.HTTPError as e:
+        message = str(e) or type(e).__name__
+        call.finish(provider.name, "error")
+        return 502, {"error": message}
+    call.bytes, call.tokens = size, _completion_tokens(body)
+    call.finish(provider.name, "ok" if status_code < 400 else "error")
+    return status_code, body
+
+
+async def _document_html(user, data):
+    """
+    HTML для контекста: из запроса, а если его нет и передан document_id — из БД.
+    Второе значение — ключ версии для кэша разделов (None → кэш по хэшу HTML).
+    """
+    html = data.get("html", "") or ""
+    doc_id = data.get("document_id")
+    if html or not doc_id:
+        return html, None
+    doc = await Document.objects.filter(owner=user, is_deleted=False, pk=doc_id).only(
+        "content_html", "chunked", "updated_at"
+    ).afirst()
+    if doc is None:
+        return "", None
+    autosave.overlay(doc)
+    if "content_html" not in doc.__dict__:
+        # блочный документ (docs/blocks.py): ленивая сборка из блоков — синхронный запрос
+        doc.content_html = await sync_to_async(blocks.assemble)(doc.pk)
+    return doc.content_html, (doc.pk, doc.updated_at.isoformat())
+
+
+async def _ai_proxy(request, user, data):
+    # Забираем простые поля от фронта
+    mode = data.get("mode", "generate")
+    prompt = data.get("prompt", "") or ""
+    html, version_key = await _document_html(user, data)
+    selection = data.get("selection", "") or ""
+
+    # Собираем payload под твой n8n (НЕ стрим)
+    payload = build_payload(mode, prompt, html, selection, stream=False, version_key=version_key)
+
+    key = ai_cache.cache_key("proxy", payload)
+    cache_state = "BYPASS"
+    if ai_cache.enabled_for(mode, request, data):
+        cached = await ai_cache.aget(key)
+        if cached is not None:
+            resp = JsonResponse(cached, status=200, safe=False)
+            resp["X-AI-Cache"] = "HIT"
+            return _with_cors(resp)
+        cache_state = "MISS"
+
+    # одинаковые одновременные запросы делят один вызов провайдера
+    try:
+        status_code, body = await ai_limits.coalesced_call(
+            key, user.pk, lambda: _call_provider(payload, mode)
+        )
+    except ai_limits.Overloaded as e:
+        return _overloaded(e)
+    if status_code == 200:
+        # в кэш — уже с HTML: попадание не рендерит заново
+        _attach_html(body)
+        if cache_state == "MISS":
+            await ai_cache.aset(key, body)
+
+    resp = JsonResponse(body, status=status_code, safe=False)
+    resp["X-AI-Cache"] = cache_state
+    resp["X-AI-Queue-Depth"] = str(ai_limits.limiter().queue_depth)
+    return _with_cors(resp)
+
+
+def _overloaded(e):
+    resp = JsonResponse(
+        {"detail": "Слишком много AI-запросов, повторите позже", "reason": e.reason, "queue_depth": e.queue_depth},
+        status=429,
+    )
+    resp["Retry-After"] = str(e.retry_after)
+    resp["X-AI-Queue-Depth"] = str(e.queue_depth)
+    return _with_cors(resp)
+
+
+@csrf_exempt
+async def ai_proxy(request):
+    """
+    Обычный (нестримовый) AI-эндпоинт:
+    - принимает {mode, prompt, html, selection}
+    - нормализует в {messages: [...], temperature, top_p, max_tokens, stream:false}
+    - вызывает провайдера через общий пул соединений (docs.ai_client)
+    - возвращает JSON провайдера как есть (если не JSON — вернём {"text": "..."})
+      плюс "html" — ответ, отрендеренный в безопасный HTML (docs/rendering.py).
+
+    Если тебе НУЖЕН стрим, используй /api/ai/stream/ (другая вью).
+    """
+    return await _preflight(request, _ai_proxy)
+
+
+async def _provider_events(provider, payload):
+    """
+    Читает SSE провайдера и отдаёт пары (event, data). Если клиент отключился,
+    ASGI-обработчик отменяет итерацию — выход из async with закрывает запрос к провайдеру.
+    """
+    client = ai_client.get_client()
+    try:
+        async with client.stream(
+            "POST", provider.url, json=provider.prepare(payload, stream=True), headers=provider.headers,
+            timeout=ai_client.stream_timeout(),
+        ) as r:
+            if r.status_code >= 400:
+                body = (await r.aread()).decode("utf-8", errors="replace")
+                yield "error", f"HTTP {r.status_code}: {body[:500]}"
+                return
+            async for line in r.aiter_lines():
+                if not line:
                     continue
-                line = raw.decode("utf-8")
                 if not line.startswith("data:"):
                     line = "data: " + line
                 data_str = line[5:].strip()
@@ -307,16 +853,214 @@ def ai_proxy_stream(request):
                     choice = (j.get("choices") or [{}])[0]
                     delta = choice.get("delta") or {}
                     if delta.get("reasoning_content"):
-                        yield sse_emit("reasoning", delta["reasoning_content"])
+                        yield "reasoning", delta["reasoning_content"]
                     if delta.get("content"):
-                        yield sse_emit("content", delta["content"])
+                        yield "content", delta["content"]
                 except Exception:
-                    yield sse_emit("content", data_str)
-        yield b"event: done\ndata: [DONE]\n\n"
+                    yield "content", data_str
+    except httpx.HTTPError as e:
+        yield "error", str(e) or type(e).__name__
+
+
+async def _open_stream(provider, payload):
+    """Стрим провайдера, открытый до первого события; ошибка до него — ProviderError."""
+    events = _provider_events(provider, payload)
+    try:
+        first = await events.__anext__()
+    except StopAsyncIteration:
+        return events, None
+    except BaseException:
+        await events.aclose()
+        raise
+    if first[0] == "error":
+        await events.aclose()
+        raise ai_providers.ProviderError(first[1])
+    return events, first
+
+
+async def upstream_events(payload, mode=""):
+    """
+    События генерации через реестр провайдеров (docs/ai_providers.py):
+    медленный первый байт — хедж на следующего, ошибка — failover.
+    Время до первого байта, байты и токены идут в метрики (docs/metrics.py).
+    """
+    call = metrics.AiCall("stream", mode)
+    try:
+        provider, (events, first) = await ai_providers.hedged(
+            "stream", lambda provider: _open_stream(provider, payload),
+            release=lambda result: result[0].aclose(),
+        )
+    except (ai_providers.NoProviders, ai_providers.ProviderError) as e:
+        call.finish(None, "error")
+        yield "error", str(e)
+        return
+    outcome = "cancelled"
+    try:
+        if first is not None:
+            call.chunk(first[1])
+            yield first
+        async for event, data in events:
+            if event == "error":
+                outcome = "error"
+                # обрыв посреди стрима переключить уже нельзя, но breaker его учтёт
+                options = ai_providers.conf()
+                ai_providers.health(provider.name, options).record(False, None, options, data)
+            else:
+                call.chunk(data)
+            yield event, data
+        if outcome != "error":
+            outcome = "ok"
+    finally:
+        call.finish(provider.name, outcome)
+        await events.aclose()
+
+
+async def rendered_events(events):
+    """
+    Добавляет к событиям "html": HTML очередного блока ответа (абзаца,
+    списка, ```mermaid и т.п.), как только блок дописан. Фрагменты идут
+    подряд — клиент их просто склеивает.
+    """
+    renderer = rendering.BlockRenderer()
+    failed = False
+    async for event, data in events:
+        yield event, data
+        if event == "content":
+            for fragment in renderer.feed(data):
+                yield "html", fragment
+        elif event == "error":
+            failed = True
+    if not failed:
+        for fragment in renderer.finish():
+            yield "html", fragment
+
+
+async def recorded_events(payload, cache_key=None, mode=""):
+    """События провайдера (с HTML блоков); при успешном завершении генерация кладётся в кэш."""
+    recorded = [] if cache_key else None
+    failed = False
+    async for event, data in rendered_events(upstream_events(payload, mode)):
+        if event == "error":
+            failed = True
+        elif recorded is not None:
+            # соседние события одного типа склеиваем — так компактнее в кэше
+            if recorded and recorded[-1][0] == event:
+                recorded[-1][1] += data
+            else:
+                recorded.append([event, data])
+        yield event, data
+    if recorded is not None and not failed:
+        await ai_cache.aset(cache_key, {"events": recorded})
 
-    resp = StreamingHttpResponse(stream(), content_type="text/event-stream")
+
+async def cached_events(events, chunk_size=1024):
+    """Сохранённая генерация как источник событий для ai_stream — кусками, как дельты провайдера."""
+    for event, data in events:
+        for i in range(0, len(data), chunk_size):
+            yield event, data[i:i + chunk_size]
+
+
+def _sse_response(body, generation=None):
+    resp = StreamingHttpResponse(body, content_type="text/event-stream")
     resp["Cache-Control"] = "no-cache"
     resp["X-Accel-Buffering"] = "no"
-    for k, v in cors.items():
-        resp[k] = v
-    return resp
\ No newline at end of file
+    if generation is not None:
+        resp["X-AI-Generation"] = generation.id
+    resp["X-AI-Queue-Depth"] = str(ai_limits.limiter().queue_depth)
+    return _with_cors(resp)
+
+
+async def _ai_proxy_stream(request, user, data):
+    # переподключение: дочитываем генерацию после кадра Last-Event-ID
+    last_event_id = request.headers.get("Last-Event-ID") or data.get("last_event_id")
+    if last_event_id:
+        try:
+            generation, after = ai_stream.resume(user.pk, last_event_id)
+        except ai_stream.ResumeError as e:
+            return _with_cors(JsonResponse({"detail": str(e)}, status=410))
+        return _sse_response(generation.subscribe(after), generation)
+
+    mode = data.get("mode", "generate")
+    html, version_key = await _document_html(user, data)
+    payload = build_stream_payload(
+        mode,
+        data.get("prompt", "") or "",
+        html,
+        data.get("selection", "") or "",
+        data.get("context") or "",
+        version_key=version_key,
+    )
+
+    # попадание в кэш идёт через ту же генерацию, что и живой стрим: те же id
+    # кадров, преамбула и X-AI-Generation, дочитывание по Last-Event-ID
+    key = ai_cache.cache_key("stream", payload)
+    use_cache = ai_cache.enabled_for(mode, request, data)
+    cached = await ai_cache.aget(key) if use_cache else None
+    if cached is not None:
+        generation = await ai_stream.start(key, user.pk, lambda: cached_events(cached["events"]), limited=False)
+        return _sse_response(generation.subscribe(), generation)
+
+    # одинаковые одновременные стримы подписываются на одну генерацию
+    try:
+        generation = await ai_stream.start(
+            key, user.pk, lambda: recorded_events(payload, key if use_cache else None, mode)
+        )
+    except ai_limits.Overloaded as e:
+        return _overloaded(e)
+    return _sse_response(generation.subscribe(), generation)
+
+
+@csrf_exempt
+async def ai_proxy_stream(request):
+    """
+    Стримовый SSE-эндпоинт (docs/ai_stream.py); полноценно стримит только под ASGI.
+    Повтор запроса с заголовком Last-Event-ID дочитывает прерванную генерацию.
+    Кроме дельт content идут события html — HTML каждого дописанного блока ответа.
+    """
+    return await _preflight(request, _ai_proxy_stream)
+
+
+async def _job_events(job_id, offset, poll):
+    """SSE прогресса задачи: новый текст (id — смещение), затем статус и done."""
+    qs = GenerationJob.objects.filter(pk=job_id)
+    heartbeat = ai_stream.conf()["HEARTBEAT"]
+    idle = 0.0
+    yield b"retry: 2000\n\n"
+    while True:
+        row = await qs.annotate(tail=Substr("result_text", offset + 1)).values("status", "tail", "error").afirst()
+        if row is None:
+            return
+        if row["tail"]:
+            offset += len(row["tail"])
+            idle = 0.0
+            yield sse_frame("content", row["tail"], str(offset))
+        if row["status"] in (GenerationJob.SUCCEEDED, GenerationJob.FAILED, GenerationJob.CANCELLED):
+            yield sse_frame("status", json.dumps({"status": row["status"], "error": row["error"]}, ensure_ascii=False))
+            yield sse_frame("done", "[DONE]")
+            return
+        await asyncio.sleep(poll)
+        idle += poll
+        if idle >= heartbeat:
+            idle = 0.0
+            yield b": ping\n\n"
+
+
+@csrf_exempt
+async def ai_job_stream(request, job_id):
+    """
+    Прогресс фоновой генерации в SSE (GET). Работает и с воркерами в другом
+    процессе: текст читается из БД. Last-Event-ID — смещение уже полученного текста.
+    """
+    if request.method == "OPTIONS":
+        return _with_cors(HttpResponse(status=204))
+    user = await _authenticate(request)
+    if user is None:
+        return _with_cors(JsonResponse({"detail": "Authentication credentials were not provided."}, status=401))
+    if not await GenerationJob.objects.filter(pk=job_id, owner=user).aexists():
+        return _with_cors(JsonResponse({"detail": "Not found."}, status=404))
+    try:
+        offset = max(0, int(request.headers.get("Last-Event-ID") or 0))
+    except ValueError:
+        offset = 0
+    poll = jobs.conf()["FLUSH_INTERVAL"]
+    return _sse_response(_job_events(job_id, offset, poll))
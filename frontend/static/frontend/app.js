@@ -389,7 +389,8 @@ async function renderMermaid(root = document) {
 
     const pre = code.parentElement;
     const raw = code.textContent || "";
-    const graph = sanitizeMermaid(raw);
+    // блоки, починенные сервером, повторно не чистим
+    const graph = code.dataset.normalized ? raw : sanitizeMermaid(raw);
     const id = "mmd-" + (++idx);
 
     try {
@@ -514,12 +515,16 @@ function insertAIAsHTML() {
 }
 
 /* ---------- Docs ---------- */
-async function loadDocs() {
-  const r = await apiFetch(BASE + "/documents/");
-  const docs = await r.json();
+// next — URL следующей страницы курсорной пагинации: дописываем к списку, иначе грузим заново
+async function loadDocs(next) {
   const list = $("docsList");
   if (!list) return;
-  list.innerHTML = "";
+  const r = await apiFetch(next || BASE + "/documents/");
+  const data = await r.json();
+  // список отдаёт только сводку, HTML грузим при открытии
+  const docs = Array.isArray(data) ? data : data.results || [];
+  if (next) list.querySelector(".more")?.remove();
+  else list.innerHTML = "";
   docs.forEach((doc) => {
     const a = document.createElement("a");
     a.className = "item";
@@ -527,10 +532,22 @@ async function loadDocs() {
     a.href = getDocURL(doc.id);
     a.onclick = (e) => {
       e.preventDefault();
-      openDoc(doc);
+      openDocById(doc.id);
     };
     list.appendChild(a);
   });
+  if (data.next) {
+    const more = document.createElement("button");
+    more.className = "btn more";
+    more.textContent = "Ещё документы";
+    more.onclick = () => {
+      more.disabled = true;
+      // next абсолютный (схема/хост глазами сервера) — берём путь, как и у остальных запросов
+      const url = new URL(data.next, location.href);
+      loadDocs(url.pathname + url.search).catch(() => (more.disabled = false));
+    };
+    list.appendChild(more);
+  }
 }
 function openDoc(doc) {
   currentDoc = doc;
@@ -549,17 +566,67 @@ async function newDoc() {
   openDoc(doc);
   loadDocs();
 }
-async function saveDoc() {
-  if (!currentDoc) return;
-  const title = $("docName").value || "Без названия";
-  const html = $("editor").innerHTML;
+// Одна операция replace между сохранённым и текущим HTML (общий префикс/суффикс).
+// Индексы — единицы UTF-16, как их считает сервер (docs/patching.py).
+function diffOps(base, html) {
+  if (base === html) return [];
+  const max = Math.min(base.length, html.length);
+  let start = 0;
+  while (start < max && base.charCodeAt(start) === html.charCodeAt(start)) start++;
+  // не режем суррогатную пару
+  if (start > 0 && (base.charCodeAt(start - 1) & 0xfc00) === 0xd800) start--;
+  let end = 0;
+  while (
+    end < max - start &&
+    base.charCodeAt(base.length - 1 - end) === html.charCodeAt(html.length - 1 - end)
+  ) end++;
+  if (end > 0 && (base.charCodeAt(base.length - end) & 0xfc00) === 0xdc00) end--;
+  return [{
+    op: "replace",
+    start,
+    end: base.length - end,
+    text: html.slice(start, html.length - end),
+  }];
+}
+async function saveDocFull(title, html) {
   const r = await apiFetch(`${BASE}/documents/${currentDoc.id}/`, {
     method: "PATCH",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ title, content_html: html }),
   });
-  const doc = await r.json();
-  openDoc(doc);
+  return r.ok ? r.json() : null;
+}
+async function saveDoc() {
+  if (!currentDoc) return;
+  // база для diffOps — весь документ: ждём догрузки блоков
+  if (currentDoc.loading) await currentDoc.loading;
+  if (!currentDoc) return;
+  const title = $("docName").value || "Без названия";
+  const html = $("editor").innerHTML;
+  let saved = null;
+  if (currentDoc.revision == null) {
+    saved = await saveDocFull(title, html);
+  } else {
+    // отправляем только изменения относительно последней сохранённой ревизии
+    const ops = diffOps(currentDoc.content_html || "", html);
+    if (!ops.length && title === currentDoc.title) return;
+    if (!ops.length) ops.push({ op: "insert", at: 0, text: "" });
+    const r = await apiFetch(`${BASE}/documents/${currentDoc.id}/content/`, {
+      method: "PATCH",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ base_revision: currentDoc.revision, title, ops }),
+    });
+    if (r.status === 409) {
+      if (!confirm("Документ изменён в другой вкладке. Перезаписать своей версией?")) {
+        return openDocById(currentDoc.id);
+      }
+      saved = await saveDocFull(title, html);
+    } else if (r.ok) {
+      saved = await r.json();
+    }
+  }
+  if (!saved) return;
+  currentDoc = { ...currentDoc, title, content_html: html, revision: saved.revision };
   loadDocs();
 }
 async function deleteDoc() {
@@ -595,7 +662,14 @@ function makeLink() {
 }
 
 /* ---------- AI (simple) ---------- */
+let __aiBusy = false;
 async function runAI() {
+  // повторный клик, пока идёт генерация, не шлёт второй запрос
+  if (__aiBusy) return;
+  __aiBusy = true;
+  try { await runAIOnce(); } finally { __aiBusy = false; }
+}
+async function runAIOnce() {
   const prompt = $("prompt").value.trim();
   const content = $("editor").innerHTML;
   const out = $("aiOutput"),
@@ -607,10 +681,16 @@ async function runAI() {
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ mode: "generate", prompt, html: content }),
   });
+  if (resp.status === 429) {
+    const wait = resp.headers.get("Retry-After") || "несколько";
+    out.textContent = `⚠️ Сервер AI перегружен, попробуйте через ${wait} с`;
+    return;
+  }
   const data = await resp.json();
   const text = pickContent(data) || "";
   out.textContent = text || "⚠️ Нет ответа";
-  const html = md(text);
+  // сервер присылает уже безопасный HTML (docs/rendering.py); md() — запасной путь
+  const html = (Array.isArray(data) ? data[0] : data)?.html || md(text);
   if (prev) prev.innerHTML = html;
   insertHTMLAtCursor(html);
   renderVisualBlocks($("editor"));
@@ -846,14 +926,46 @@ function getDocURL(id) {
   url.hash = `doc=${id}`;
   return url.toString();
 }
+async function fetchBlocks(id, start) {
+  const r = await apiFetch(`${BASE}/documents/${id}/blocks/?start=${start}`);
+  return r.ok ? r.json() : null;
+}
+async function fetchFullDoc(id) {
+  const r = await apiFetch(`${BASE}/documents/${id}/`);
+  return r.ok ? r.json() : null;
+}
+// Документ открывается первой порцией блоков (docs/blocks.py), остальное
+// догружается в фоне и дописывается в конец редактора.
 async function openDocById(id) {
   try {
-    const r = await apiFetch(`${BASE}/documents/${id}/`);
+    const r = await apiFetch(`${BASE}/documents/${id}/?content=0`);
     if (!r.ok) return;
     const doc = await r.json();
+    const page = await fetchBlocks(id, 0);
+    if (!page) return;
+    doc.content_html = page.blocks.map((b) => b.html).join("");
     openDoc(doc);
+    if (page.next != null) doc.loading = loadRestBlocks(doc, page);
   } catch {}
 }
+async function loadRestBlocks(doc, page) {
+  let html = doc.content_html;
+  while (page.next != null) {
+    page = await fetchBlocks(doc.id, page.next);
+    if (!page || page.revision !== doc.revision) {
+      // документ сохранили, пока догружали, — берём целиком
+      const full = await fetchFullDoc(doc.id);
+      if (full && currentDoc === doc) openDoc(full);
+      return;
+    }
+    const part = page.blocks.map((b) => b.html).join("");
+    html += part;
+    if (currentDoc === doc) $("editor").insertAdjacentHTML("beforeend", part);
+  }
+  doc.content_html = html;
+  doc.loading = null;
+  if (currentDoc === doc) renderVisualBlocks($("editor"));
+}
 function applyDocHash() {
   const m = location.hash.match(/doc=([\w-]+)/);
   if (m && token) {
@@ -892,6 +1004,8 @@ document.addEventListener("DOMContentLoaded", async () => {
 });
 
 function logout(){
+  // отзываем access-токен на сервере (кэш аутентификации), ответ не ждём
+  if (token) fetch(BASE + "/auth/logout/", { method: "POST", headers: { "Authorization": "Bearer " + token } }).catch(()=>{});
   clearTokens();
   currentDoc = null;
   $("docName").value = "";
@@ -13,4 +13,24 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'minidocs.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from docs import ai_client, assets  # noqa: E402  (после инициализации Django)
+
+# статика из STATIC_ROOT — до Django, сжатые варианты и immutable-кэш (docs/assets.py)
+http_application = assets.StaticFiles(django_application)
+
+
+async def application(scope, receive, send):
+    # lifespan: на shutdown закрываем общий пул соединений к AI-провайдеру
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await ai_client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    else:
+        await http_application(scope, receive, send)
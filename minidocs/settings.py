@@ -15,6 +15,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "docs.metrics.MetricsMiddleware",  # первым: латентность всей цепочки, /metrics
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -40,6 +41,7 @@ TEMPLATES = [{
 }]
 
 WSGI_APPLICATION = "minidocs.wsgi.application"
+ASGI_APPLICATION = "minidocs.asgi.application"  # AI-эндпоинты асинхронные, стрим — только под ASGI
 
 DATABASES = {
     "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"}
@@ -60,10 +62,23 @@ STATIC_URL = "/static/"
 # ]
 
 STATIC_ROOT = BASE_DIR / "staticfiles"  # сюда соберётся collectstatic
+
+# Сборка статики (docs/assets.py): collectstatic пишет копии с хэшем в имени,
+# минифицирует их и кладёт рядом .gz (и .br при установленном brotli)
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "docs.assets.CompressedManifestStorage"},
+}
+# Отдача из STATIC_ROOT до Django (minidocs/asgi.py, wsgi.py); SERVE None — когда DEBUG выключен
+STATIC_ASSETS = {
+    "SERVE": None,
+    "MINIFY": ["frontend/"],
+}
+
 # DRF + JWT
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "docs.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
 }
@@ -73,6 +88,10 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=30),
 }
 
+# Кэш проверенных JWT (docs/authentication.py): без подписи и SELECT пользователя на повторных запросах.
+# STATELESS_READS — GET-запросы без чтения пользователя из БД (только при коротком ACCESS_TOKEN_LIFETIME)
+AUTH_CACHE = {"TTL": 60, "MAX_ENTRIES": 10000, "STATELESS_READS": False}
+
 # CORS/CSRF (dev)
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_HEADERS = ["content-type", "authorization"]
@@ -88,4 +107,131 @@ CSRF_TRUSTED_ORIGINS = [
 AI_PROVIDER_URL = os.getenv(
     "AI_PROVIDER_URL",
     "https://isadani.app.n8n.cloud/webhook/3fef88a0-8eae-4c40-bf3e-9737f2f44684",
-)
\ No newline at end of file
+)
+
+# Реестр провайдеров (docs/ai_providers.py): веса, хеджирование, failover, circuit breaker.
+# kinds: "call" — нестримовый /api/ai/, "stream" — SSE; вес 0 — только запасной.
+# format: "chat" — OpenAI chat completions (по умолчанию), "messages" — вебхук n8n (только messages).
+AI_PROVIDERS = [
+    {"name": "n8n", "url": AI_PROVIDER_URL, "weight": 1, "kinds": ["stream"], "format": "messages"},
+    {
+        "name": "hf-router",
+        "url": os.getenv("AI_CHAT_URL", "https://router.huggingface.co/v1/chat/completions"),
+        "weight": 1,
+        "kinds": ["call"],
+    },
+]
+AI_ROUTING = {
+    "HEDGE": True,
+    "HEDGE_DELAY": 2.0,        # c до первого байта, пока нет замеров p95
+    "HEDGE_PERCENTILE": 95,
+    "HEDGE_MIN_DELAY": 0.2,
+    "HEDGE_MAX_DELAY": 10.0,
+    "MAX_ATTEMPTS": 3,
+    "WINDOW": 50,
+    "MIN_CALLS": 10,
+    "ERROR_RATE": 0.5,
+    "SLOW_CALL": 10.0,
+    "SLOW_RATE": 0.8,
+    "COOLDOWN": 30,
+}
+
+# Общий пул соединений к провайдеру (docs/ai_client.py), секунды
+AI_TIMEOUTS = {"connect": 5, "read": 120, "stream_read": 60, "write": 10, "pool": 10}
+AI_POOL_LIMITS = {"max_connections": 200, "max_keepalive_connections": 50, "keepalive_expiry": 30}
+
+# Лимиты параллельных вызовов провайдера (docs/ai_limits.py): сверх GLOBAL или PER_USER — ожидание
+# в общей очереди; при её переполнении или через QUEUE_TIMEOUT — 429
+AI_CONCURRENCY = {"GLOBAL": 64, "PER_USER": 4, "MAX_QUEUE": 128, "QUEUE_TIMEOUT": 30, "RETRY_AFTER": 5}
+
+# SSE-стримы (docs/ai_stream.py): склейка дельт в кадры, буфер для Last-Event-ID, heartbeat
+AI_STREAM = {
+    "FRAME_WINDOW": 0.05,
+    "FRAME_MAX_CHARS": 1024,
+    "BUFFER_FRAMES": 2048,
+    "HEARTBEAT": 15,
+    "RESUME_GRACE": 30,
+    "RESUME_TTL": 300,
+}
+
+# Кэш повторных AI-запросов (docs/ai_cache.py); None — выключен.
+# Обход на запрос: {"cache": false} в теле или заголовок Cache-Control: no-cache
+AI_CACHE = None
+# AI_CACHE = {
+#     "BACKEND": "docs.ai_cache.LocMemBackend",  # FileBackend / DjangoCacheBackend
+#     "TTL": 3600,
+#     "MODES": ["outline", "rewrite"],
+#     "OPTIONS": {"max_entries": 500, "max_bytes": 50 * 1024 * 1024},
+# }
+
+# Фоновые AI-генерации (docs/jobs.py); отдельный воркер: python manage.py run_ai_jobs
+AI_JOBS = {
+    "WORKERS": 4,
+    "EMBEDDED": True,   # пул в веб-процессе; False — задачи выполняет только run_ai_jobs
+    "MAX_ATTEMPTS": 3,
+    "BACKOFF": 2.0,
+    "BACKOFF_MAX": 60,
+    "POLL_INTERVAL": 1.0,
+    "FLUSH_INTERVAL": 0.5,
+    "HEARTBEAT": 15,    # c, продление аренды, пока провайдер молчит
+    "LEASE": 120,
+}
+
+# Метрики Prometheus на /metrics (docs/metrics.py, только staff).
+# SLOW_REQUEST — порог в секундах: такие запросы сохраняются профилем cProfile в PROFILE_DIR
+METRICS = {
+    "ENABLED": True,
+    "SLOW_REQUEST": None,
+    "PROFILE_RATE": 1.0,
+    "PROFILE_DIR": BASE_DIR / "profiles",
+    "PROFILE_KEEP": 50,
+}
+
+# Бюджет контекста документа в промпте, токены (docs/ai_context.py)
+AI_CONTEXT_TOKENS = 1500
+
+# Рендер ответов модели в HTML (docs/rendering.py): блоков в кэше по хэшу содержимого
+AI_RENDER_CACHE_SIZE = 1024
+
+# Хранилище версий: ключевой кадр + дельты к нему
+DOCS_VERSION_KEYFRAME_INTERVAL = 32   # дельт на один кадр
+DOCS_VERSION_DELTA_MAX_RATIO = 0.5    # дельта тяжелее этой доли снимка → пишем снимок
+DOCS_VERSION_COALESCE_SECONDS = 120   # автосохранения в этом окне заменяют последнюю версию; 0 — не склеивать
+DOCS_VERSION_DIFF_CACHE_SIZE = 256    # сравнений версий в памяти процесса (docs/diffing.py)
+
+# Блочное хранение больших документов (docs/blocks.py): от THRESHOLD символов
+# содержимое — блоками по разделам/страницам, сохранение переписывает только
+# изменившиеся; GET documents/{id}/blocks/ — по PAGE_SIZE блоков. None — выключено
+DOCS_BLOCKS = {
+    "THRESHOLD": 256 * 1024,
+    "BLOCK_SIZE": 16 * 1024,
+    "PAGE_SIZE": 20,
+}
+
+# Отложенная запись автосохранений (docs/autosave.py): правки копятся в памяти
+# и журнале, в БД — последнее состояние, когда документ затих на IDLE секунд
+# (не позже MAX_DELAY). Только для одного процесса веб-сервера
+AUTOSAVE = {
+    "ENABLED": False,
+    "JOURNAL": BASE_DIR / "autosave.journal",  # None — только память
+    "FSYNC": False,
+    "IDLE": 1.0,
+    "MAX_DELAY": 5.0,
+    "BATCH_SIZE": 50,
+}
+
+# Хранение версий (docs/retention.py, python manage.py compact_versions):
+# всё за KEEP_ALL, по версии в час за HOURLY, по версии в день за DAILY (секунды;
+# None — без ограничения), ручные снимки — всегда. INTERVAL — периодическое
+# сжатие в процессе веб-сервера; 0 — только командой
+DOCS_VERSION_RETENTION = {
+    "KEEP_ALL": 3600,
+    "HOURLY": 24 * 3600,
+    "DAILY": 30 * 24 * 3600,
+    "BATCH_SIZE": 200,
+    "PAUSE": 0.05,
+    "INTERVAL": 3600,
+}
+
+# Массовый импорт (docs/importing.py): предельный размер одного документа
+DOCS_IMPORT_MAX_BYTES = 5 * 1024 * 1024
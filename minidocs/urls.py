@@ -3,6 +3,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from docs.views import LogoutView, MetricsView
 from frontend.views import IndexView
 from django.views.static import serve
 
@@ -10,7 +11,9 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/auth/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/auth/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("api/auth/logout/", LogoutView.as_view(), name="token_logout"),
     path("api/", include("docs.urls")),
+    path("metrics", MetricsView.as_view(), name="metrics"),  # Prometheus, только staff
     path("", IndexView.as_view(), name="index"),  # фронт
 ]
 
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'minidocs.settings')
 
 application = get_wsgi_application()
+
+from docs.assets import StaticFilesWSGI  # noqa: E402  (после инициализации Django)
+
+# статика из STATIC_ROOT — до Django, тело через wsgi.file_wrapper (docs/assets.py)
+application = StaticFilesWSGI(application)